@@ -0,0 +1,262 @@
+"""
+Loads a range of sales into a compact, column oriented snapshot, and breaks it down by hour, product and band.
+
+Every column of the snapshot is a typed array holding one machine value per sale. Product and band names are
+dictionary encoded, so each sale stores a small integer code and each name is stored once. A grouped total is
+one pass over a code column, done by numpy.bincount when NumPy is installed. Refreshing only reads the sales
+with an id above the last one loaded.
+
+Usage:
+    python analytics.py [--db StockSales.db] [--start 2024-06-01] [--end 2024-06-30] [--top 10]
+"""
+import argparse
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List
+from database import database, day_bounds
+
+try:
+    import numpy
+except ImportError:
+    # The snapshot works the same without NumPy, summing its columns in Python instead
+    numpy = None
+
+
+class salesSnapshot:
+    """
+    This class holds the sales for a range of days as columns, and answers the totals screen's breakdowns from them.
+
+    It reads the hot sales table, so days already moved into archive files are not included.
+    Starting stock is the stock left plus the units sold in the snapshot, as restocks are not recorded.
+
+    Attributes:
+        db (database): the database read from, whose reader connection belongs to the thread using the snapshot
+        start (date): the first day covered
+        end (date): the last day covered
+        last_id (int): the highest sale id loaded
+        ids (array): the id of each sale
+        products (array): the product code of each sale
+        hours (array): the hour of each sale, counted from midnight UTC at the start of the first day
+        units (array): the quantity of each sale
+        gross (array): the price times quantity of each sale
+        product_ids (dict): the code given to each product
+            Key: stockItems id
+            Value: product code
+        names (list): the name of each product code
+        bands (array): the band code of each product code
+        band_ids (dict): the code given to each band
+            Key: bands id
+            Value: band code
+        band_names (list): the name of each band code
+        stock (array): the stock left of each product code, when the snapshot was last refreshed
+
+    Methods:
+        __init__: Initializes the salesSnapshot class and loads the range
+        reload: Loads the whole range again
+        refresh: Appends the sales recorded since the last load, or reloads if earlier sales have changed
+        by_hour: Totals the units and gross for each hour that sold
+        by_product: Totals the units, gross and sell-through for each product
+        by_band: Totals the units, gross and sell-through for each band
+        nbytes: Returns the memory held by the columns
+    """
+
+    def __init__(self, db: database, start: date = None, end: date = None) -> None:
+        """
+        Initializes the salesSnapshot class
+
+            Parameters:
+                db (database): the database to read
+                start (date): the first day to include, defaulting to today
+                end (date): the last day to include, defaulting to start
+        """
+        self.db = db
+        self.start = date.fromisoformat(day_bounds(start)[0])
+        self.end = self.start if end is None else end
+        self.reload()
+
+
+    def reload(self) -> None:
+        """Discards every column, and loads the whole range"""
+        self.last_id: int = 0
+        self.ids = array("q")
+        self.products = array("i")
+        self.hours = array("i")
+        self.units = array("i")
+        self.gross = array("d")
+        self.product_ids: Dict = {}
+        self.names: List = []
+        self.bands = array("i")
+        self.band_ids: Dict = {}
+        self.band_names: List = []
+        self.stock = array("q")
+        self._load()
+
+
+    def refresh(self) -> int:
+        """
+        Appends the sales with an id above last_id, and reads each product's name, band and stock again
+
+        Voids, deleted products and archiving remove sales the snapshot already holds, which shows up as
+        a different number of sales up to last_id, and the whole range is then loaded again.
+
+            Returns:
+                count (int): the number of sales appended, or loaded by a reload
+        """
+        bounds = self._bounds()
+        count: int = self.db.reader.execute("""SELECT COUNT(*) FROM sales WHERE timestamp >= ? AND timestamp < ? AND id <= ?""", (*bounds, self.last_id)).fetchone()[0]
+        if count != len(self.ids):
+            self.reload()
+            return len(self.ids)
+        return self._load()
+
+
+    def _bounds(self) -> tuple:
+        """Returns the [start, end) timestamps covered by the snapshot"""
+        return day_bounds(self.start)[0], day_bounds(self.end)[1]
+
+
+    def _load(self) -> int:
+        """Appends the sales in range with an id above last_id to the columns, and returns how many there were"""
+        epoch: int = int(datetime.combine(self.start, time(), timezone.utc).timestamp())
+        cursor = self.db.reader.cursor()
+        # The first load seeks the timestamp index, and later ones the primary key, reading only the newest sales
+        order: str = "+timestamp" if self.last_id else "timestamp"
+        cursor.execute(f"""SELECT id, stockItemID, (CAST(strftime('%s', timestamp) AS INTEGER) - ?) / 3600, quantity, price * quantity
+                        FROM sales WHERE {order} >= ? AND {order} < ? AND id > ?""", (epoch, *self._bounds(), self.last_id))
+        count: int = 0
+        while True:
+            rows: List = cursor.fetchmany(10000)
+            if not rows:
+                break
+            ids, products, hours, units, gross = zip(*rows)
+            self.ids.extend(ids)
+            self.products.extend(self._code(product) for product in products)
+            self.hours.extend(hours)
+            self.units.extend(units)
+            self.gross.extend(gross)
+            count += len(rows)
+        cursor.close()
+        if count:
+            self.last_id = max(self.last_id, max(self.ids[-count:]))
+        self._read_products()
+        return count
+
+
+    def _code(self, product: int) -> int:
+        """Returns the code for a product id, giving it the next code if it has not been seen"""
+        code = self.product_ids.get(product)
+        if code is None:
+            code = self.product_ids[product] = len(self.names)
+            self.names.append(None)
+            self.bands.append(0)
+            self.stock.append(0)
+        return code
+
+
+    def _read_products(self) -> None:
+        """Reads the current name, band and stock of every product in the snapshot"""
+        ids: List = list(self.product_ids)
+        for chunk in range(0, len(ids), 500):
+            placeholders: str = ",".join("?" * len(ids[chunk:chunk + 500]))
+            for id, name, band_id, band, quantity in self.db.reader.execute(f"""SELECT stockItems.id, stockItems.name, stockItems.bandID, bands.name, stockItems.quantity
+                                                                              FROM stockItems JOIN bands ON bands.id = stockItems.bandID
+                                                                              WHERE stockItems.id IN ({placeholders})""", ids[chunk:chunk + 500]):
+                code: int = self.product_ids[id]
+                if band_id not in self.band_ids:
+                    self.band_ids[band_id] = len(self.band_names)
+                    self.band_names.append(band)
+                self.band_names[self.band_ids[band_id]] = band
+                self.names[code] = name
+                self.bands[code] = self.band_ids[band_id]
+                self.stock[code] = quantity
+
+
+    def _sums(self, keys: array, size: int, values: array) -> List:
+        """Returns the total of values for each key from 0 to size - 1"""
+        if numpy is not None and len(keys):
+            return numpy.bincount(numpy.frombuffer(keys, dtype=keys.typecode), numpy.frombuffer(values, dtype=values.typecode), size).tolist()
+        totals: List = [0] * size
+        for key, value in zip(keys, values):
+            totals[key] += value
+        return totals
+
+
+    def by_hour(self) -> List:
+        """
+        Totals the sales in each hour
+
+            Returns:
+                hours (list): an (hour, units, gross) tuple for each hour with sales, in time order, where hour is a UTC datetime
+        """
+        size: int = max(self.hours) + 1 if self.hours else 0
+        units: List = self._sums(self.hours, size, self.units)
+        gross: List = self._sums(self.hours, size, self.gross)
+        midnight = datetime.combine(self.start, time(), timezone.utc)
+        return [(midnight + timedelta(hours=hour), int(units[hour]), gross[hour]) for hour in range(size) if units[hour]]
+
+
+    def by_product(self) -> List:
+        """
+        Totals the sales of each product
+
+            Returns:
+                products (list): a (name, band, units, gross, sell-through) tuple per product, highest gross first,
+                where sell-through is the share of the starting stock that has sold
+        """
+        units: List = self._sums(self.products, len(self.names), self.units)
+        gross: List = self._sums(self.products, len(self.names), self.gross)
+        products: List = [(self.names[code], self.band_names[self.bands[code]], int(units[code]), gross[code], self._sell_through(units[code], self.stock[code]))
+                          for code in range(len(self.names)) if self.names[code] is not None]
+        return sorted(products, key=lambda product: (-product[3], product[0]))
+
+
+    def by_band(self) -> List:
+        """
+        Totals the sales of each band, from the totals of its products
+
+            Returns:
+                bands (list): a (band, units, gross, sell-through) tuple per band, highest gross first
+        """
+        units: List = self._sums(self.products, len(self.names), self.units)
+        gross: List = self._sums(self.products, len(self.names), self.gross)
+        size: int = len(self.band_names)
+        band_units: List = self._sums(self.bands, size, array("d", units))
+        band_gross: List = self._sums(self.bands, size, array("d", gross))
+        band_stock: List = self._sums(self.bands, size, array("d", self.stock))
+        bands: List = [(self.band_names[code], int(band_units[code]), band_gross[code], self._sell_through(band_units[code], band_stock[code]))
+                       for code in range(len(self.band_names)) if band_units[code]]
+        return sorted(bands, key=lambda band: (-band[2], band[0]))
+
+
+    def _sell_through(self, sold: float, left: int) -> float:
+        """Returns the share of the starting stock that has sold"""
+        return sold / (sold + left) if sold + left > 0 else 0.0
+
+
+    def nbytes(self) -> int:
+        """Returns the number of bytes held by the columns"""
+        return sum(column.itemsize * len(column) for column in (self.ids, self.products, self.hours, self.units, self.gross, self.bands, self.stock))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Break a range of sales down by hour, band and product")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to read")
+    parser.add_argument("--start", type=date.fromisoformat, help="the first day, defaulting to today")
+    parser.add_argument("--end", type=date.fromisoformat, help="the last day, defaulting to the first")
+    parser.add_argument("--top", type=int, default=10, help="the number of products listed")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    db.create_tables()
+    snapshot = salesSnapshot(db, arguments.start, arguments.end)
+    print(f"Loaded {len(snapshot.ids)} sales into {snapshot.nbytes()} bytes")
+    for hour, units, gross in snapshot.by_hour():
+        print(f"{hour:%Y-%m-%d %H:00} {units:8} {gross:12.2f}")
+    for band, units, gross, sell_through in snapshot.by_band():
+        print(f"{band:30} {units:8} {gross:12.2f} {sell_through:7.1%}")
+    for name, band, units, gross, sell_through in snapshot.by_product()[:arguments.top]:
+        print(f"{name:30} {band:30} {units:8} {gross:12.2f} {sell_through:7.1%}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Moves closed days of sales out of the working database into one archive file per period, and compacts it.
+
+Archived sales keep their price and band, so they still appear in exports and the sales history, which read
+each archive through a read-only connection of its own. Reports are unaffected, because closed days are read
+from dailyRollups.
+
+Usage:
+    python archive.py [--db StockSales.db] [--dir archives] [--keep-days 7] [--period year] [--vacuum]
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from database import database, day_bounds, period_bounds
+
+
+def archive_days(db: database, directory: str, keep_days: int = 7, period: str = "year") -> Dict:
+    """
+    Moves the sales of every closed day older than keep_days into archive files, one file per year or month
+
+    Each period is copied into its archive and committed before it is deleted from the working database,
+    so an interrupted run leaves the sales in both places, and running it again finishes the move. A period
+    is only deleted once every one of its sales is in the archive, so an archive already holding a different
+    sale under the same id stops the run, rather than losing the sale.
+
+        Parameters:
+            db (database): the working database
+            directory (str): where the archive files are kept, created if needed
+            keep_days (int): the number of most recent days that stay in the working database, even if closed
+            period (str): "year" or "month", how much history each archive file holds
+
+        Returns:
+            moved (dict): the number of sales moved into each period's archive
+
+        Raises:
+            ValueError: if a period's archive holds a different sale under the id of one being moved
+    """
+    os.makedirs(directory, exist_ok=True)
+    _reserve_archived_ids(db)
+    _index_archives(db)
+    cutoff: str = day_bounds(datetime.now(timezone.utc).date() - timedelta(days=keep_days))[0]
+    length: int = 4 if period == "year" else 7
+    cursor = db.connection.cursor()
+    periods: List = [row[0] for row in cursor.execute(f"""SELECT DISTINCT substr(timestamp, 1, {length}) FROM sales WHERE timestamp < ? AND DATE(timestamp) IN (SELECT day FROM closedDays) ORDER BY 1""", (cutoff, ))]
+    moved: Dict = {}
+    for name in periods:
+        start, end = period_bounds(name)
+        end = min(end, cutoff)
+        path = os.path.abspath(os.path.join(directory, f"sales-{name}.db"))
+        closed = """sales.timestamp >= ? AND sales.timestamp < ? AND DATE(sales.timestamp) IN (SELECT day FROM closedDays)"""
+        cursor.execute("""ATTACH DATABASE ? AS archive""", (path, ))
+        try:
+            cursor.execute("""CREATE TABLE IF NOT EXISTS archive.sales (
+                           id INTEGER PRIMARY KEY,
+                           name TEXT,
+                           band TEXT,
+                           quantity INTEGER,
+                           timestamp TIMESTAMP,
+                           price REAL)""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS archive.idx_sales_timestamp ON sales (timestamp)""")
+            # Lets a band's page of the sales history seek through the archive, newest first, rather than scan it
+            cursor.execute("""CREATE INDEX IF NOT EXISTS archive.idx_sales_band ON sales (band, id)""")
+            try:
+                cursor.execute(f"""INSERT OR IGNORE INTO archive.sales (id, name, band, quantity, timestamp, price)
+                               SELECT sales.id, products.name, products.band, sales.quantity, sales.timestamp, sales.price
+                               FROM main.sales JOIN main.products ON products.id = sales.stockItemID WHERE {closed}""", (start, end))
+                # Rows copied by an interrupted run are ignored, which is only safe if they are the same sales
+                clashes: int = cursor.execute(f"""SELECT COUNT(*) FROM main.sales WHERE {closed} AND NOT EXISTS (
+                                              SELECT 1 FROM archive.sales AS copy WHERE copy.id = sales.id AND copy.timestamp = sales.timestamp
+                                              AND copy.quantity = sales.quantity AND copy.price IS sales.price)""", (start, end)).fetchone()[0]
+                if clashes:
+                    raise ValueError(f"{clashes} sales from {name} clash with different sales already in {path}, nothing was moved")
+                db.connection.commit()
+                cursor.execute("""INSERT OR REPLACE INTO archives (period, path) VALUES (?,?)""", (name, path))
+                days: List = [row[0] for row in cursor.execute(f"""SELECT DISTINCT DATE(sales.timestamp) FROM main.sales WHERE {closed}""", (start, end))]
+                cursor.execute(f"""DELETE FROM main.sales WHERE {closed}""", (start, end))
+                moved[name] = cursor.rowcount
+                # The days are read from dailyRollups from now on, so their running totals are no longer needed
+                cursor.executemany("""DELETE FROM bandTotals WHERE day=?""", [(day, ) for day in days])
+                db.connection.commit()
+            except:
+                db.connection.rollback()
+                raise
+        finally:
+            cursor.execute("""DETACH DATABASE archive""")
+    return moved
+
+
+def _index_archives(db: database) -> None:
+    """Adds the band index to archives written before it existed, which are otherwise never opened for writing again"""
+    for (path, ) in db.connection.execute("""SELECT path FROM archives""").fetchall():
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute("""CREATE INDEX IF NOT EXISTS idx_sales_band ON sales (band, id)""")
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def _reserve_archived_ids(db: database) -> None:
+    """
+    Moves the sales id sequence past every archived id, so new sales can never take the id of an archived one
+
+    Sales tables from before ids were AUTOINCREMENT handed out ids again once archiving had emptied them, and
+    the sequence they are rebuilt with only knows about the ids still in the working database
+    """
+    sources: List = db._sales_sources()
+    try:
+        highest: int = max((connection.execute("""SELECT MAX(id) FROM sales""").fetchone()[0] or 0 for connection, _ in sources[1:]), default=0)
+    finally:
+        db._close_sources(sources)
+    if not highest:
+        return
+    cursor = db.connection.cursor()
+    try:
+        if cursor.execute("""SELECT 1 FROM sqlite_sequence WHERE name='sales'""").fetchone() is None:
+            cursor.execute("""INSERT INTO sqlite_sequence (name, seq) VALUES ('sales', ?)""", (highest, ))
+        else:
+            cursor.execute("""UPDATE sqlite_sequence SET seq=? WHERE name='sales' AND seq < ?""", (highest, highest))
+        db.connection.commit()
+    except:
+        db.connection.rollback()
+        raise
+
+
+def compact(db: database, vacuum: bool = False, pages: int = 0) -> Dict:
+    """
+    Returns the space freed by archiving to the file system, and empties the write-ahead log
+
+    Incremental vacuuming only moves free pages, so it is quick enough to run during a show. A full VACUUM
+    rewrites the whole file and blocks the till while it runs, but is needed once to enable incremental
+    vacuuming on databases created before it was the default, so it is run instead the first time such a
+    database has pages to return.
+
+        Parameters:
+            db (database): the working database
+            vacuum (bool): rebuild the whole file with VACUUM, instead of an incremental vacuum
+            pages (int): the most free pages an incremental vacuum returns, 0 returns all of them
+
+        Returns:
+            sizes (dict): the free pages before, and the page count after
+    """
+    cursor = db.connection.cursor()
+    free: int = cursor.execute("""PRAGMA freelist_count""").fetchone()[0]
+    if free and cursor.execute("""PRAGMA auto_vacuum""").fetchone()[0] != 2:
+        vacuum = True
+    if vacuum:
+        cursor.execute("""PRAGMA auto_vacuum=INCREMENTAL""")
+        cursor.execute("""VACUUM""")
+    else:
+        cursor.execute(f"""PRAGMA incremental_vacuum({pages})""").fetchall()
+    cursor.execute("""PRAGMA wal_checkpoint(TRUNCATE)""").fetchall()
+    return {"free_pages": free, "pages": cursor.execute("""PRAGMA page_count""").fetchone()[0]}
+
+
+class archiver:
+    """
+    This class archives and compacts the working database on a background thread, at a fixed interval.
+
+    It opens its own database instance, so it never shares a connection with the till.
+
+    Attributes:
+        path (str): the working database file
+        directory (str): where the archive files are kept
+        interval (float): seconds between runs
+        keep_days (int): the number of most recent days kept in the working database
+        period (str): how much history each archive file holds
+        on_error: called with any exception a run raises
+        storage (str): how the database is stored, as passed to the database class
+
+    Methods:
+        __init__: Initializes the archiver class and starts its thread
+        run: The archiver threads loop, archiving then compacting until stopped
+        close: Stops the thread, waiting for a run in progress to finish
+    """
+
+    def __init__(self, path: str, directory: str, interval: float = 3600, keep_days: int = 7, period: str = "year", on_error=None, storage: str = None) -> None:
+        """Initializes the archiver class"""
+        self.path = path
+        self.storage = storage
+        self.directory = directory
+        self.interval = interval
+        self.keep_days = keep_days
+        self.period = period
+        self.on_error = on_error
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="archiver", daemon=True)
+        self.thread.start()
+
+
+    def run(self) -> None:
+        """Archives and compacts straight away, then again every interval seconds"""
+        db = database(self.path, storage=self.storage)
+        db.create_tables()
+        while True:
+            try:
+                archive_days(db, self.directory, self.keep_days, self.period)
+                compact(db)
+            except Exception as exception:
+                if self.on_error is not None:
+                    self.on_error(exception)
+            if self._stopped.wait(self.interval):
+                break
+        db.close_db()
+
+
+    def close(self) -> None:
+        """Stops the archiver thread"""
+        self._stopped.set()
+        self.thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive closed days of sales and compact the database")
+    parser.add_argument("--db", default="StockSales.db", help="the working database file")
+    parser.add_argument("--dir", default="archives", help="where the archive files are kept")
+    parser.add_argument("--keep-days", type=int, default=7, help="recent days kept in the working database")
+    parser.add_argument("--period", choices=("year", "month"), default="year", help="how much history each archive file holds")
+    parser.add_argument("--vacuum", action="store_true", help="rebuild the whole file, which blocks other writers while it runs")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    db.create_tables()
+    db.close_days()
+    for period, count in archive_days(db, arguments.dir, arguments.keep_days, arguments.period).items():
+        print(f"Archived {count} sales to {period}")
+    sizes = compact(db, arguments.vacuum)
+    print(f"Freed {sizes['free_pages']} pages, {sizes['pages']} pages in use")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
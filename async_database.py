@@ -0,0 +1,219 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable
+from connection import connectionManager
+from database import database
+
+
+# The methods that only use the read-only connection, and so can run on any reader thread at the same time
+READS = (
+    "retrieve_inventory",
+    "retrieve_inventory_page",
+    "retrieve_sales",
+    "retrieve_sales_page",
+    "retrieve_band_totals",
+    "retrieve_total_payments",
+    "report_totals",
+    "report_products",
+    "search_products",
+    "iter_sales",
+    "iter_inventory",
+)
+
+
+class _request:
+    """One call running on an executor thread, which can be interrupted if the awaiting task gives up on it"""
+
+    def __init__(self, local: threading.local, factory: Callable, function: Callable, args: tuple, kwargs: dict, write: bool) -> None:
+        self.local = local
+        self.factory = factory
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.write = write
+        self.connection = None
+        self.cancelled: bool = False
+        self._lock = threading.Lock()
+
+
+    def run(self):
+        """Runs the call against the executor thread's own database instance"""
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = self.factory()
+        with self._lock:
+            if self.cancelled:
+                return None
+            self.connection = db.connection if self.write else db.reader
+        try:
+            return self.function(db, *self.args, **self.kwargs)
+        except:
+            # Methods without their own error handling must not leave the shared writer inside a transaction
+            if self.write and db.connection.in_transaction:
+                db.connection.rollback()
+            raise
+        finally:
+            with self._lock:
+                self.connection = None
+
+
+    def interrupt(self) -> None:
+        """Stops the call before it starts, or aborts its running SQL statement"""
+        with self._lock:
+            self.cancelled = True
+            if self.connection is not None:
+                self.connection.interrupt()
+
+
+class AsyncDatabase:
+    """
+    This class exposes every database method as a coroutine, for asyncio front ends such as card readers and kiosks.
+
+    Calls run on a bounded pool of threads that own their own connections. Reads run on a pool of reader
+    threads, each with its own read-only connection, so they proceed in parallel. Writes all run on a single
+    writer thread, in the order they were awaited, matching the single writer connection they share.
+
+    Every coroutine accepts a timeout keyword. When a call times out, or the awaiting task is cancelled, a call
+    that has not started yet is dropped, and a running call has its SQL statement interrupted and rolled back.
+
+    Attributes:
+        manager: the connectionManager shared by every thread's database instance
+        timeout (float): the default number of seconds to wait for a call, or None to wait indefinitely
+        options (dict): extra keyword arguments passed to each thread's database instance
+
+    Methods:
+        __init__: Initializes the AsyncDatabase class
+        call: Runs a database method by name, on the reader or writer pool
+        run: Runs a function taking the database, on the reader or writer pool
+        iterate: Streams the rows of an iter_ method in batches, without blocking the event loop
+        close_db: Waits for running calls, stops the threads and closes the connections
+    """
+
+    def __init__(self, path: str = "StockSales.db", manager: connectionManager = None, readers: int = 4, limit: int = 64, timeout: float = None, storage: str = None, **options) -> None:
+        """
+        Initializes the AsyncDatabase class
+
+            Parameters:
+                path (str): the database file to open when no manager is passed in
+                manager (connectionManager): an existing manager whose connections should be shared
+                readers (int): the number of reader threads, and so of concurrent reads
+                limit (int): the most calls that may be queued or running at once, further calls wait their turn
+                timeout (float): the default number of seconds to wait for a call
+                storage (str): how a new manager stores the database, "file", "memory" or "checkpointed"
+                options: extra keyword arguments passed to each thread's database instance, such as commission
+        """
+        self.owns_manager: bool = manager is None
+        self.manager = connectionManager(path, storage=storage) if manager is None else manager
+        self.timeout = timeout
+        self.options = options
+        self._limit = limit
+        self._semaphore = None
+        self._loop = None
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="AsyncDatabase-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncDatabase-writer")
+        # A generator's cursor belongs to the connection of the thread that opened it, so every batch of a stream
+        # is fetched on this one thread, where streams running at the same time take turns between batches
+        self._streams = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncDatabase-stream")
+        self._local = threading.local()
+
+
+    async def __aenter__(self) -> "AsyncDatabase":
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close_db()
+
+
+    def _database(self) -> database:
+        """Creates the calling executor thread's database instance, which opens that thread's reader connection"""
+        return database(manager=self.manager, **self.options)
+
+
+    async def run(self, function: Callable, *args, write: bool = True, timeout: float = None, **kwargs):
+        """
+        Runs a function on an executor thread, and returns its result
+
+            Parameters:
+                function: called with the thread's database instance followed by args and kwargs
+                write (bool): run on the single writer thread, rather than on the reader pool
+                timeout (float): seconds to wait before interrupting the call, defaulting to the instance's timeout
+        """
+        return await self._execute(self._writer if write else self._readers, function, args, kwargs, write, timeout)
+
+
+    async def _execute(self, executor: ThreadPoolExecutor, function: Callable, args: tuple, kwargs: dict, write: bool, timeout: float):
+        """Runs a function on the given executor, interrupting it if the caller stops waiting"""
+        # A semaphore belongs to the event loop it was first used in, so each new loop gets its own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._limit)
+        request = _request(self._local, self._database, function, args, kwargs, write)
+        async with self._semaphore:
+            future = loop.run_in_executor(executor, request.run)
+            try:
+                return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                request.interrupt()
+                raise
+
+
+    async def call(self, name: str, *args, timeout: float = None, **kwargs):
+        """Runs the named database method, on the reader pool for read-only methods and on the writer thread otherwise"""
+        return await self.run(lambda db, *args, **kwargs: getattr(db, name)(*args, **kwargs), *args, write=name not in READS, timeout=timeout, **kwargs)
+
+
+    async def iterate(self, name: str, *args, batch_size: int = 1000, timeout: float = None, **kwargs) -> AsyncIterator:
+        """
+        Yields the rows of an iter_ method, opening it and fetching each batch on the stream thread
+
+            Parameters:
+                name (str): the generator method to stream, such as iter_sales
+                batch_size (int): the number of rows fetched per executor call
+                timeout (float): seconds to wait for each batch
+        """
+        rows = await self._execute(self._streams, lambda db: getattr(db, name)(*args, batch_size=batch_size, **kwargs), (), {}, False, timeout)
+        try:
+            while True:
+                batch = await self._execute(self._streams, lambda db: [row for _, row in zip(range(batch_size), rows)], (), {}, False, timeout)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row
+        finally:
+            # Closing runs the generator's cleanup, which closes its cursors, so it too runs on the stream thread,
+            # after any batch a cancelled caller left running there
+            await asyncio.get_running_loop().run_in_executor(self._streams, rows.close)
+
+
+    async def close_db(self) -> None:
+        """Waits for every running call to finish, then stops the executor threads and closes their connections"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.shutdown)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        await loop.run_in_executor(None, self._streams.shutdown)
+        if self.owns_manager:
+            self.manager.close()
+        print("Database Closed")
+
+
+def _mirror(name: str, method: Callable) -> Callable:
+    """Returns a coroutine, or async generator, that runs the named database method through the executors"""
+    if inspect.isgeneratorfunction(method):
+        def mirrored(self, *args, **kwargs):
+            return self.iterate(name, *args, **kwargs)
+    else:
+        async def mirrored(self, *args, timeout: float = None, **kwargs):
+            return await self.call(name, *args, timeout=timeout, **kwargs)
+    mirrored.__name__ = name
+    mirrored.__qualname__ = f"AsyncDatabase.{name}"
+    mirrored.__doc__ = method.__doc__
+    return mirrored
+
+
+for _name, _method in vars(database).items():
+    if not _name.startswith("_") and callable(_method) and _name != "close_db":
+        setattr(AsyncDatabase, _name, _mirror(_name, _method))
@@ -0,0 +1,144 @@
+"""
+Takes rotating online snapshots of the database while the till is trading, and restores them.
+
+Snapshots are named after the database and the UTC time they were taken, such as StockSales-20240601T213000.db,
+and only the most recent ones are kept.
+
+Usage:
+    python backup.py backup [--db StockSales.db] [--dir backups] [--keep 24]
+    python backup.py restore [SNAPSHOT] [--db StockSales.db] [--dir backups]    restores the latest snapshot by default
+    python backup.py list [--db StockSales.db] [--dir backups]
+"""
+import argparse
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Callable, List
+from database import database
+
+
+def snapshots(directory: str, path: str) -> List:
+    """Returns the snapshots of the database file at path kept in directory, oldest first"""
+    stem = os.path.splitext(os.path.basename(path))[0] + "-"
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.startswith(stem) and name.endswith(".db"))
+    return [os.path.join(directory, name) for name in names]
+
+
+def take_snapshot(db: database, directory: str, keep: int = 24, pages: int = 256, sleep: float = 0.005) -> str:
+    """
+    Writes a verified snapshot of the database to directory, then deletes all but the newest keep snapshots
+
+    The snapshot is written under a temporary name and only renamed once it has passed its integrity check,
+    so a snapshot that is listed is always complete.
+
+        Parameters:
+            db (database): the database to snapshot
+            directory (str): where snapshots are kept, created if needed
+            keep (int): the number of snapshots kept
+            pages (int): the number of pages copied per step
+            sleep (float): seconds to pause between steps
+
+        Returns:
+            path (str): the new snapshot
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db.manager.path))[0]
+    path = os.path.join(directory, f"{stem}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}.db")
+    db.backup(path + ".partial", pages, sleep)
+    os.replace(path + ".partial", path)
+    for old in snapshots(directory, db.manager.path)[:-keep]:
+        os.remove(old)
+    return path
+
+
+def restore_latest(db: database, directory: str) -> str:
+    """Restores the newest snapshot in directory and returns its path, or returns None if there are none"""
+    kept = snapshots(directory, db.manager.path)
+    if not kept:
+        return None
+    db.restore(kept[-1])
+    return kept[-1]
+
+
+class backupScheduler:
+    """
+    This class takes a snapshot on a background thread at a fixed interval.
+
+    It opens its own database instance. Snapshots read from a single WAL read transaction, so the till's
+    sales carry on while one is taken, and never force it to start again.
+
+    Attributes:
+        path (str): the database file
+        directory (str): where snapshots are kept
+        interval (float): seconds between snapshots
+        keep (int): the number of snapshots kept
+        on_done: called with each new snapshot's path
+        on_error: called with any exception a snapshot raises
+        storage (str): how the database is stored, as passed to the database class
+
+    Methods:
+        __init__: Initializes the backupScheduler class and starts its thread
+        run: The scheduler threads loop
+        close: Stops the thread, waiting for a snapshot in progress to finish
+    """
+
+    def __init__(self, path: str, directory: str, interval: float = 900, keep: int = 24, on_done: Callable = None, on_error: Callable = None, storage: str = None) -> None:
+        """Initializes the backupScheduler class"""
+        self.path = path
+        self.storage = storage
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.on_done = on_done
+        self.on_error = on_error
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="backupScheduler", daemon=True)
+        self.thread.start()
+
+
+    def run(self) -> None:
+        """Takes a snapshot every interval seconds until stopped"""
+        db = database(self.path, storage=self.storage)
+        while not self._stopped.wait(self.interval):
+            try:
+                path = take_snapshot(db, self.directory, self.keep)
+                if self.on_done is not None:
+                    self.on_done(path)
+            except Exception as exception:
+                if self.on_error is not None:
+                    self.on_error(exception)
+        db.close_db()
+
+
+    def close(self) -> None:
+        """Stops the scheduler thread"""
+        self._stopped.set()
+        self.thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Take, list or restore online database snapshots")
+    parser.add_argument("action", choices=("backup", "restore", "list"))
+    parser.add_argument("snapshot", nargs="?", help="the snapshot to restore, the latest when omitted")
+    parser.add_argument("--db", default="StockSales.db", help="the database file")
+    parser.add_argument("--dir", default="backups", help="where snapshots are kept")
+    parser.add_argument("--keep", type=int, default=24, help="the number of snapshots kept")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    if arguments.action == "backup":
+        print(f"Wrote {take_snapshot(db, arguments.dir, arguments.keep)}")
+    elif arguments.action == "list":
+        for path in snapshots(arguments.dir, arguments.db):
+            print(path)
+    elif arguments.snapshot:
+        db.restore(arguments.snapshot)
+        print(f"Restored {arguments.snapshot}")
+    else:
+        print(f"Restored {restore_latest(db, arguments.dir) or 'nothing, there are no snapshots'}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the totals screen's breakdowns computed from row tuples with the same breakdowns from a columnar snapshot.
+
+The row version streams the range through iter_sales once per chart, as each chart used to be queried on its own.
+The snapshot is loaded once, then refreshed after a few new sales and asked for every chart again.
+
+Usage:
+    python benchmarks/bench_analytics.py [--size medium] [--days 30] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+import analytics
+from analytics import salesSnapshot
+from generator import SIZES, generate
+
+
+def from_rows(db, start: date, end: date) -> tuple:
+    """Builds the hour, product and band breakdowns from row tuples, reading the range once per breakdown"""
+    charts = []
+    for key in (lambda sale: sale[4][:13], lambda sale: sale[1], lambda sale: sale[2]):
+        totals = defaultdict(lambda: [0, 0.0])
+        for sale in db.iter_sales(start, end):
+            total = totals[key(sale)]
+            total[0] += sale[3]
+            total[1] += sale[3] * sale[5]
+        charts.append(totals)
+    return tuple(charts)
+
+
+def timed(function, repeat: int) -> float:
+    """Returns the median milliseconds taken by function over repeat calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the columnar sales snapshot")
+    parser.add_argument("--size", choices=SIZES, default="medium", help="the synthetic dataset to build")
+    parser.add_argument("--days", type=int, default=30, help="the number of days, ending today, loaded")
+    parser.add_argument("--repeat", type=int, default=5, help="runs timed per measurement")
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        db = generate(os.path.join(directory, "analytics.db"), **SIZES[arguments.size])
+        end = datetime.now(timezone.utc).date()
+        start = end - timedelta(days=arguments.days)
+        product = db.connection.execute("""SELECT name FROM stockItems ORDER BY quantity DESC LIMIT 1""").fetchone()[0]
+        snapshot = salesSnapshot(db, start, end)
+        charts = lambda: (snapshot.by_hour(), snapshot.by_product(), snapshot.by_band())
+        def refresh():
+            db.checkout([[product, 1]] * 10)
+            snapshot.refresh()
+        print(f"{len(snapshot.ids)} sales over {arguments.days} days, {snapshot.nbytes():,} bytes of columns, NumPy {'on' if analytics.numpy else 'off'}")
+        print(f"{'row tuples, 3 charts':32} {timed(lambda: from_rows(db, start, end), arguments.repeat):10.1f} ms")
+        print(f"{'snapshot load':32} {timed(lambda: salesSnapshot(db, start, end), arguments.repeat):10.1f} ms")
+        print(f"{'snapshot refresh, 10 new sales':32} {timed(refresh, arguments.repeat):10.1f} ms")
+        print(f"{'snapshot, 3 charts':32} {timed(charts, arguments.repeat):10.1f} ms")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
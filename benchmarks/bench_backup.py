@@ -0,0 +1,67 @@
+"""
+Measures sale latency while online snapshots are being taken, against the same sales with no snapshot running.
+
+Usage:
+    python benchmarks/bench_backup.py [--size small] [--sales 2000] [--pages 256]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from database import database
+from generator import SIZES, generate
+
+
+def sell(db: database, product: str, sales: int) -> list:
+    """Records single-item sales one after another, and returns each one's latency in milliseconds, sorted"""
+    timings = []
+    for _ in range(sales):
+        start = time.perf_counter()
+        db.checkout([[product, 1]])
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+def summary(timings: list) -> str:
+    percentile = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    return f"p50 {percentile(0.50):7.3f} ms  p99 {percentile(0.99):7.3f} ms  max {timings[-1]:7.3f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark sale latency during online backups")
+    parser.add_argument("--size", choices=SIZES, default="small", help="the synthetic database to build")
+    parser.add_argument("--sales", type=int, default=2000, help="sales timed in each run")
+    parser.add_argument("--pages", type=int, default=256, help="pages copied per backup step")
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        generate(path, **SIZES[arguments.size]).close_db()
+        db = database(path)
+        product = db.connection.execute("""SELECT name FROM stockItems ORDER BY quantity DESC LIMIT 1""").fetchone()[0]
+        db.update_stock_quantity(product, -arguments.sales * 2)
+        print(f"no backup      {summary(sell(db, product, arguments.sales))}")
+        snapshots = []
+        stopped = threading.Event()
+        def backups():
+            backup = database(path)
+            while not stopped.is_set():
+                start = time.perf_counter()
+                backup.backup(os.path.join(directory, "snapshot.db"), arguments.pages)
+                snapshots.append(time.perf_counter() - start)
+            backup.close_db()
+        thread = threading.Thread(target=backups)
+        thread.start()
+        timings = sell(db, product, arguments.sales)
+        stopped.set()
+        thread.join()
+        print(f"during backup  {summary(timings)}")
+        print(f"{len(snapshots)} snapshots, {sum(snapshots) / len(snapshots):.3f} s each, {os.path.getsize(path) / 1e6:.1f} MB database")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
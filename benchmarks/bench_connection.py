@@ -0,0 +1,49 @@
+"""
+Measures sales per second before and after the shared, tuned connection layer.
+
+The "before" run uses SQLite's default PRAGMAs and records each sale the original way,
+with create_sale followed by update_stock_quantity. The "after" run uses the tuned
+connectionManager and records each sale with a single checkout.
+
+Usage:
+    python benchmarks/bench_connection.py [sales]
+"""
+import os
+import sys
+import tempfile
+import time
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from connection import connectionManager
+from database import database
+
+
+def run(pragmas, sales: int, use_checkout: bool) -> float:
+    """Records the given number of single-item sales and returns the sales per second"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = database(manager=connectionManager(os.path.join(directory, "bench.db"), pragmas))
+        db.create_tables()
+        db.create_update_stock(["Hoodie", "One Direction", sales, 5.0])
+        start = time.perf_counter()
+        for _ in range(sales):
+            if use_checkout:
+                db.checkout([["Hoodie", 1]])
+            else:
+                db.create_sale(["Hoodie", 1])
+                db.update_stock_quantity("Hoodie", 1)
+        elapsed = time.perf_counter() - start
+        db.manager.close()
+    return sales / elapsed
+
+
+def main() -> None:
+    sales = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    before = run({}, sales, use_checkout=False)
+    after = run(None, sales, use_checkout=True)
+    print(f"before: {before:10.1f} sales/sec  (default PRAGMAs, create_sale + update_stock_quantity)")
+    print(f"after:  {after:10.1f} sales/sec  (tuned connectionManager, checkout)")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
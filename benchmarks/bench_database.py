@@ -0,0 +1,102 @@
+"""
+Times the database methods used by the till against synthetic databases of several sizes.
+
+Results are written as JSON, and can be compared against an earlier run to spot regressions.
+
+Usage:
+    python benchmarks/bench_database.py [--sizes small,medium] [--repeat 50] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from generator import SIZES, generate
+
+
+def measure(function, repeat: int) -> dict:
+    """Calls function repeat times, and returns its latency statistics in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "calls": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+    }
+
+
+def bench_size(name: str, repeat: int, directory: str) -> dict:
+    """Builds the named database size, and times each method against it"""
+    size = SIZES[name]
+    start = time.perf_counter()
+    db = generate(os.path.join(directory, f"{name}.db"), **size)
+    build_seconds = time.perf_counter() - start
+    product = db.connection.execute("""SELECT name FROM stockItems ORDER BY name LIMIT 1""").fetchone()[0]
+    db.update_stock_quantity(product, -repeat * 2)
+    results = {
+        "create_sale": measure(lambda: db.create_sale([product, 1]), repeat),
+        "update_stock_quantity": measure(lambda: db.update_stock_quantity(product, 1), repeat),
+        "retrieve_inventory": measure(db.retrieve_inventory, repeat),
+        "retrieve_sales": measure(db.retrieve_sales, repeat),
+        "retrieve_total_payments": measure(db.retrieve_total_payments, repeat),
+    }
+    db.close_db()
+    return {"size": size, "build_seconds": round(build_seconds, 2), "methods": results}
+
+
+def compare(current: dict, previous: dict) -> None:
+    """Prints the change in median latency for every method measured in both runs"""
+    for size, result in current["results"].items():
+        if size not in previous["results"]:
+            continue
+        for method, timing in result["methods"].items():
+            before = previous["results"][size]["methods"].get(method)
+            if before:
+                ratio = timing["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+                print(f"{size:8} {method:25} {before['median_ms']:10.3f} ms -> {timing['median_ms']:10.3f} ms  ({ratio:.2f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the database methods at several data sizes")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated sizes from {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=50, help="calls timed per method")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="an earlier JSON results file to compare against")
+    arguments = parser.parse_args()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": arguments.repeat,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name in arguments.sizes.split(","):
+            report["results"][name] = bench_size(name, arguments.repeat, directory)
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Compares the storage size and join speed of products keyed by name with products keyed by integer id.
+
+The same synthetic data is written twice, once in the layout used before integer ids, where sales stored
+the product name and every product stored its band name, and once in the current layout. Both files are
+vacuumed, then the bytes used by each table and index are read from dbstat, and the same joins are timed.
+The legacy file is finally upgraded by create_tables, to time the migration itself.
+
+Usage:
+    python benchmarks/bench_schema.py [--size medium] [--repeat 5]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from database import database
+from generator import SIZES, generate
+
+
+# The tables and indexes as they were while products were keyed by name
+LEGACY_SCHEMA = """
+CREATE TABLE stockItems (name TEXT PRIMARY KEY, band TEXT, quantity INTEGER, price REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE sales (id INTEGER PRIMARY KEY, stockItemID TEXT, quantity INTEGER, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, price REAL,
+                    FOREIGN KEY (stockItemID) REFERENCES StockItems(name));
+CREATE INDEX idx_stockItems_timestamp ON stockItems (timestamp);
+CREATE INDEX idx_stockItems_band ON stockItems (band, name);
+CREATE INDEX idx_sales_timestamp ON sales (timestamp, stockItemID, quantity, price);
+CREATE INDEX idx_sales_stockItemID ON sales (stockItemID, timestamp, quantity, price);
+"""
+
+# Each query as written against the legacy layout, then against the current one
+JOINS = {
+    "band revenue, all sales": (
+        """SELECT stockItems.band, SUM(sales.price * sales.quantity) FROM sales JOIN stockItems ON sales.stockItemID = stockItems.name GROUP BY stockItems.band""",
+        # Grouping by band id before looking up the names lets SQLite walk the sales index product by product,
+        # where grouping by name sorts every sale in a temporary b-tree
+        """SELECT bands.name, revenue FROM (SELECT stockItems.bandID AS bandID, SUM(sales.price * sales.quantity) AS revenue
+           FROM sales JOIN stockItems ON stockItems.id = sales.stockItemID GROUP BY stockItems.bandID) AS totals JOIN bands ON bands.id = totals.bandID""",
+    ),
+    "sales of one day": (
+        """SELECT sales.id, stockItems.name, stockItems.band, sales.quantity, sales.timestamp, sales.price FROM sales
+           JOIN stockItems ON sales.stockItemID = stockItems.name WHERE sales.timestamp >= DATE('now', '-1 day') AND sales.timestamp < DATE('now')""",
+        """SELECT sales.id, products.name, products.band, sales.quantity, sales.timestamp, sales.price FROM sales
+           JOIN products ON products.id = sales.stockItemID WHERE sales.timestamp >= DATE('now', '-1 day') AND sales.timestamp < DATE('now')""",
+    ),
+    "history of one product": (
+        """SELECT sales.id, sales.quantity, sales.timestamp FROM sales JOIN stockItems ON sales.stockItemID = stockItems.name WHERE stockItems.name = 'Hoodie 000000'""",
+        """SELECT sales.id, sales.quantity, sales.timestamp FROM sales JOIN stockItems ON stockItems.id = sales.stockItemID WHERE stockItems.name = 'Hoodie 000000'""",
+    ),
+}
+
+# Renaming a product, which rewrote every one of its sales while they stored its name
+RENAMES = (
+    ("""UPDATE stockItems SET name = 'Renamed' WHERE name = 'Hoodie 000000'""", """UPDATE sales SET stockItemID = 'Renamed' WHERE stockItemID = 'Hoodie 000000'"""),
+    ("""UPDATE stockItems SET name = 'Renamed' WHERE name = 'Hoodie 000000'""", ),
+)
+
+
+def write_legacy(path: str, source: str) -> None:
+    """Writes the products and sales of the database at source into a new file at path, in the legacy layout"""
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("""ATTACH DATABASE ? AS current""", (source, ))
+    connection.execute("""INSERT INTO stockItems (name, band, quantity, price, timestamp) SELECT name, band, quantity, price, timestamp FROM current.products ORDER BY id""")
+    connection.execute("""INSERT INTO sales (id, stockItemID, quantity, timestamp, price)
+                       SELECT sales.id, products.name, sales.quantity, sales.timestamp, sales.price FROM current.sales JOIN current.products ON products.id = sales.stockItemID""")
+    connection.commit()
+    connection.execute("""DETACH DATABASE current""")
+    connection.execute("""VACUUM""")
+    connection.close()
+
+
+def sizes(connection: sqlite3.Connection) -> dict:
+    """Returns the bytes used by the bands, stockItems and sales tables, and by all of their indexes"""
+    used = {"bands": 0, "stockItems": 0, "sales": 0, "indexes": 0}
+    rows = connection.execute("""SELECT dbstat.name, sqlite_master.type, SUM(dbstat.pgsize) FROM dbstat JOIN sqlite_master ON sqlite_master.name = dbstat.name
+                              WHERE sqlite_master.tbl_name IN ('bands', 'stockItems', 'sales') GROUP BY dbstat.name""").fetchall()
+    for name, kind, size in rows:
+        used["indexes" if kind == "index" else name] += size
+    return used
+
+
+def timed(function, repeat: int) -> float:
+    """Returns the median milliseconds taken by function over repeat calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def rename(connection: sqlite3.Connection, statements: tuple) -> None:
+    """Renames a product and rolls it back, so every call renames the same product"""
+    for statement in statements:
+        connection.execute(statement)
+    connection.rollback()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare name keyed and integer keyed products")
+    parser.add_argument("--size", choices=SIZES, default="medium", help="the synthetic dataset to build")
+    parser.add_argument("--repeat", type=int, default=5, help="runs timed per query")
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        current_path = os.path.join(directory, "current.db")
+        legacy_path = os.path.join(directory, "legacy.db")
+        db = generate(current_path, **SIZES[arguments.size])
+        db.connection.execute("""VACUUM""")
+        db.close_db()
+        write_legacy(legacy_path, current_path)
+        legacy = sqlite3.connect(legacy_path)
+        current = sqlite3.connect(current_path)
+        before, after = sizes(legacy), sizes(current)
+        print(f"{'bytes':24} {'names':>14} {'integer ids':>14}")
+        for name in before:
+            print(f"{name:24} {before[name]:14,} {after[name]:14,}")
+        print(f"{'total':24} {sum(before.values()):14,} {sum(after.values()):14,}")
+        print(f"\n{'median ms':24} {'names':>14} {'integer ids':>14}")
+        for name, (old, new) in JOINS.items():
+            print(f"{name:24} {timed(lambda: legacy.execute(old).fetchall(), arguments.repeat):14.3f} {timed(lambda: current.execute(new).fetchall(), arguments.repeat):14.3f}")
+        print(f"{'rename one product':24} {timed(lambda: rename(legacy, RENAMES[0]), arguments.repeat):14.3f} {timed(lambda: rename(current, RENAMES[1]), arguments.repeat):14.3f}")
+        legacy.close()
+        current.close()
+        migrated = os.path.join(directory, "migrated.db")
+        shutil.copy(legacy_path, migrated)
+        start = time.perf_counter()
+        db = database(migrated)
+        db.create_tables()
+        print(f"\nMigrated the legacy file to integer ids in {time.perf_counter() - start:.2f} s")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
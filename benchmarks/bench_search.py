@@ -0,0 +1,43 @@
+"""
+Measures product search latency per keystroke, against a synthetic catalog.
+
+Each query is typed one character at a time, as in the sale screen's type-ahead box,
+and the mean and worst lookup for each prefix are reported.
+
+Usage:
+    python benchmarks/bench_search.py [--products 50000] [--bands 500] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from generator import generate
+
+
+QUERIES = ("hoodie 0001", "band 0042 tee", "vinyl", "zz")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the type-ahead product search")
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--bands", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200, help="lookups timed per prefix")
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        db = generate(os.path.join(directory, "search.db"), arguments.products, arguments.bands, sales=0, days=1)
+        for query in QUERIES:
+            for end in range(1, len(query) + 1):
+                timings = []
+                for _ in range(arguments.repeat):
+                    start = time.perf_counter()
+                    matches = db.search_products(query[:end], 10, in_stock=True)
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"{query[:end]!r:18} {len(matches):3} matches  mean {sum(timings) / len(timings):7.3f} ms  max {max(timings):7.3f} ms")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
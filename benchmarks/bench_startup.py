@@ -0,0 +1,55 @@
+"""
+Measures how long the till takes to start.
+
+Each import is timed in a fresh interpreter, so nothing is already cached in sys.modules. When a
+display is available, the time from constructing ShopManager to the first frame being drawn is
+timed too.
+
+Usage:
+    python benchmarks/bench_startup.py [repeat]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+
+
+def cold_import(module: str, repeat: int) -> float:
+    """Returns the median milliseconds taken to import module in a new interpreter"""
+    code = f"import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout))
+    return statistics.median(timings)
+
+
+def first_frame(path: str) -> float:
+    """Returns the milliseconds from constructing ShopManager until its first frame is drawn"""
+    from user_interface import ShopManager
+    start = time.perf_counter()
+    app = ShopManager(path=path)
+    app.update_idletasks()
+    elapsed = (time.perf_counter() - start) * 1000
+    app.close()
+    return elapsed
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for module in ("database", "user_interface"):
+        print(f"import {module:15} {cold_import(module, repeat):8.1f} ms")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f"first frame           {first_frame(os.path.join(directory, 'startup.db')):8.1f} ms")
+    except tkinter.TclError as error:
+        print(f"first frame           skipped, no display ({error})")
+
+
+if __name__ == "__main__":
+    main()
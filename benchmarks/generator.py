@@ -0,0 +1,96 @@
+"""
+Builds a synthetic, tour-scale database for benchmarks.
+
+The same seed always produces the same products, bands, stock levels and sales, so runs
+on different machines or commits are comparable.
+
+Usage:
+    python benchmarks/generator.py OUTPUT [--products 50000] [--bands 500] [--sales 10000000] [--days 730] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from database import database
+
+
+SIZES = {
+    "small": {"products": 1000, "bands": 10, "sales": 10000, "days": 30},
+    "medium": {"products": 10000, "bands": 100, "sales": 1000000, "days": 365},
+    "tour": {"products": 50000, "bands": 500, "sales": 10000000, "days": 730},
+}
+
+ITEMS = ("Hoodie", "Tee", "Cap", "Poster", "Tote", "Mug", "Badge", "Vinyl", "Scarf", "Beanie")
+
+
+def generate(path: str, products: int, bands: int, sales: int, days: int, seed: int = 1, batch_size: int = 50000) -> database:
+    """
+    Creates a new database at path filled with synthetic stock and sales, and returns it open
+
+        Parameters:
+            path (str): the database file to create, replacing any existing file
+            products (int): the number of stock items, spread evenly across the bands
+            bands (int): the number of touring bands
+            sales (int): the number of sales records, spread over the last `days` days
+            days (int): how many days of history the sales cover, ending today
+            seed (int): the random seed, so the same arguments always build the same data
+            batch_size (int): the number of rows inserted per executemany
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    generator = random.Random(seed)
+    db = database(path)
+    db.create_tables()
+    cursor = db.connection.cursor()
+    names = [f"{ITEMS[i % len(ITEMS)]} {i:06d}" for i in range(products)]
+    prices = [round(generator.uniform(3, 60), 2) for _ in range(products)]
+    # The tables are empty, so band i and product i are given the id i + 1
+    cursor.executemany("""INSERT INTO bands (name) VALUES (?)""", ((f"Band {i:04d}", ) for i in range(bands)))
+    cursor.executemany("""INSERT INTO stockItems (name, bandID, quantity, price) VALUES (?,?,?,?)""",
+                       ((names[i], i % bands + 1, generator.randint(1, 500), prices[i]) for i in range(products)))
+    db.connection.commit()
+    # The running totals are rebuilt once at the end, rather than updated by a trigger for every generated sale
+    cursor.execute("""DROP TRIGGER IF EXISTS trg_sales_insert_totals""")
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    seconds = days * 86400
+    written = 0
+    while written < sales:
+        count = min(batch_size, sales - written)
+        rows = []
+        for _ in range(count):
+            product = generator.randrange(products)
+            timestamp = now - timedelta(seconds=generator.randrange(seconds))
+            rows.append((product + 1, generator.randint(1, 3), timestamp.strftime("%Y-%m-%d %H:%M:%S"), prices[product]))
+        cursor.executemany("""INSERT INTO sales (stockItemID, quantity, timestamp, price) VALUES (?,?,?,?)""", rows)
+        db.connection.commit()
+        written += count
+    cursor.execute("""PRAGMA user_version=0""")
+    db.create_tables()
+    db.rebuild_totals()
+    return db
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a synthetic tour-scale database")
+    parser.add_argument("output", help="the database file to create")
+    parser.add_argument("--size", choices=SIZES, default="small", help="a preset for the arguments below")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--bands", type=int)
+    parser.add_argument("--sales", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    arguments = parser.parse_args()
+    size = dict(SIZES[arguments.size])
+    for option in size:
+        if getattr(arguments, option) is not None:
+            size[option] = getattr(arguments, option)
+    db = generate(arguments.output, seed=arguments.seed, **size)
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
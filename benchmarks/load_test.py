@@ -0,0 +1,91 @@
+"""
+Simulates several tills selling against the POS server at once, and reports sales per second and latency.
+
+By default a server is started in this process against a temporary database. Pass --url to load test
+a server that is already running instead; it must stock the product named by --product.
+
+Group commit saves disk syncs, so compare --max-batch 1, which commits every cart on its own, with the default,
+at --synchronous FULL, where every commit is synced. The tills run in this process, so on a machine with few
+cores they compete with the server for the CPU, which then limits throughput before the disk does.
+
+Usage:
+    python benchmarks/load_test.py [--tills 1,4,16] [--seconds 5] [--max-batch 256] [--synchronous NORMAL] [--url http://127.0.0.1:8080] [--product Hoodie]
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from pos_server import posServer
+
+
+def till(host: str, port: int, product: str, deadline: float, latencies: list) -> None:
+    """Sells one item at a time over a single kept-alive connection until the deadline, recording each latency"""
+    connection = http.client.HTTPConnection(host, port)
+    # Sent as bytes, so http.client writes the headers and body in one packet
+    body = json.dumps({"cart": [[product, 1]]}).encode()
+    headers = {"Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        connection.request("POST", "/sale", body, headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"sale failed with status {response.status}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    connection.close()
+
+
+def run(host: str, port: int, product: str, tills: int, seconds: float) -> dict:
+    """Runs the given number of tills for a number of seconds, and returns the throughput and latency percentiles"""
+    latencies = [[] for _ in range(tills)]
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=till, args=(host, port, product, deadline, latencies[i])) for i in range(tills)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings = sorted(latency for till_latencies in latencies for latency in till_latencies)
+    percentile = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    return {"tills": tills, "sales": len(timings), "sales_per_sec": len(timings) / elapsed, "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the POS server with several simulated tills")
+    parser.add_argument("--tills", default="1,4,16", help="comma separated numbers of tills to simulate")
+    parser.add_argument("--seconds", type=float, default=5, help="how long each run lasts")
+    parser.add_argument("--url", help="a running server to test, instead of starting one")
+    parser.add_argument("--product", default="Hoodie", help="the product every till sells")
+    parser.add_argument("--max-batch", type=int, default=256, help="the most carts recorded per transaction by the server started here")
+    parser.add_argument("--synchronous", choices=("NORMAL", "FULL"), default="NORMAL", help="FULL syncs the server's every commit to disk")
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if arguments.url:
+            url = urlparse(arguments.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            server = posServer(("127.0.0.1", 0), os.path.join(directory, "load.db"), max_batch=arguments.max_batch)
+            server.db.create_update_stock([arguments.product, "One Direction", 10 ** 9, 5.0])
+            server.db.connection.execute(f"""PRAGMA synchronous={arguments.synchronous}""")
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            host, port = server.server_address
+        for tills in (int(count) for count in arguments.tills.split(",")):
+            result = run(host, port, arguments.product, tills, arguments.seconds)
+            print(f"{result['tills']:3} tills  {result['sales_per_sec']:9.0f} sales/sec  p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms")
+        if server is not None:
+            print(f"{server.committer.carts} carts in {server.committer.batches} transactions")
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class inventoryCache:
+    """
+    This class is a read-through cache of stock levels, prices and bands, keyed by product name, for display only.
+    Anything written to the database, such as the price of a sale, is read by the SQL that writes it.
+
+    The database class updates it write-through whenever it changes stockItems. Changes made by
+    any other connection or process are detected with PRAGMA data_version, which clears the cache.
+
+    Attributes:
+        manager: the connectionManager whose reader connections answer misses, and whose writer connection is used for version checks
+        items (dict): the cached products
+            Key: product name
+            Value: a (quantity, price, band) tuple, or None for a product that does not exist
+        check_interval (float): the minimum number of seconds between data_version checks
+        hits (int): the number of lookups answered from the cache
+        misses (int): the number of lookups that had to query SQLite
+
+    Methods:
+        __init__: Initializes the inventoryCache class
+        get: Returns a products (quantity, price, band), querying SQLite only on a miss
+        put: Stores a products current details
+        adjust: Changes a cached products quantity
+        invalidate: Removes one product, or every product, from the cache
+        check_version: Clears the cache if another connection has changed the database
+        stats: Returns the hit and miss counters
+    """
+
+    def __init__(self, manager, check_interval: float = 0.25) -> None:
+        """Initializes the inventoryCache class"""
+        self.manager = manager
+        self.items: Dict = {}
+        self.check_interval = check_interval
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data_version = None
+        self._checked: float = 0
+        self._lock = threading.RLock()
+
+
+    def get(self, name: str) -> Tuple:
+        """Returns the (quantity, price, band) of a product, or None if it does not exist"""
+        with self._lock:
+            self.check_version()
+            if name in self.items:
+                self.hits += 1
+                return self.items[name]
+            self.misses += 1
+            item = self.manager.reader().execute("""SELECT quantity, price, band FROM products WHERE name=?""", (name, )).fetchone()
+            self.items[name] = item
+            return item
+
+
+    def put(self, name: str, quantity: int, price: float, band: str) -> None:
+        """Stores the current details of a product"""
+        with self._lock:
+            if self._data_version is None:
+                # Records the version the entry is current for, so a change by another connection before the next lookup is noticed
+                self.check_version()
+            self.items[name] = (quantity, price, band)
+
+
+    def adjust(self, name: str, change: int) -> None:
+        """Adds change to a cached products quantity, leaving uncached products to be read on their next lookup"""
+        with self._lock:
+            item = self.items.get(name)
+            if item is not None:
+                self.items[name] = (item[0] + change, item[1], item[2])
+
+
+    def invalidate(self, name: str = None) -> None:
+        """Removes a single product from the cache, or every product when no name is given"""
+        with self._lock:
+            if name is None:
+                self.items.clear()
+            else:
+                self.items.pop(name, None)
+
+
+    def check_version(self) -> None:
+        """Clears the cache when PRAGMA data_version shows another connection has committed a change"""
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        version = self.manager.writer().execute("PRAGMA data_version").fetchone()[0]
+        if self._data_version is not None and version != self._data_version:
+            self.items.clear()
+        self._data_version = version
+
+
+    def stats(self) -> Dict:
+        """Returns the number of cache hits and misses"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.items)}
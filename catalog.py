@@ -0,0 +1,65 @@
+"""
+Streams supplier catalogs into the stockItems table.
+
+Catalogs can be CSV files with a name, band, quantity and price header, or JSONL files
+with one {"name", "band", "quantity", "price"} object per line.
+
+Usage:
+    python catalog.py CATALOG [--db StockSales.db] [--chunk-size 1000]
+"""
+import argparse
+import csv
+import json
+from typing import Iterator
+from database import database
+
+
+FIELDS = ("name", "band", "quantity", "price")
+
+
+def read_catalog(path: str) -> Iterator:
+    """
+    Yields each product in a CSV or JSONL catalog, one line at a time
+
+    Rows that cannot be parsed are yielded with None values, so import_stock reports them as rejected.
+
+        Parameters:
+            path (str): a .csv or .jsonl file
+
+        Yields:
+            (line number, [name, band, quantity, price]) pairs
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line, text in enumerate(file, start=1):
+                if text.strip() == "":
+                    continue
+                try:
+                    row = json.loads(text)
+                    values = [row.get(field) for field in FIELDS]
+                except (ValueError, AttributeError):
+                    values = None
+                yield line, values
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, [row.get(field) for field in FIELDS]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import a supplier catalog into the stock table")
+    parser.add_argument("catalog", help="a .csv or .jsonl catalog file")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to import into")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="products written per transaction")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    db.create_tables()
+    imported, rejected = db.import_stock(read_catalog(arguments.catalog), arguments.chunk_size)
+    for line, values, reason in rejected:
+        print(f"line {line}: rejected {values}: {reason}")
+    print(f"Imported {imported} products, rejected {len(rejected)}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
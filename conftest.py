@@ -0,0 +1,51 @@
+import sys
+import os
+import sqlite3
+import pytest
+root = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, root)
+from database import database
+
+
+def seed(db: database) -> None:
+    """Creates the tables, and the products and sales every test starting from the template can rely on"""
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 20, 5.0])
+    db.create_update_stock(["Tee", "Oasis", 15, 12.0])
+    # Sale 1 is on an earlier day, and sale 2 is today
+    db.create_sale(["Hoodie", 5])
+    db.create_sale(["Hoodie", 5])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=?", ("2024-02-14 09:45:22", 1))
+    db.connection.commit()
+    db.rebuild_totals()
+
+
+def clone(data: bytes) -> database:
+    """Returns a new private in-memory database holding a copy of a serialised template"""
+    db = database(":memory:")
+    template = sqlite3.connect(":memory:")
+    template.deserialize(data)
+    template.backup(db.connection)
+    template.close()
+    db.cache.invalidate()
+    return db
+
+
+# Built once per session, then copied page by page into each test's database, which is far quicker than
+# running the migrations and seed again
+@pytest.fixture(scope="session")
+def template():
+    db = database(":memory:")
+    seed(db)
+    data = db.connection.serialize()
+    db.close_db()
+    return data
+
+
+# A fresh seeded database for every test, held in memory, so tests neither touch the StockSales.db file
+# nor depend on the order they run in, and can run in parallel
+@pytest.fixture
+def db(template):
+    db = clone(template)
+    yield db
+    db.close_db()
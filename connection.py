@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Dict, List
+from urllib.parse import quote
+from cache import inventoryCache
+
+
+DEFAULT_PRAGMAS: Dict = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -16000,
+    "busy_timeout": 5000,
+}
+
+# Where the database lives: a file on disk, memory only, or memory that is written to disk at an interval
+STORAGE_MODES = ("file", "memory", "checkpointed")
+
+# Held while a checkpoint writes its file, so two managers checkpointing the same path take turns
+_checkpoint_lock = threading.Lock()
+
+
+class connectionManager:
+    """
+    This class owns the SQLite connections shared by every database instance in the application.
+
+    There is a single writer connection, so sales are serialised through one handle,
+    and a separate read-only connection per thread, so reports never wait on the till.
+
+    In the memory modes the database is held by SQLite's memdb VFS. A database named after a file path is shared
+    by every manager in the process opened on that path, while ":memory:" gives each manager a database of its own.
+    Memory databases use a rollback journal rather than WAL, so a commit waits for open reads to finish.
+
+    Attributes:
+        path: the location of the database file, or ":memory:"
+        pragmas: the PRAGMA settings applied to every connection that is opened
+        storage (str): "file", "memory", or "checkpointed", which holds the database in memory and writes it to path
+        uri (str): the memdb URI connections open in the memory modes, otherwise None
+        checkpoint_interval (float): seconds between checkpoints in checkpointed mode
+        checkpoint_error: the exception raised by the last checkpoint taken in the background, or None
+        checkpoints_started (int): the number of the last checkpoint to start copying the memory database
+        checkpoints_written (int): the number of the last checkpoint whose copy is safely in the database file
+        readers: every read connection that has been opened, so they can be closed together
+        cache (inventoryCache): the product cache shared by every database instance using this manager
+
+    Methods:
+        __init__: Initializes the connectionManager class
+        connect: Opens a new connection with the configured PRAGMAs, and foreign keys, applied
+        writer: Returns the shared writer connection, opening it on first use
+        reader: Returns the calling thread's read-only connection, opening it on first use
+        release: Closes the calling thread's read-only connection, before the thread finishes
+        load: Copies the database file into memory, in checkpointed mode
+        checkpoint: Writes the memory database to the database file
+        run_checkpoints: The checkpoint threads loop, in checkpointed mode
+        close: Closes the writer and every reader connection, after a final checkpoint
+    """
+
+    def __init__(self, path: str = "StockSales.db", pragmas: Dict = None, storage: str = None, checkpoint_interval: float = 60) -> None:
+        """
+        Initializes the connectionManager class
+
+            Parameters:
+                path (str): the database file, or ":memory:" for a private memory database
+                pragmas (dict): the PRAGMA settings for every connection, DEFAULT_PRAGMAS when None
+                storage (str): one of STORAGE_MODES, "memory" when path is ":memory:" and "file" otherwise
+                checkpoint_interval (float): seconds between checkpoints in checkpointed mode
+        """
+        self.path = path
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.storage = storage or ("memory" if path == ":memory:" else "file")
+        if self.storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode {self.storage}, expected one of {', '.join(STORAGE_MODES)}")
+        if path == ":memory:" and self.storage != "memory":
+            raise ValueError(f"{self.storage.capitalize()} storage needs a database file")
+        self.uri = None
+        if self.storage != "file":
+            # memdb only shares a database between connections when its name starts with a slash
+            name = f"/memory-{uuid.uuid4().hex}" if path == ":memory:" else "/" + os.path.abspath(path).lstrip("/")
+            self.uri = f"file:{quote(name)}?vfs=memdb"
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_error = None
+        self.checkpoints_started: int = 0
+        self.checkpoints_written: int = 0
+        self.readers: List = []
+        self._writer = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.cache = inventoryCache(self)
+        self.checkpointer = None
+        if self.storage == "checkpointed":
+            self.load()
+            self.checkpointer = threading.Thread(target=self.run_checkpoints, name="checkpointer", daemon=True)
+            self.checkpointer.start()
+
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new connection to the database and applies the configured PRAGMAs"""
+        if self.uri is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {pragma}={value}")
+        # Required rather than tuning: SQLite only enforces foreign keys when they are enabled per connection
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+
+    def writer(self) -> sqlite3.Connection:
+        """Returns the single writer connection"""
+        with self._lock:
+            if self._writer is None:
+                self._writer = self.connect()
+            return self._writer
+
+
+    def reader(self) -> sqlite3.Connection:
+        """Returns a read-only connection owned by the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            connection.execute("PRAGMA query_only=ON")
+            self._local.connection = connection
+            with self._lock:
+                self.readers.append(connection)
+        return connection
+
+
+    def release(self) -> None:
+        """Closes the read-only connection owned by the calling thread, for threads that finish before the manager is closed"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+        self._local.connection = None
+        with self._lock:
+            self.readers.remove(connection)
+        connection.close()
+
+
+    def load(self) -> None:
+        """
+        Copies the database file into memory, unless another manager in the process already holds it
+
+        The writer connection is opened here and kept until close, which keeps the memory database alive.
+        """
+        writer = self.writer()
+        if writer.execute("""PRAGMA page_count""").fetchone()[0] or not os.path.exists(self.path):
+            return
+        disk = sqlite3.connect(self.path)
+        try:
+            # Serialising reads through any WAL left beside the file, and the header is then marked as a rollback
+            # journal database, as memdb cannot open one marked as WAL
+            data = bytearray(disk.serialize())
+        finally:
+            disk.close()
+        if not data:
+            return
+        data[18:20] = b"\x01\x01"
+        copy = sqlite3.connect(":memory:")
+        try:
+            copy.deserialize(bytes(data))
+            copy.backup(writer)
+        finally:
+            copy.close()
+
+
+    def checkpoint(self) -> int:
+        """
+        Writes a consistent copy of the memory database over the database file
+
+        The copy is taken inside one read transaction on a connection of its own, written to a temporary
+        file and synced, then renamed over the database file, so the file on disk is always complete.
+
+            Returns:
+                size (int): the number of bytes written
+        """
+        with _checkpoint_lock:
+            # Numbered before the copy is taken, so a checkpoint started after a commit is known to include it
+            self.checkpoints_started += 1
+            number = self.checkpoints_started
+            connection = self.connect()
+            try:
+                connection.execute("""BEGIN""")
+                connection.execute("""SELECT COUNT(*) FROM sqlite_master""").fetchone()
+                data = connection.serialize()
+                connection.rollback()
+            finally:
+                connection.close()
+            with open(self.path + ".partial", "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(self.path + ".partial", self.path)
+            self.checkpoints_written = number
+        return len(data)
+
+
+    def run_checkpoints(self) -> None:
+        """Checkpoints every checkpoint_interval seconds until the manager is closed"""
+        while not self._stopped.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+                self.checkpoint_error = None
+            except (sqlite3.Error, OSError) as exception:
+                # Kept for the application to report, and tried again at the next interval
+                self.checkpoint_error = exception
+
+
+    def close(self) -> None:
+        """Closes every connection opened by this manager, checkpointing first in checkpointed mode"""
+        if self.checkpointer is not None:
+            self._stopped.set()
+            self.checkpointer.join()
+            self.checkpointer = None
+            self.checkpoint()
+        with self._lock:
+            for connection in self.readers:
+                connection.close()
+            self.readers = []
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        self.cache.invalidate()
+        self._local = threading.local()
@@ -1,5 +1,72 @@
+import heapq
+import os
 import sqlite3
-from typing import List
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Tuple
+from connection import connectionManager
+
+
+# Bumped whenever create_tables changes, so databases already at this version skip the DDL
+SCHEMA_VERSION: int = 7
+
+# Where sales of products deleted before products had integer ids are kept when those databases are upgraded
+DELETED_BAND: str = "Deleted products"
+UNKNOWN_PRODUCT: str = "Unknown product"
+
+
+def day_bounds(day: date = None) -> Tuple:
+    """
+    Returns the half-open [start, end) timestamp range covering a single day
+
+    Comparing the raw timestamp column against these bounds lets SQLite use an index,
+    where wrapping the column in DATE() forces it to evaluate every row.
+
+        Parameters:
+            day (date): the day to cover, defaulting to the current UTC day used by CURRENT_TIMESTAMP
+    """
+    if day is None:
+        day = datetime.now(timezone.utc).date()
+    return day.isoformat(), (day + timedelta(days=1)).isoformat()
+
+
+def period_bounds(period: str) -> Tuple:
+    """Returns the [start, end) day range covered by a period, written as YYYY for a year or YYYY-MM for a month"""
+    if len(period) == 4:
+        return f"{period}-01-01", f"{int(period) + 1}-01-01"
+    year, month = int(period[:4]), int(period[5:7])
+    return f"{period}-01", (f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01")
+
+
+def validate_stock(values: List) -> List:
+    """
+    Checks a products details with the rules used by the add stock page
+
+    The name and band must not be blank, and the quantity and price must be greater than zero.
+
+        Parameters:
+            values (list): the products [name, band, quantity, price], which may be strings read from a file
+
+        Returns:
+            values (list): the details converted to [str, str, int, float]
+
+        Raises:
+            ValueError: describing the first rule the details break
+    """
+    if values is None or len(values) != 4:
+        raise ValueError("expected name, band, quantity and price")
+    name, band, quantity, price = values
+    if name is None or str(name).strip() == "":
+        raise ValueError("name is blank")
+    if band is None or str(band).strip() == "":
+        raise ValueError("band is blank")
+    quantity = int(quantity)
+    price = float(price)
+    if quantity <= 0:
+        raise ValueError("quantity must be greater than zero")
+    if price <= 0:
+        raise ValueError("price must be greater than zero")
+    return [str(name).strip(), str(band).strip(), quantity, price]
 
 
 
@@ -8,120 +75,1016 @@ class database:
     This class manages the database, and controls the SQL requests that executed.
     
     Attributes:
-        connection: stores the connection request to the database using sqlite3
+        manager: the connectionManager that owns the SQLite connections, which may be shared between instances
+        connection: the shared writer connection, used for every write request
+        reader: a read-only connection, used by the retrieve methods so reports never block the till
+        cache (inventoryCache): the manager's product cache, kept up to date by every write method
+        commission: the share of gross revenue kept by the shop, the rest is owed to the band
 
     Methods:
         __init__: Initializes the database class
-        create_tables: Creates both the stockItems and sales tables if they do not already exist
+        create_tables: Creates the bands, stockItems and sales tables if they do not already exist, migrating older databases
+        rebuild_totals: Recalculates the running bandTotals from the raw sales records
+        verify_totals: Compares the running bandTotals against the raw sales records, and optionally repairs them
+        close_day: Rolls a days sales up into dailyRollups, per band and product
+        close_days: Closes every day before today that has not been closed yet
+        backfill_rollups: Closes every day of existing sales history
         create_update_stock: Uses the values passed in to create a new product record, or update an existing record
+        import_stock: Validates and upserts a stream of products in chunked transactions
         update_stock_quantity: Updates the products quantity by either adding or subtracting a sales records quantity
-        delete_stock: deletes specified product from stockItems table
+        reserve_stock: Atomically takes stock for a product, only if enough is available
+        rename_stock: Renames a product without touching its sales
+        delete_stock: deletes a product that has never been sold from the stockItems table
         create_sale: Uses the values passed in to create a new sales record
+        checkout: Records a whole cart of sales and their stock changes in a single transaction
+        checkout_carts: Records several carts, from different tills, in one shared transaction
         delete_sale: deletes specified sale from stockItems table
+        journal_position: Returns the last sale journal entry that has been applied
+        void_sale: Deletes a sale and returns its quantity to stock in a single transaction
         retrieve_inventory: retrieves all records in the stockItems table
-        retrieve_quantity: retrieves the quantity for a specific product
+        retrieve_inventory_page: retrieves one page of filtered products, after a name cursor
+        retrieve_quantity: retrieves the quantity for a specific product, from the inventory cache when possible
+        search_products: finds the products whose name or band match the words typed so far
         retrieve_sales: retrieves all records in the sales table
-        retrieve_total_payments: calculates both the net and gross totals owed to the current days band
+        retrieve_sales_page: retrieves one page of filtered sales, newest first, before an id cursor
+        retrieve_total_payments: reads both the net and gross totals owed to the current days band
+        retrieve_band_totals: reads the gross and net totals owed to every band that sold today
+        report_totals: reports units, gross and net per band for any date range and set of bands
+        report_products: reports units, gross and net per band and product for any date range and set of bands
+        iter_sales: streams the sales records for a date range, and optionally a set of bands, in fixed-size batches
+        iter_inventory: streams every record in the stockItems table in fixed-size batches
+        backup: copies an online snapshot of the database in small steps, and verifies it
+        restore: replaces the database with a verified snapshot
     """
 
-    def __init__(self) -> None:
-        """Initializes the database class"""
-        self.connection = sqlite3.connect("StockSales.db")
+    def __init__(self, path: str = "StockSales.db", manager: connectionManager = None, commission: float = 0.25, storage: str = None) -> None:
+        """
+        Initializes the database class
+
+            Parameters:
+                path (str): the database file to open when no manager is passed in, or ":memory:"
+                manager (connectionManager): an existing manager whose connections should be shared
+                commission (float): the share of gross revenue kept by the shop
+                storage (str): how a new manager stores the database, "file", "memory" or "checkpointed"
+        """
+        self.commission = commission
+        self.owns_manager: bool = manager is None
+        self.manager = connectionManager(path, storage=storage) if manager is None else manager
+        self.connection = self.manager.writer()
+        self.reader = self.manager.reader()
+        self.cache = self.manager.cache
 
     
     def create_tables(self) -> None:
-        """Executes SQL command to create both stockItems table and sales table, if they do not exist"""
+        """
+        Executes SQL command to create the bands, stockItems and sales tables, and their indexes, if they do not exist
+
+        Databases whose PRAGMA user_version is already SCHEMA_VERSION are current, and skip the DDL entirely.
+        Databases from before products had integer ids are migrated to them, and sales tables whose foreign key
+        deleted a product's sales with it, or whose ids could be handed out again, are rebuilt, in the same
+        transaction as the DDL
+        """
         cursor = self.connection.cursor()
-        cursor.execute("""CREATE TABLE IF NOT EXISTS stockItems (
-                       name TEXT PRIMARY KEY,
-                       band TEXT,
-                       quantity INTEGER,
-                       price REAL,
-                       timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
-        cursor.execute("""CREATE TABLE IF NOT EXISTS sales (
-                       id INTEGER PRIMARY KEY,
-                       stockItemID TEXT,
-                       quantity INTEGER,
-                       timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                       price REAL,
-                       FOREIGN KEY (stockItemID) REFERENCES StockItems(name))""")
+        if cursor.execute("""PRAGMA user_version""").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        if cursor.execute("""SELECT COUNT(*) FROM sqlite_master""").fetchone()[0] == 0:
+            # Only possible before the first table exists, and lets archive.compact return freed pages without a full VACUUM
+            cursor.execute("""PRAGMA auto_vacuum=INCREMENTAL""")
+        # The worker, the journal and the archiver each create the tables on their own connection at startup, so the
+        # schema is only read once the write lock is held, and a connection that waited out another's migration stops here
+        cursor.execute("""BEGIN IMMEDIATE""")
+        try:
+            if cursor.execute("""PRAGMA user_version""").fetchone()[0] >= SCHEMA_VERSION:
+                self.connection.rollback()
+                return
+            columns: List = [row[1] for row in cursor.execute("""PRAGMA table_info(stockItems)""")]
+            legacy: bool = bool(columns) and "id" not in columns
+            sales_sql = cursor.execute("""SELECT sql FROM sqlite_master WHERE type='table' AND name='sales'""").fetchone()
+            retired: bool = not legacy and sales_sql is not None and ("ON DELETE CASCADE" in sales_sql[0] or "AUTOINCREMENT" not in sales_sql[0])
+            if legacy:
+                self._retire_legacy_tables(cursor)
+            if retired:
+                self._retire_sales(cursor)
+            cursor.execute("""CREATE TABLE IF NOT EXISTS bands (
+                           id INTEGER PRIMARY KEY,
+                           name TEXT NOT NULL UNIQUE)""")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS stockItems (
+                           id INTEGER PRIMARY KEY,
+                           name TEXT NOT NULL UNIQUE,
+                           bandID INTEGER NOT NULL REFERENCES bands (id),
+                           quantity INTEGER,
+                           price REAL,
+                           timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+            # Sales refer to their product by id, so renaming a product never rewrites its history,
+            # and are financial records, so a product that has been sold can never be deleted from under them.
+            # Their ids are never reused, even once archiving has emptied the table, as archives and voids refer to them
+            cursor.execute("""CREATE TABLE IF NOT EXISTS sales (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           stockItemID INTEGER NOT NULL REFERENCES stockItems (id) ON DELETE RESTRICT,
+                           quantity INTEGER,
+                           timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                           price REAL)""")
+            if legacy:
+                self._copy_legacy_tables(cursor)
+            if retired:
+                cursor.execute("""INSERT INTO sales (id, stockItemID, quantity, timestamp, price)
+                               SELECT id, stockItemID, quantity, timestamp, price FROM retiredSales ORDER BY id""")
+                cursor.execute("""DROP TABLE retiredSales""")
+            # products reads a product with its band's name, for the queries and the search index that report by name
+            cursor.execute("""CREATE VIEW IF NOT EXISTS products AS
+                           SELECT stockItems.id, stockItems.name, bands.name AS band, stockItems.quantity, stockItems.price, stockItems.timestamp
+                           FROM stockItems JOIN bands ON bands.id = stockItems.bandID""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS idx_stockItems_timestamp ON stockItems (timestamp)""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS idx_stockItems_band ON stockItems (bandID, name)""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales (timestamp, stockItemID, quantity, price)""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS idx_sales_stockItemID ON sales (stockItemID, timestamp, quantity, price)""")
+            # bandTotals holds a running gross and unit count per day and band, kept up to date by triggers on sales
+            totals_exist = cursor.execute("""SELECT 1 FROM sqlite_master WHERE type='table' AND name='bandTotals'""").fetchone()
+            cursor.execute("""CREATE TABLE IF NOT EXISTS bandTotals (
+                           day TEXT,
+                           bandID INTEGER REFERENCES bands (id),
+                           gross REAL DEFAULT 0,
+                           units INTEGER DEFAULT 0,
+                           PRIMARY KEY (day, bandID))""")
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_sales_insert_totals AFTER INSERT ON sales BEGIN
+                           INSERT INTO bandTotals (day, bandID, gross, units)
+                           SELECT DATE(NEW.timestamp), bandID, NEW.price * NEW.quantity, NEW.quantity FROM stockItems WHERE id = NEW.stockItemID
+                           ON CONFLICT (day, bandID) DO UPDATE SET gross = gross + excluded.gross, units = units + excluded.units;
+                           END""")
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_sales_delete_totals AFTER DELETE ON sales BEGIN
+                           UPDATE bandTotals SET gross = gross - OLD.price * OLD.quantity, units = units - OLD.quantity
+                           WHERE day = DATE(OLD.timestamp) AND bandID = (SELECT bandID FROM stockItems WHERE id = OLD.stockItemID);
+                           END""")
+            # Moving a product to another band moves the totals of its sales with it
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_stockItems_band_totals AFTER UPDATE OF bandID ON stockItems WHEN OLD.bandID != NEW.bandID BEGIN
+                           UPDATE bandTotals SET
+                           gross = gross - (SELECT SUM(price * quantity) FROM sales WHERE stockItemID = OLD.id AND timestamp >= bandTotals.day AND timestamp < DATE(bandTotals.day, '+1 day')),
+                           units = units - (SELECT SUM(quantity) FROM sales WHERE stockItemID = OLD.id AND timestamp >= bandTotals.day AND timestamp < DATE(bandTotals.day, '+1 day'))
+                           WHERE bandID = OLD.bandID AND day IN (SELECT DATE(timestamp) FROM sales WHERE stockItemID = OLD.id);
+                           INSERT INTO bandTotals (day, bandID, gross, units)
+                           SELECT DATE(timestamp), NEW.bandID, SUM(price * quantity), SUM(quantity) FROM sales WHERE stockItemID = NEW.id GROUP BY DATE(timestamp)
+                           ON CONFLICT (day, bandID) DO UPDATE SET gross = gross + excluded.gross, units = units + excluded.units;
+                           END""")
+            # dailyRollups holds units, gross and net per (day, band, product) for every day that has been closed,
+            # under the names they had when the day was closed
+            cursor.execute("""CREATE TABLE IF NOT EXISTS dailyRollups (
+                           day TEXT,
+                           band TEXT,
+                           product TEXT,
+                           units INTEGER,
+                           gross REAL,
+                           net REAL,
+                           PRIMARY KEY (day, band, product))""")
+            cursor.execute("""CREATE INDEX IF NOT EXISTS idx_dailyRollups_band ON dailyRollups (band, day)""")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS closedDays (day TEXT PRIMARY KEY)""")
+            # journalState holds the last sale journal entry applied, written in the same transaction as the sales it recorded
+            cursor.execute("""CREATE TABLE IF NOT EXISTS journalState (journal TEXT PRIMARY KEY, seq INTEGER)""")
+            # archives lists the files that closed days of sales have been moved to, one per period
+            cursor.execute("""CREATE TABLE IF NOT EXISTS archives (period TEXT PRIMARY KEY, path TEXT)""")
+            # productSearch is a full text index over product names and bands, reading its text from the products view by id
+            search_exists = cursor.execute("""SELECT 1 FROM sqlite_master WHERE type='table' AND name='productSearch'""").fetchone()
+            cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS productSearch USING fts5(name, band, content='products', content_rowid='id', prefix='1 2 3')""")
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_stockItems_insert_search AFTER INSERT ON stockItems BEGIN
+                           INSERT INTO productSearch (rowid, name, band) SELECT NEW.id, NEW.name, name FROM bands WHERE id = NEW.bandID;
+                           END""")
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_stockItems_delete_search AFTER DELETE ON stockItems BEGIN
+                           INSERT INTO productSearch (productSearch, rowid, name, band) SELECT 'delete', OLD.id, OLD.name, name FROM bands WHERE id = OLD.bandID;
+                           END""")
+            # Only renames and band changes touch the index, so the stock updates made by every sale stay cheap
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_stockItems_update_search AFTER UPDATE OF name, bandID ON stockItems
+                           WHEN OLD.name != NEW.name OR OLD.bandID != NEW.bandID BEGIN
+                           INSERT INTO productSearch (productSearch, rowid, name, band) SELECT 'delete', OLD.id, OLD.name, name FROM bands WHERE id = OLD.bandID;
+                           INSERT INTO productSearch (rowid, name, band) SELECT NEW.id, NEW.name, name FROM bands WHERE id = NEW.bandID;
+                           END""")
+            if search_exists is None:
+                cursor.execute("""INSERT INTO productSearch (productSearch) VALUES ('rebuild')""")
+            if totals_exist is None:
+                self._sum_totals(cursor)
+            cursor.execute(f"""PRAGMA user_version={SCHEMA_VERSION}""")
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+
+
+    def _retire_legacy_tables(self, cursor) -> None:
+        """
+        Renames the stockItems and sales tables keyed by product name out of the way, inside the callers transaction
+
+        Their triggers, indexes, running totals and search index all refer to product names, so they are dropped
+        and rebuilt once the rows have been copied into the new tables
+        """
+        for kind, name in cursor.execute("""SELECT type, name FROM sqlite_master WHERE type='trigger' OR (type='index' AND tbl_name IN ('stockItems', 'sales') AND sql IS NOT NULL)""").fetchall():
+            cursor.execute(f"""DROP {kind.upper()} {name}""")
+        cursor.execute("""DROP TABLE IF EXISTS productSearch""")
+        cursor.execute("""DROP TABLE IF EXISTS bandTotals""")
+        cursor.execute("""ALTER TABLE sales RENAME TO legacySales""")
+        cursor.execute("""ALTER TABLE stockItems RENAME TO legacyStockItems""")
+
+
+    def _retire_sales(self, cursor) -> None:
+        """
+        Renames a sales table whose foreign key cascaded product deletes, or without AUTOINCREMENT ids, out of the way,
+        inside the callers transaction
+
+        SQLite cannot change a foreign key or a primary key in place, so the rows are copied into a new sales table,
+        which starts its ids after the highest one copied. The triggers that read sales, and its indexes, are
+        dropped first, so they are rebuilt against the new table
+        """
+        for kind, name in cursor.execute("""SELECT type, name FROM sqlite_master WHERE (type='trigger' AND sql LIKE '%sales%') OR (type='index' AND tbl_name='sales' AND sql IS NOT NULL)""").fetchall():
+            cursor.execute(f"""DROP {kind.upper()} {name}""")
+        cursor.execute("""ALTER TABLE sales RENAME TO retiredSales""")
+
+
+    def _copy_legacy_tables(self, cursor) -> None:
+        """
+        Copies the products and sales keyed by name into the new tables, giving each band and product an integer id
+
+        Sales keep their ids. Every sale is copied, including sales of products that had been deleted, which are
+        kept under a product restored with their name, no stock and the price of its last sale, in the
+        DELETED_BAND band. Sales with no product name at all are kept under UNKNOWN_PRODUCT.
+        """
+        cursor.execute("""INSERT INTO bands (name) SELECT DISTINCT IFNULL(band, '') FROM legacyStockItems ORDER BY 1""")
+        cursor.execute("""INSERT INTO stockItems (name, bandID, quantity, price, timestamp)
+                       SELECT legacy.name, bands.id, legacy.quantity, legacy.price, legacy.timestamp
+                       FROM legacyStockItems AS legacy JOIN bands ON bands.name = IFNULL(legacy.band, '') ORDER BY legacy.rowid""")
+        # SQLite takes the bare price and timestamp from the row holding MAX(id), so each product gets its last sale's
+        orphans: str = """SELECT IFNULL(stockItemID, ?) AS name, price, timestamp, MAX(id) FROM legacySales
+                          WHERE IFNULL(stockItemID, ?) NOT IN (SELECT name FROM legacyStockItems) GROUP BY 1"""
+        if cursor.execute(orphans, (UNKNOWN_PRODUCT, UNKNOWN_PRODUCT)).fetchone() is not None:
+            cursor.execute("""INSERT OR IGNORE INTO bands (name) VALUES (?)""", (DELETED_BAND, ))
+            cursor.execute(f"""INSERT INTO stockItems (name, bandID, quantity, price, timestamp)
+                           SELECT orphans.name, bands.id, 0, orphans.price, orphans.timestamp FROM ({orphans}) AS orphans
+                           JOIN bands ON bands.name = ? ORDER BY orphans.name""", (UNKNOWN_PRODUCT, UNKNOWN_PRODUCT, DELETED_BAND))
+        cursor.execute("""INSERT INTO sales (id, stockItemID, quantity, timestamp, price)
+                       SELECT legacy.id, stockItems.id, legacy.quantity, legacy.timestamp, legacy.price
+                       FROM legacySales AS legacy JOIN stockItems ON stockItems.name = IFNULL(legacy.stockItemID, ?) ORDER BY legacy.id""", (UNKNOWN_PRODUCT, ))
+        cursor.execute("""DROP TABLE legacySales""")
+        cursor.execute("""DROP TABLE legacyStockItems""")
+
+
+    def rebuild_totals(self) -> None:
+        """Recalculates every row of the bandTotals table from the raw sales records"""
+        cursor = self.connection.cursor()
+        self._sum_totals(cursor)
+        self.connection.commit()
+
+
+    def _sum_totals(self, cursor) -> None:
+        """Replaces the bandTotals rows with totals summed from the raw sales records, inside the callers transaction"""
+        cursor.execute("""DELETE FROM bandTotals""")
+        cursor.execute("""INSERT INTO bandTotals (day, bandID, gross, units)
+                       SELECT DATE(sales.timestamp), stockItems.bandID, SUM(sales.price * sales.quantity), SUM(sales.quantity)
+                       FROM sales JOIN stockItems ON stockItems.id = sales.stockItemID
+                       GROUP BY DATE(sales.timestamp), stockItems.bandID ORDER BY MIN(sales.id)""")
+
+
+    def verify_totals(self, repair: bool = True) -> List:
+        """
+        Checks the running bandTotals against totals recalculated from the raw sales records
+
+            Parameters:
+                repair (bool): when True, the bandTotals table is rebuilt if any difference is found
+
+            Returns:
+                mismatches (list): a (day, band, stored gross, actual gross, stored units, actual units) tuple for each difference
+        """
+        cursor = self.reader.cursor()
+        stored: dict = {(row[0], row[1]): (row[2], row[3]) for row in cursor.execute("""SELECT day, bands.name, gross, units FROM bandTotals JOIN bands ON bands.id = bandTotals.bandID WHERE units != 0""")}
+        actual: dict = {(row[0], row[1]): (row[2], row[3]) for row in cursor.execute("""SELECT DATE(sales.timestamp), products.band, SUM(sales.price * sales.quantity), SUM(sales.quantity)
+                                                                                        FROM sales JOIN products ON products.id = sales.stockItemID
+                                                                                        GROUP BY DATE(sales.timestamp), products.band""")}
+        mismatches: List = []
+        for key in sorted(set(stored) | set(actual), key=str):
+            stored_gross, stored_units = stored.get(key, (0, 0))
+            actual_gross, actual_units = actual.get(key, (0, 0))
+            if stored_units != actual_units or abs(stored_gross - actual_gross) > 0.005:
+                mismatches.append((key[0], key[1], stored_gross, actual_gross, stored_units, actual_units))
+        if mismatches and repair:
+            self.rebuild_totals()
+        return mismatches
 
     
+    def close_day(self, day: date) -> int:
+        """
+        Rolls the sales for one day up into dailyRollups, replacing any earlier rollup for that day
+
+        Net is calculated with the commission in force when the day is closed
+
+            Parameters:
+                day (date): the day to close
+
+            Returns:
+                rows (int): the number of (band, product) rows written
+        """
+        cursor = self.connection.cursor()
+        try:
+            rows: int = self._rollup_day(cursor, day)
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        return rows
+
+
+    def _rollup_day(self, cursor, day: date) -> int:
+        """Rewrites one days dailyRollups rows and marks it closed, inside the callers transaction"""
+        start, end = day_bounds(day)
+        cursor.execute("""DELETE FROM dailyRollups WHERE day=?""", (start, ))
+        cursor.execute("""INSERT INTO dailyRollups (day, band, product, units, gross, net)
+                       SELECT ?, products.band, products.name, SUM(sales.quantity), SUM(sales.price * sales.quantity), SUM(sales.price * sales.quantity) * ?
+                       FROM sales JOIN products ON products.id = sales.stockItemID
+                       WHERE sales.timestamp >= ? AND sales.timestamp < ?
+                       GROUP BY products.band, products.name""", (start, 1 - self.commission, start, end))
+        rows: int = cursor.rowcount
+        cursor.execute("""INSERT OR IGNORE INTO closedDays (day) VALUES (?)""", (start, ))
+        return rows
+
+
+    def close_days(self) -> List:
+        """
+        Closes every day with sales, before today, that is later than the last closed day
+
+            Returns:
+                days (list): the days that were closed
+        """
+        cursor = self.reader.cursor()
+        last = cursor.execute("""SELECT MAX(day) FROM closedDays""").fetchone()[0]
+        start = day_bounds(date.fromisoformat(last))[1] if last else ""
+        return self._close_days_from(start)
+
+
+    def backfill_rollups(self) -> List:
+        """
+        Closes, or re-closes, every day of sales history before today
+
+            Returns:
+                days (list): the days that were closed
+        """
+        return self._close_days_from("")
+
+
+    def _close_days_from(self, start: str) -> List:
+        """Closes each day with sales from start up to, but not including, today"""
+        cursor = self.reader.cursor()
+        today = day_bounds()[0]
+        days: List = [row[0] for row in cursor.execute("""SELECT DISTINCT DATE(timestamp) FROM sales WHERE timestamp >= ? AND timestamp < ?""", (start, today))]
+        for day in days:
+            self.close_day(date.fromisoformat(day))
+        return days
+
+
     def create_update_stock(self, values: List) -> None:
 
         cursor = self.connection.cursor()
-        cursor.execute("""INSERT OR REPLACE INTO stockItems (name, band, quantity, price) VALUES (?,?,?,?)""", (values[0], values[1], values[2], values[3]))
-        self.connection.commit()
+        try:
+            self._upsert_stock(cursor, [values])
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        self.cache.put(values[0], values[2], values[3], values[1])
+
+
+    def _upsert_stock(self, cursor, rows: List) -> None:
+        """
+        Creates or updates products from [name, band, quantity, price] rows, adding any new bands, inside the callers transaction
+
+        An existing product is updated in place, so it keeps its id and its sales
+        """
+        cursor.executemany("""INSERT OR IGNORE INTO bands (name) VALUES (?)""", [(row[1], ) for row in rows])
+        cursor.executemany("""INSERT INTO stockItems (name, bandID, quantity, price) SELECT ?, id, ?, ? FROM bands WHERE name=?
+                           ON CONFLICT (name) DO UPDATE SET bandID=excluded.bandID, quantity=excluded.quantity, price=excluded.price, timestamp=excluded.timestamp""",
+                           [(row[0], row[2], row[3], row[1]) for row in rows])
+
+    
+    def import_stock(self, rows: Iterable, chunk_size: int = 1000) -> Tuple:
+        """
+        Creates or updates every valid product in a stream of rows, committing one chunk at a time
+
+        Rows are consumed lazily, so memory use does not grow with the size of the catalog.
+        Invalid rows are collected and reported, without stopping the import.
+
+            Parameters:
+                rows (iterable): (line number, [name, band, quantity, price]) pairs, such as those yielded by catalog.read_catalog
+                chunk_size (int): the number of products written per executemany and commit
+
+            Returns:
+                imported (int): the number of products created or updated
+                rejected (list): a (line number, values, reason) tuple for each invalid row
+        """
+        cursor = self.connection.cursor()
+        imported: int = 0
+        rejected: List = []
+        chunk: List = []
+        for line, values in rows:
+            try:
+                chunk.append(validate_stock(values))
+            except (ValueError, TypeError) as error:
+                rejected.append((line, values, str(error)))
+                continue
+            if len(chunk) >= chunk_size:
+                imported += self._write_stock_chunk(cursor, chunk)
+                chunk = []
+        if chunk:
+            imported += self._write_stock_chunk(cursor, chunk)
+        return imported, rejected
+
+
+    def _write_stock_chunk(self, cursor, chunk: List) -> int:
+        """Upserts a chunk of validated products in a single transaction, and returns how many were written"""
+        try:
+            self._upsert_stock(cursor, chunk)
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        for values in chunk:
+            self.cache.invalidate(values[0])
+        return len(chunk)
 
     
     def update_stock_quantity(self, name: str, quantity: int) -> None:
 
         cursor = self.connection.cursor()
-        oldquantity: int = cursor.execute("""SELECT quantity FROM stockItems WHERE name=?""", (name, )).fetchone()
-        newquantity: int = oldquantity[0] - quantity
-        cursor.execute("""UPDATE stockItems SET quantity=? WHERE name=?""", (newquantity, name, ))
+        # Subtracting inside the UPDATE means a concurrent change between a read and a write can never be lost
+        cursor.execute("""UPDATE stockItems SET quantity=quantity-? WHERE name=?""", (quantity, name, ))
         self.connection.commit()
+        self.cache.adjust(name, -quantity)
+
+
+    def reserve_stock(self, name: str, quantity: int, retries: int = 5, backoff: float = 0.01) -> bool:
+        """
+        Takes quantity units of a product out of stock, only if that many are available
+
+        The stock check is part of the UPDATE's WHERE clause, so two tills can never both take the last unit.
+        When another process holds the write lock beyond the busy timeout, the attempt is retried with exponential backoff.
+
+            Parameters:
+                name (str): the product to reserve
+                quantity (int): the number of units to take, which must be greater than zero
+                retries (int): how many times to retry while the database is locked
+                backoff (float): seconds to wait before the first retry, doubling after each one
+
+            Returns:
+                reserved (bool): False when the product does not exist or has insufficient stock
+
+            Raises:
+                sqlite3.OperationalError: if the database is still locked after every retry
+        """
+        if quantity <= 0:
+            raise ValueError("quantity must be greater than zero")
+        cursor = self.connection.cursor()
+        for attempt in range(retries + 1):
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error) or attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+        try:
+            cursor.execute("""UPDATE stockItems SET quantity=quantity-? WHERE name=? AND quantity>=?""", (quantity, name, quantity))
+            reserved: bool = cursor.rowcount == 1
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        if reserved:
+            self.cache.adjust(name, -quantity)
+        return reserved
 
     
+    def rename_stock(self, name: str, new_name: str) -> None:
+        """
+        Renames a product, keeping its stock and its sales
+
+        Sales refer to the product by id, so a rename updates one row however many sales the product has
+
+            Raises:
+                sqlite3.IntegrityError: if another product already has the new name
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("""UPDATE stockItems SET name=? WHERE name=?""", (new_name, name))
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        self.cache.invalidate(name)
+        self.cache.invalidate(new_name)
+
+
     def delete_stock(self, name: str) -> None:
+        """
+        Deletes a product, as long as none of its sales are in the working database
+
+        Sales are financial records, which closed day rollups and exports still count, so they are never deleted
+        with their product. A product that has been sold is taken off sale by setting its quantity to 0 instead.
 
+            Raises:
+                ValueError: if the product has sales
+        """
         cursor = self.connection.cursor()
-        cursor.execute("""DELETE FROM stockItems WHERE name=?""", (name, ))
-        self.connection.commit()
+        try:
+            cursor.execute("""DELETE FROM stockItems WHERE name=?""", (name, ))
+            self.connection.commit()
+        except sqlite3.IntegrityError:
+            self.connection.rollback()
+            raise ValueError(f"{name} has been sold, so it cannot be deleted. Set its quantity to 0 to take it off sale.")
+        except:
+            self.connection.rollback()
+            raise
+        self.cache.invalidate(name)
 
     
     def create_sale(self, values: List) -> None:
 
         cursor = self.connection.cursor()
-        price: float = cursor.execute("""SELECT price FROM stockItems WHERE name=?""", (values[0], )).fetchone()[0]
-        cursor.execute("""INSERT INTO sales (stockItemID, quantity, price) VALUES (?,?,?)""", (values[0], values[1], price))
+        # The price is read by the INSERT itself, as the cache may not have noticed another till's change to it yet
+        cursor.execute("""INSERT INTO sales (stockItemID, quantity, price) SELECT id, ?, price FROM stockItems WHERE name=?""", (values[1], values[0]))
         self.connection.commit()
 
     
+    def checkout(self, cart: List) -> List:
+        """
+        Records every line of a cart as a sale, and decrements the stock, in a single transaction
+
+        Lines for unknown products, or for more than the available stock, are rejected and not recorded.
+        The remaining lines are written with one executemany per table and a single commit.
+
+            Parameters:
+                cart (list): a list of [name, quantity] lines
+
+            Returns:
+                results (list): a (name, quantity, price, recorded) tuple for each line, in cart order
+        """
+        return [line[:4] for line in self.checkout_carts([cart])[0]]
+
+
+    def checkout_carts(self, carts: List, journal: str = None, seq: int = None, timestamps: List = None) -> List:
+        """
+        Records several carts in one shared transaction, so many tills pay for a single commit
+
+        Carts are applied in order, so each one sees the stock left by the carts before it,
+        exactly as if they had been checked out one after another.
+        Sales made on a day that has since been closed rewrite that day's rollups in the same transaction.
+
+            Parameters:
+                carts (list): a list of carts, each a list of [name, quantity] lines
+                journal (str): the sale journal the carts were read from, if any
+                seq (int): the journal entry of the last cart, recorded in the same transaction so it is never applied twice
+                timestamps (list): when each cart was sold, as UTC "YYYY-MM-DD HH:MM:SS" strings, where None means now
+
+            Returns:
+                results (list): for each cart, a (name, quantity, price, recorded, sale id) tuple per line,
+                with a sale id of None for rejected lines
+        """
+        cursor = self.connection.cursor()
+        results: List = []
+        sales: List = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            names: List = list({line[0] for cart in carts for line in cart})
+            placeholders: str = ",".join("?" * len(names))
+            stock: dict = {row[0]: [row[1], row[2], row[3]] for row in cursor.execute(f"""SELECT name, quantity, price, id FROM stockItems WHERE name IN ({placeholders})""", names)}
+            for cart, timestamp in zip(carts, timestamps or [None] * len(carts)):
+                lines: List = []
+                for name, quantity in cart:
+                    item = stock.get(name)
+                    if item is None or quantity <= 0 or quantity > item[0]:
+                        lines.append([name, quantity, item[1] if item else None, False, None])
+                        continue
+                    item[0] -= quantity
+                    sales.append((item[2], quantity, item[1], timestamp, name))
+                    lines.append([name, quantity, item[1], True, None])
+                results.append(lines)
+            cursor.executemany("""INSERT INTO sales (stockItemID, quantity, price, timestamp) VALUES (?,?,?,IFNULL(?, CURRENT_TIMESTAMP))""", [sale[:4] for sale in sales])
+            # The writer holds the only write lock, so the sales just inserted have consecutive ids
+            last: int = cursor.execute("""SELECT last_insert_rowid()""").fetchone()[0]
+            cursor.executemany("""UPDATE stockItems SET quantity=quantity-? WHERE id=?""", [(sale[1], sale[0]) for sale in sales])
+            days: List = sorted({sale[3][:10] for sale in sales if sale[3] is not None})
+            if days:
+                placeholders: str = ",".join("?" * len(days))
+                for row in cursor.execute(f"""SELECT day FROM closedDays WHERE day IN ({placeholders})""", days).fetchall():
+                    self._rollup_day(cursor, date.fromisoformat(row[0]))
+            if journal is not None:
+                cursor.execute("""INSERT INTO journalState (journal, seq) VALUES (?,?) ON CONFLICT (journal) DO UPDATE SET seq=excluded.seq""", (journal, seq))
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        id: int = last - len(sales) + 1
+        for lines in results:
+            for line in lines:
+                if line[3]:
+                    line[4] = id
+                    id += 1
+        for _, quantity, _, _, name in sales:
+            self.cache.adjust(name, -quantity)
+        return [[tuple(line) for line in lines] for lines in results]
+
+    
     def delete_sale(self, id: int) -> None:
 
         cursor = self.connection.cursor()
+        closed = cursor.execute("""SELECT closedDays.day FROM sales JOIN closedDays ON closedDays.day = DATE(sales.timestamp) WHERE sales.id=?""", (id, )).fetchone()
         cursor.execute("""DELETE FROM sales WHERE id=?""", (id, ))
         self.connection.commit()
+        if closed is not None:
+            self.close_day(date.fromisoformat(closed[0]))
 
     
-    def retrieve_inventory(self) -> List:
+    def journal_position(self, journal: str) -> int:
+        """Returns the last entry of a sale journal that has been applied, or 0 if none has"""
+        row = self.connection.execute("""SELECT seq FROM journalState WHERE journal=?""", (journal, )).fetchone()
+        return 0 if row is None else row[0]
+
 
+    def void_sale(self, id: int) -> bool:
+        """
+        Cancels a sale, returning its quantity to stock, in a single transaction
+
+        When the sale's day has already been closed, its rollups are rewritten in the same transaction
+
+            Parameters:
+                id (int): the sale to void
+
+            Returns:
+                voided (bool): False when there is no sale with that id
+        """
         cursor = self.connection.cursor()
-        inventory: List = cursor.execute("""SELECT name, band, quantity, price, timestamp FROM stockItems WHERE quantity > 0 AND DATE(timestamp)=DATE('now') ORDER BY name""").fetchall()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            sale = cursor.execute("""SELECT sales.stockItemID, sales.quantity, closedDays.day, stockItems.name FROM sales JOIN stockItems ON stockItems.id = sales.stockItemID
+                                  LEFT JOIN closedDays ON closedDays.day = DATE(sales.timestamp) WHERE sales.id=?""", (id, )).fetchone()
+            if sale is None:
+                self.connection.rollback()
+                return False
+            cursor.execute("""DELETE FROM sales WHERE id=?""", (id, ))
+            cursor.execute("""UPDATE stockItems SET quantity=quantity+? WHERE id=?""", (sale[1], sale[0]))
+            if sale[2] is not None:
+                self._rollup_day(cursor, date.fromisoformat(sale[2]))
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        self.cache.adjust(sale[3], sale[1])
+        return True
+
+
+    def retrieve_inventory(self) -> List:
+
+        cursor = self.reader.cursor()
+        inventory: List = cursor.execute("""SELECT name, band, quantity, price, timestamp FROM products WHERE quantity > 0 AND timestamp >= ? AND timestamp < ? ORDER BY name""", day_bounds()).fetchall()
+        return inventory
+
+    def retrieve_inventory_page(self, after: str = None, limit: int = 50, band: str = None, min_quantity: int = None, min_price: float = None, max_price: float = None, updated_from: date = None) -> List:
+        """
+        Retrieves one page of products ordered by name, using the name as a keyset cursor
+
+        Each page seeks straight to its first row through the name or band index, so later pages cost the same as the first
+
+            Parameters:
+                after (str): the name of the last product on the previous page, or None for the first page
+                limit (int): the number of products per page
+                band (str): only include this band's products
+                min_quantity (int): only include products with at least this much stock
+                min_price (float): only include products costing at least this much
+                max_price (float): only include products costing at most this much
+                updated_from (date): only include products added or updated on or after this day
+
+            Returns:
+                inventory (list): (name, band, quantity, price, timestamp) tuples
+        """
+        conditions: List = []
+        parameters: List = []
+        for condition, value in (("name > ?", after), ("band = ?", band), ("quantity >= ?", min_quantity), ("price >= ?", min_price), ("price <= ?", max_price),
+                                 ("timestamp >= ?", updated_from and day_bounds(updated_from)[0])):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where: str = f"""WHERE {" AND ".join(conditions)}""" if conditions else ""
+        cursor = self.reader.cursor()
+        inventory: List = cursor.execute(f"""SELECT name, band, quantity, price, timestamp FROM products {where} ORDER BY name LIMIT ?""", parameters + [limit]).fetchall()
         return inventory
 
+
     def retrieve_quantity(self, name: str) -> int:
 
-        cursor = self.connection.cursor()
-        quantity: int = cursor.execute("""SELECT quantity FROM stockItems WHERE name=?""", (name, )).fetchone()
-        return quantity
+        item = self.cache.get(name)
+        return None if item is None else (item[0], )
 
     
+    def search_products(self, query: str, limit: int = 10, in_stock: bool = False) -> List:
+        """
+        Finds products whose name or band contains words starting with each word typed, ordered by name
+
+        Lookups use the productSearch index, so only the products matching every word are read and sorted by name
+
+            Parameters:
+                query (str): the text typed so far, an empty query lists the first products by name
+                limit (int): the most products to return
+                in_stock (bool): only include products with stock left to sell
+
+            Returns:
+                products (list): (name, band, quantity, price) tuples
+        """
+        cursor = self.reader.cursor()
+        stock: str = """AND products.quantity > 0""" if in_stock else ""
+        words: List = query.split()
+        if not words:
+            return cursor.execute(f"""SELECT name, band, quantity, price FROM products WHERE 1 {stock} ORDER BY name LIMIT ?""", (limit, )).fetchall()
+        # Each word is quoted, so punctuation is searched for rather than read as query syntax, and matched as a prefix
+        match: str = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+        products: List = cursor.execute(f"""SELECT products.name, products.band, products.quantity, products.price
+                                        FROM productSearch JOIN products ON products.id = productSearch.rowid
+                                        WHERE productSearch MATCH ? {stock} ORDER BY products.name LIMIT ?""", (match, limit)).fetchall()
+        return products
+
+
     def retrieve_sales(self) -> List:
 
-        cursor = self.connection.cursor()
-        sales: List = cursor.execute("""SELECT sales.id, stockItems.name, stockItems.band, sales.quantity, sales.timestamp, sales.price FROM sales JOIN stockItems ON sales.stockItemID = stockItems.name WHERE DATE(sales.timestamp)=DATE('now')""").fetchall()
+        cursor = self.reader.cursor()
+        sales: List = cursor.execute("""SELECT sales.id, products.name, products.band, sales.quantity, sales.timestamp, sales.price FROM sales JOIN products ON products.id = sales.stockItemID WHERE sales.timestamp >= ? AND sales.timestamp < ?""", day_bounds()).fetchall()
         return sales
 
     
-    def retrieve_total_payments(self) -> List:
-        
-        sales: List = self.retrieve_sales()
-        gross: float = 0
-        net: float = 0
-        for sale in sales:
-            quantity: int = sale[3]
-            price: float = sale[5]
-            gross += price*quantity
-            net = gross * 0.75
+    def retrieve_band_totals(self, day: date = None) -> List:
+        """
+        Reads the totals owed to every band that sold on a day, from the running bandTotals table
+
+            Parameters:
+                day (date): the day to read, defaulting to today
+
+            Returns:
+                totals (list): a (band, gross, net, units) tuple for each band, in the order they first sold
+        """
+        cursor = self.reader.cursor()
+        totals: List = cursor.execute("""SELECT bands.name, gross, gross * ?, units FROM bandTotals JOIN bands ON bands.id = bandTotals.bandID WHERE day=? AND units > 0 ORDER BY bandTotals.rowid""", (1 - self.commission, day_bounds(day)[0])).fetchall()
+        return totals
+
+
+    def report_totals(self, start: date, end: date, bands: List = None) -> List:
+        """
+        Reports the units, gross and net for each band between two days, inclusive
+
+        Closed days are read from dailyRollups, and days that have not been closed from bandTotals,
+        so the raw sales table is never scanned.
+
+            Parameters:
+                start (date): the first day to include
+                end (date): the last day to include
+                bands (list): only report these bands, or every band when None
+
+            Returns:
+                totals (list): a (band, units, gross, net) tuple for each band, ordered by band
+        """
+        first, last = day_bounds(start)[0], end.isoformat()
+        band_filter, band_parameters = self._band_filter(bands)
+        totals_filter = self._band_filter(bands, "bands.name")[0]
+        cursor = self.reader.cursor()
+        totals: List = cursor.execute(f"""SELECT band, SUM(units), SUM(gross), SUM(net) FROM (
+                                              SELECT band, units, gross, net FROM dailyRollups WHERE day >= ? AND day <= ? {band_filter}
+                                              UNION ALL
+                                              SELECT bands.name, units, gross, gross * ? FROM bandTotals JOIN bands ON bands.id = bandTotals.bandID
+                                              WHERE day >= ? AND day <= ? {totals_filter}
+                                              AND day NOT IN (SELECT day FROM closedDays WHERE day >= ? AND day <= ?))
+                                          GROUP BY band ORDER BY band""",
+                                      [first, last, *band_parameters, 1 - self.commission, first, last, *band_parameters, first, last]).fetchall()
+        return totals
+
+
+    def report_products(self, start: date, end: date, bands: List = None) -> List:
+        """
+        Reports the units, gross and net for each band and product between two days, inclusive
+
+        Closed days are read from dailyRollups, and only the days that have not been closed are read from sales,
+        which includes days earlier than the last closed day, such as one a late journaled sale was booked to
+
+            Parameters:
+                start (date): the first day to include
+                end (date): the last day to include
+                bands (list): only report these bands, or every band when None
+
+            Returns:
+                totals (list): a (band, product, units, gross, net) tuple for each product, ordered by band and product
+        """
+        first, last = day_bounds(start)[0], end.isoformat()
+        band_filter, band_parameters = self._band_filter(bands)
+        sales_filter = self._band_filter(bands, "products.band")[0]
+        cursor = self.reader.cursor()
+        totals: List = cursor.execute(f"""SELECT band, product, SUM(units), SUM(gross), SUM(net) FROM (
+                                              SELECT band, product, units, gross, net FROM dailyRollups WHERE day >= ? AND day <= ? {band_filter}
+                                              UNION ALL
+                                              SELECT products.band, products.name, sales.quantity, sales.price * sales.quantity, sales.price * sales.quantity * ?
+                                              FROM sales JOIN products ON products.id = sales.stockItemID
+                                              WHERE sales.timestamp >= ? AND sales.timestamp < ? {sales_filter}
+                                              AND DATE(sales.timestamp) NOT IN (SELECT day FROM closedDays WHERE day >= ? AND day <= ?))
+                                          GROUP BY band, product ORDER BY band, product""",
+                                      [first, last, *band_parameters, 1 - self.commission, first, day_bounds(end)[1], *band_parameters, first, last]).fetchall()
+        return totals
+
+
+    def _sales_sources(self, start: str = None, end: str = None) -> List:
+        """
+        Returns a (connection, source) pair for the hot sales, and for each archive that may hold sales between start and end
+
+        Each source is a query with the columns (id, name, band, quantity, timestamp, price). Archives are opened
+        as read-only connections of their own rather than attached to the reader, as SQLite attaches at most ten
+        databases to a connection, and monthly archives pass that within a year. The first connection is the
+        reader, and the caller closes the rest with _close_sources.
+        """
+        sources: List = [(self.reader, """SELECT sales.id, products.name, products.band, sales.quantity, sales.timestamp, sales.price
+                                          FROM sales JOIN products ON products.id = sales.stockItemID""")]
+        for period, path in self.reader.execute("""SELECT period, path FROM archives ORDER BY period""").fetchall():
+            first, last = period_bounds(period)
+            if (end is not None and first >= end) or (start is not None and last <= start):
+                continue
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute("""PRAGMA query_only=ON""")
+            sources.append((connection, """SELECT id, name, band, quantity, timestamp, price FROM sales WHERE band IS NOT NULL"""))
+        return sources
+
+
+    def _close_sources(self, sources: List) -> None:
+        """Closes the archive connections opened by _sales_sources"""
+        for connection, _ in sources[1:]:
+            connection.close()
+
+
+    def _band_filter(self, bands: List, column: str = "band") -> Tuple:
+        """Returns an SQL condition restricting a query to a set of bands, and its parameters"""
+        if not bands:
+            return "", []
+        return f"""AND {column} IN ({",".join("?" * len(bands))})""", list(bands)
+
+
+    def iter_sales(self, start: date, end: date, bands: List = None, batch_size: int = 1000) -> Iterator:
+        """
+        Yields the sales records between two days, inclusive, without loading them all into memory
+
+            Parameters:
+                start (date): the first day to include
+                end (date): the last day to include
+                bands (list): only include sales for these bands, or every band when None
+                batch_size (int): the number of rows fetched from SQLite at a time
+
+            Yields:
+                (id, name, band, quantity, timestamp, price) tuples, in sale order
+        """
+        parameters: List = [day_bounds(start)[0], day_bounds(end)[1]]
+        condition: str = ""
+        if bands:
+            condition = f""" AND band IN ({",".join("?" * len(bands))})"""
+            parameters += list(bands)
+        sources: List = self._sales_sources(*parameters[:2])
         try:
-            band: str = sales[0][2]
-        except:
-            band: str = None  
+            streams: List = []
+            for connection, source in sources:
+                cursor = connection.cursor()
+                cursor.execute(f"""SELECT id, name, band, quantity, timestamp, price FROM ({source}) WHERE timestamp >= ? AND timestamp < ? {condition} ORDER BY timestamp, id""", parameters)
+                streams.append(self._iterate(cursor, batch_size))
+            # Every source is already in sale order, so merging them keeps the stream in order without sorting it again
+            yield from streams[0] if len(streams) == 1 else heapq.merge(*streams, key=lambda sale: (sale[4], sale[0]))
+        finally:
+            self._close_sources(sources)
+
+
+    def iter_inventory(self, batch_size: int = 1000) -> Iterator:
+        """
+        Yields a snapshot of every product, without loading them all into memory
+
+            Yields:
+                (name, band, quantity, price, timestamp) tuples, ordered by name
+        """
+        cursor = self.reader.cursor()
+        cursor.execute("""SELECT name, band, quantity, price, timestamp FROM products ORDER BY name""")
+        yield from self._iterate(cursor, batch_size)
+
+
+    def _iterate(self, cursor, batch_size: int) -> Iterator:
+        """Yields the rows of an executed cursor, fetching batch_size rows at a time"""
+        try:
+            while True:
+                rows: List = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    
+    def retrieve_sales_page(self, before: int = None, limit: int = 50, band: str = None, start: date = None, end: date = None) -> List:
+        """
+        Retrieves one page of sales, newest first, using the sale id as a keyset cursor
+
+        Each page seeks straight to its first row through the sales primary key, so later pages cost the same as the first
+
+            Parameters:
+                before (int): the id of the last sale on the previous page, or None for the first page
+                limit (int): the number of sales per page
+                band (str): only include this band's sales
+                start (date): only include sales on or after this day
+                end (date): only include sales on or before this day
+
+            Returns:
+                sales (list): (id, name, band, quantity, timestamp, price) tuples
+        """
+        conditions: List = []
+        parameters: List = []
+        for condition, value in (("id < ?", before), ("band = ?", band), ("timestamp >= ?", start and day_bounds(start)[0]), ("timestamp < ?", end and day_bounds(end)[1])):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where: str = f"""WHERE {" AND ".join(conditions)}""" if conditions else ""
+        sales: List = []
+        sources: List = self._sales_sources(start and day_bounds(start)[0], end and day_bounds(end)[1])
+        try:
+            # Each source returns its own newest page, and the newest of those make up the page
+            for connection, source in sources:
+                sales += connection.execute(f"""SELECT id, name, band, quantity, timestamp, price FROM ({source}) {where} ORDER BY id DESC LIMIT ?""", parameters + [limit]).fetchall()
+        finally:
+            self._close_sources(sources)
+        return sorted(sales, reverse=True)[:limit]
+
+    
+    def retrieve_total_payments(self) -> List:
+        """
+        Reads the current days totals from the running bandTotals table, with a single row lookup
+
+        The band is the first band to make a sale today, and net is what is owed to them after commission
+        """
+        cursor = self.reader.cursor()
+        totals = cursor.execute("""SELECT bands.name, gross FROM bandTotals JOIN bands ON bands.id = bandTotals.bandID WHERE day=? AND units > 0 ORDER BY bandTotals.rowid LIMIT 1""", (day_bounds()[0], )).fetchone()
+        if totals is None:
+            return 0, 0, None
+        band: str = totals[0]
+        gross: float = totals[1]
+        net: float = gross * (1 - self.commission)
         return gross, net, band
 
     
+    def backup(self, target: str, pages: int = 256, sleep: float = 0.005) -> None:
+        """
+        Copies a consistent snapshot of the database to target while the till keeps trading
+
+        The copy is made a few pages at a time, pausing between steps so it never hogs the disk or the GIL.
+        Every step reads from one read transaction on the reader connection, so in WAL mode the copy sees a
+        single consistent snapshot, writers are never blocked, and sales recorded meanwhile do not restart it.
+        The snapshot is checked with PRAGMA integrity_check before it is kept.
+
+            Parameters:
+                target (str): the snapshot file to write, replacing any existing file
+                pages (int): the number of pages copied per step
+                sleep (float): seconds to pause between steps
+
+            Raises:
+                sqlite3.DatabaseError: if the snapshot fails its integrity check, in which case it is deleted
+        """
+        snapshot = sqlite3.connect(target)
+        try:
+            self.reader.execute("""BEGIN""")
+            try:
+                self.reader.execute("""SELECT COUNT(*) FROM sqlite_master""").fetchone()
+                self.reader.backup(snapshot, pages=pages, sleep=sleep)
+            finally:
+                self.reader.rollback()
+            result = snapshot.execute("""PRAGMA integrity_check""").fetchall()
+        finally:
+            snapshot.close()
+        if result != [("ok", )]:
+            os.remove(target)
+            raise sqlite3.DatabaseError(f"backup failed its integrity check: {result[0][0]}")
+
+
+    def restore(self, source: str, pages: int = 256) -> None:
+        """
+        Replaces the contents of the database with a snapshot taken by backup
+
+        The snapshot is checked before anything is overwritten. The cache is cleared, and the tables are upgraded
+        if the snapshot was taken with an older schema.
+
+            Parameters:
+                source (str): the snapshot file to restore
+                pages (int): the number of pages copied per step
+
+            Raises:
+                sqlite3.DatabaseError: if the snapshot fails its integrity check
+        """
+        snapshot = sqlite3.connect(source)
+        try:
+            result = snapshot.execute("""PRAGMA integrity_check""").fetchall()
+            if result != [("ok", )]:
+                raise sqlite3.DatabaseError(f"snapshot failed its integrity check: {result[0][0]}")
+            snapshot.backup(self.connection, pages=pages)
+        finally:
+            snapshot.close()
+        self.cache.invalidate()
+        self.create_tables()
+
+
     def close_db(self) -> None:
-        self.connection.close()
+        if self.owns_manager:
+            self.manager.close()
         print("Database Closed")
@@ -0,0 +1,85 @@
+"""
+Streams sales and stock records to CSV or JSONL files, one batch at a time.
+
+The format is chosen from the output file's extension, .jsonl for JSON lines and CSV otherwise.
+
+Usage:
+    python export.py sales OUTPUT [--start 2024-01-01] [--end 2024-12-31] [--band BAND ...] [--db StockSales.db]
+    python export.py stock OUTPUT [--db StockSales.db]
+"""
+import argparse
+import csv
+import json
+from datetime import date, timedelta
+from typing import Callable, Iterable, List
+from database import database
+
+
+SALES_HEADER = ("id", "name", "band", "quantity", "timestamp", "price")
+STOCK_HEADER = ("name", "band", "quantity", "price", "timestamp")
+
+
+def write_rows(rows: Iterable, path: str, header: List, progress: Callable = None, every: int = 1000) -> int:
+    """
+    Writes rows to a CSV or JSONL file as they arrive, so memory use does not depend on the number of rows
+
+        Parameters:
+            rows (iterable): tuples matching the header
+            path (str): the output file, written as JSONL when it ends in .jsonl and as CSV otherwise
+            header (list): the column names
+            progress (callable): called with the number of rows written so far, every `every` rows and at the end
+            every (int): how often progress is reported
+
+        Returns:
+            count (int): the number of rows written
+    """
+    count: int = 0
+    jsonl: bool = path.lower().endswith(".jsonl")
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = None if jsonl else csv.writer(file)
+        if writer is not None:
+            writer.writerow(header)
+        for row in rows:
+            if jsonl:
+                file.write(json.dumps(dict(zip(header, row))) + "\n")
+            else:
+                writer.writerow(row)
+            count += 1
+            if progress is not None and count % every == 0:
+                progress(count)
+    if progress is not None:
+        progress(count)
+    return count
+
+
+def export_sales(db: database, path: str, start: date, end: date, bands: List = None, progress: Callable = None) -> int:
+    """Writes the sales between two days, inclusive, optionally for a set of bands, and returns the number of rows"""
+    return write_rows(db.iter_sales(start, end, bands), path, SALES_HEADER, progress)
+
+
+def export_stock(db: database, path: str, progress: Callable = None) -> int:
+    """Writes a snapshot of every product, and returns the number of rows"""
+    return write_rows(db.iter_inventory(), path, STOCK_HEADER, progress)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export sales or stock records")
+    parser.add_argument("records", choices=("sales", "stock"), help="the records to export")
+    parser.add_argument("output", help="a .csv or .jsonl file to write")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.min, help="first day of sales to include")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.max - timedelta(days=1), help="last day of sales to include")
+    parser.add_argument("--band", action="append", dest="bands", help="only include sales for this band, may be repeated")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to export from")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    progress = lambda count: print(f"\r{count} rows", end="", flush=True)
+    if arguments.records == "sales":
+        count = export_sales(db, arguments.output, arguments.start, arguments.end, arguments.bands, progress)
+    else:
+        count = export_stock(db, arguments.output, progress)
+    print(f"\rExported {count} rows to {arguments.output}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+from database import database
+
+
+class queryStats:
+    """
+    This class records how long each database method takes, and which SQL statements it ran.
+
+    It is opt-in: nothing is wrapped or traced until attach is called, so it costs nothing while disabled.
+    Once attached, every public method of a database instance is timed, and sqlite3's trace callback
+    collects the statements each call executes. Calls slower than slow_ms are kept, with the query plan
+    of each of their statements, in a bounded ring buffer.
+
+    Attributes:
+        slow_ms (float): calls taking at least this many milliseconds are recorded as slow
+        capacity (int): the number of slow calls kept in the ring buffer
+        samples (int): the number of recent latencies kept per method for the percentiles
+        methods (dict): the statistics for each method
+            Key: method name
+            Value: a dict of calls, rows, commits and recent latencies
+        slow (deque): the most recent slow calls, oldest first
+
+    Methods:
+        __init__: Initializes the queryStats class
+        attach: Starts timing and tracing a database instance
+        detach: Restores a database instance's original methods and stops tracing
+        wrap: Returns a timed version of a database method
+        trace: Collects each SQL statement executed during a timed call
+        record: Adds a call to the statistics, and to the slow call buffer when it is slow
+        plan: Returns the query plan for a statement
+        snapshot: Returns the call counts, latency percentiles, rows, commits and slow calls
+        dump: Writes a snapshot to a JSON file
+    """
+
+    def __init__(self, slow_ms: float = 50, capacity: int = 100, samples: int = 10000) -> None:
+        """Initializes the queryStats class"""
+        self.slow_ms = slow_ms
+        self.samples = samples
+        self.methods: Dict = {}
+        self.slow = deque(maxlen=capacity)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+
+    def attach(self, db: database) -> None:
+        """Replaces every public method of the database instance with a timed version, and traces its connections"""
+        for name in dir(database):
+            if not name.startswith("_") and callable(getattr(database, name)):
+                setattr(db, name, self.wrap(name, getattr(db, name), db))
+        db.connection.set_trace_callback(self.trace)
+        db.reader.set_trace_callback(self.trace)
+
+
+    def detach(self, db: database) -> None:
+        """Removes the timed methods from the database instance, and stops tracing its connections"""
+        for name in dir(database):
+            if name in vars(db):
+                delattr(db, name)
+        db.connection.set_trace_callback(None)
+        db.reader.set_trace_callback(None)
+
+
+    def wrap(self, name: str, method, db: database):
+        """Returns a function that times method, and records its rows, commits and statements"""
+        def timed(*args, **kwargs):
+            outer = getattr(self._local, "statements", None)
+            self._local.statements = []
+            start = time.perf_counter()
+            try:
+                return_value = method(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                statements = self._local.statements
+                self._local.statements = outer if outer is None else outer + statements
+            self.record(name, elapsed, return_value, statements, db)
+            return return_value
+        timed.__name__ = name
+        timed.__doc__ = method.__doc__
+        return timed
+
+
+    def trace(self, statement: str) -> None:
+        """Called by sqlite3 with each statement as it runs, during a timed call"""
+        statements = getattr(self._local, "statements", None)
+        if statements is not None:
+            statements.append(statement)
+
+
+    def record(self, name: str, elapsed: float, return_value, statements: List, db: database) -> None:
+        """Adds one call to the statistics, and keeps it in the slow call buffer if it took at least slow_ms"""
+        rows = len(return_value) if isinstance(return_value, list) else 0
+        commits = sum(1 for statement in statements if statement.strip().upper().startswith("COMMIT"))
+        with self._lock:
+            stats = self.methods.setdefault(name, {"calls": 0, "rows": 0, "commits": 0, "latencies": deque(maxlen=self.samples)})
+            stats["calls"] += 1
+            stats["rows"] += rows
+            stats["commits"] += commits
+            stats["latencies"].append(elapsed)
+        if elapsed >= self.slow_ms:
+            self.slow.append({"method": name, "ms": round(elapsed, 3), "time": time.time(), "statements": [(statement, self.plan(db, statement)) for statement in statements]})
+
+
+    def plan(self, db: database, statement: str) -> List:
+        """Returns the EXPLAIN QUERY PLAN details for a statement, or an empty list for statements without a plan"""
+        if not statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return []
+        outer = getattr(self._local, "statements", None)
+        self._local.statements = None
+        try:
+            return [row[3] for row in db.reader.execute("EXPLAIN QUERY PLAN " + statement)]
+        except Exception:
+            return []
+        finally:
+            self._local.statements = outer
+
+
+    def snapshot(self) -> Dict:
+        """Returns the statistics for every method, with p50, p95 and p99 latencies, and the slow calls"""
+        methods = {}
+        with self._lock:
+            for name, stats in self.methods.items():
+                latencies = sorted(stats["latencies"])
+                percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+                methods[name] = {
+                    "calls": stats["calls"],
+                    "rows": stats["rows"],
+                    "commits": stats["commits"],
+                    "p50_ms": percentile(0.50),
+                    "p95_ms": percentile(0.95),
+                    "p99_ms": percentile(0.99),
+                }
+            slow = list(self.slow)
+        return {"methods": methods, "slow": slow}
+
+
+    def dump(self, path: str) -> None:
+        """Writes a snapshot of the statistics to a JSON file"""
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
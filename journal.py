@@ -0,0 +1,281 @@
+"""
+An append-only journal of sales, so the till can take sales faster than SQLite can commit them.
+
+Each cart is written as one line of the journal file, "seq<TAB>crc32<TAB>json", with the time it was rung up,
+and acknowledged once the file has been synced to disk. Syncs are shared by every cart appended while the previous sync was running.
+A background applier then records the journaled carts in large checkout_carts transactions, which also store
+the last sequence number applied, so replaying the journal after a crash never records a cart twice.
+
+Usage:
+    python journal.py JOURNAL [--db StockSales.db]    replays any unapplied entries, then empties the journal
+"""
+import argparse
+import json
+import os
+import threading
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+from database import database
+
+
+def encode_entry(seq: int, cart: List, timestamp: str = None) -> bytes:
+    """
+    Returns the journal line for a cart, with a checksum covering its sequence number and contents
+
+        Parameters:
+            seq (int): the entry's sequence number
+            cart (list): a list of [name, quantity] lines
+            timestamp (str): when the sale was made, as a UTC "YYYY-MM-DD HH:MM:SS" string, defaulting to now
+    """
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    payload = json.dumps({"time": timestamp, "cart": cart}, separators=(",", ":"))
+    checksum = zlib.crc32(f"{seq}\t{payload}".encode())
+    return f"{seq}\t{checksum:08x}\t{payload}\n".encode()
+
+
+def decode_entry(line: bytes) -> Tuple:
+    """
+    Returns the (seq, cart, timestamp) stored in a journal line
+
+    Entries written before sale times were journaled hold only the cart, and have a timestamp of None
+
+        Raises:
+            ValueError: if the line is incomplete or its checksum does not match, as after a crash mid-write
+    """
+    if not line.endswith(b"\n"):
+        raise ValueError("incomplete entry")
+    seq, checksum, payload = line[:-1].decode().split("\t", 2)
+    if int(checksum, 16) != zlib.crc32(f"{seq}\t{payload}".encode()):
+        raise ValueError("checksum mismatch")
+    entry = json.loads(payload)
+    if isinstance(entry, list):
+        return int(seq), entry, None
+    return int(seq), entry["cart"], entry["time"]
+
+
+class saleJournal:
+    """
+    This class journals carts to a local file, and applies them to the database in the background.
+
+    Attributes:
+        path (str): the journal file
+        name (str): the key the applied position is stored under in journalState
+        db (database): the database the applier writes to, which should not be used by any other thread, stored in a file or checkpointed
+        sync_interval (float): seconds the syncing thread waits to gather more carts into one fsync
+        apply_interval (float): seconds the applier waits between checks for new entries
+        batch_size (int): the most carts recorded by one transaction
+        on_applied: called on the applier thread with each batch's [(seq, results)] once it is committed
+        on_error: called on the applier thread with any exception a batch raised, before it is retried
+        seq (int): the last sequence number written
+        synced (int): the last sequence number known to be on disk
+        applied (int): the last sequence number recorded in the database
+
+    Methods:
+        __init__: Initializes the saleJournal class, recovers the file, and starts the background threads
+        recover: Reads the entries left in the file, and discards any torn entry at its end
+        append: Writes a cart to the journal, and waits until it is on disk
+        sync: The syncing threads loop, which fsyncs the file once per group of appends
+        run: The applier threads loop
+        apply: Records every synced entry not yet in the database
+        truncate: Empties the journal once every entry in it has been applied, and is on disk
+        close: Stops both threads, after applying every entry
+    """
+
+    def __init__(self, path: str, db: database, name: str = "sales", sync_interval: float = 0.002, apply_interval: float = 0.05, batch_size: int = 1000, on_applied: Callable = None, on_error: Callable = None) -> None:
+        """
+        Initializes the saleJournal class
+
+            Parameters:
+                path (str): the journal file, created if it does not exist
+                db (database): a database instance for the applier thread only, whose writer is switched to synchronous=FULL
+                name (str): the key the applied position is stored under, one per journal file
+                sync_interval (float): seconds to wait to gather more carts into one fsync
+                apply_interval (float): seconds between checks for new entries
+                batch_size (int): the most carts recorded by one transaction
+                on_applied: called on the applier thread with each batch's [(seq, results)]
+                on_error: called on the applier thread with any exception a batch raised
+
+            Raises:
+                ValueError: if the database is only held in memory, so applied sales would never reach the disk
+        """
+        if db.manager.storage == "memory":
+            raise ValueError("A sale journal needs a database stored in a file, or checkpointed to one, not memory storage")
+        self.path = path
+        self.name = name
+        self.db = db
+        self.sync_interval = sync_interval
+        self.apply_interval = apply_interval
+        self.batch_size = batch_size
+        self.on_applied = on_applied
+        self.on_error = on_error
+        self.pending = deque()
+        self.closed: bool = False
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._synced = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        # The journal is emptied as soon as its entries are committed, so a commit must be on disk when it returns,
+        # which WAL only promises at synchronous=FULL rather than the NORMAL every other connection uses.
+        # A checkpointed database only reaches the disk with its next checkpoint, so the journal waits for that instead
+        db.connection.execute("PRAGMA synchronous=FULL")
+        self._checkpoint: int = 0
+        self.applied: int = db.journal_position(name)
+        self.seq: int = self.applied
+        self.recover()
+        self.synced: int = self.seq
+        self.file = open(path, "ab")
+        self.syncer = threading.Thread(target=self.sync, name="saleJournal-sync", daemon=True)
+        self.applier = threading.Thread(target=self.run, name="saleJournal-apply", daemon=True)
+        self.syncer.start()
+        self.applier.start()
+
+
+    def recover(self) -> None:
+        """Queues every complete entry after the applied position, and cuts off anything after the last complete entry"""
+        if not os.path.exists(self.path):
+            return
+        end: int = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    seq, cart, timestamp = decode_entry(line)
+                except ValueError:
+                    break
+                end += len(line)
+                self.seq = max(self.seq, seq)
+                if seq > self.applied:
+                    self.pending.append((seq, cart, timestamp))
+        # A torn write at the end was never acknowledged, so it is dropped rather than guessed at
+        os.truncate(self.path, end)
+
+
+    def append(self, cart: List) -> int:
+        """
+        Writes a cart to the journal, with the current time, returning its sequence number once the entry is safely on disk
+
+            Parameters:
+                cart (list): a list of [name, quantity] lines, as passed to checkout
+
+            Returns:
+                seq (int): the cart's sequence number
+        """
+        with self._lock:
+            if self.closed:
+                raise ValueError("the journal is closed")
+            self.seq += 1
+            seq = self.seq
+            timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            self.file.write(encode_entry(seq, cart, timestamp))
+            self.pending.append((seq, cart, timestamp))
+            self._written.notify()
+            while self.synced < seq:
+                self._synced.wait()
+        return seq
+
+
+    def sync(self) -> None:
+        """Flushes and fsyncs the file whenever entries have been written, waking every append that was waiting on them"""
+        while True:
+            with self._lock:
+                while self.synced == self.seq and not self.closed:
+                    self._written.wait()
+                if self.synced == self.seq and self.closed:
+                    return
+                # Lets other tills append while this group waits, so one fsync covers all of them
+                self._synced.wait(self.sync_interval)
+                target = self.seq
+                self.file.flush()
+            # Appends carry on into the buffer while the disk syncs, and are covered by the next fsync
+            os.fsync(self.file.fileno())
+            with self._lock:
+                self.synced = target
+                self._synced.notify_all()
+
+
+    def run(self) -> None:
+        """Applies new entries every apply_interval seconds until the journal is closed"""
+        while not self._stopped.wait(self.apply_interval):
+            self.apply()
+        self.apply()
+
+
+    def apply(self) -> int:
+        """
+        Records every synced entry that has not been applied, batch_size carts per transaction
+
+        A batch that fails, such as when the database is locked, is put back at the front of the queue
+        and reported to on_error, and is tried again at the next interval.
+
+            Returns:
+                count (int): the number of carts applied
+        """
+        count: int = 0
+        while True:
+            with self._lock:
+                batch: List = []
+                while self.pending and self.pending[0][0] <= self.synced and len(batch) < self.batch_size:
+                    batch.append(self.pending.popleft())
+            if not batch:
+                break
+            try:
+                results = self.db.checkout_carts([cart for _, cart, _ in batch], self.name, batch[-1][0], [timestamp for _, _, timestamp in batch])
+            except Exception as exception:
+                with self._lock:
+                    self.pending.extendleft(reversed(batch))
+                if self.on_error is not None:
+                    self.on_error(exception)
+                return count
+            self.applied = batch[-1][0]
+            self._checkpoint = self.db.manager.checkpoints_started + 1
+            count += len(batch)
+            if self.on_applied is not None:
+                self.on_applied([(seq, lines) for (seq, _, _), lines in zip(batch, results)])
+        self.truncate()
+        return count
+
+
+    def truncate(self) -> None:
+        """
+        Empties the journal file when every entry in it has been applied, so it never grows without limit
+
+        A checkpointed database keeps its entries until a checkpoint started after they were applied has been written,
+        and the entries left when the journal is closed are skipped on replay, as they are before the applied position
+        """
+        saved: bool = self.db.manager.storage == "file" or self.db.manager.checkpoints_written >= self._checkpoint
+        with self._lock:
+            if saved and self.applied == self.seq and self.synced == self.seq and self.file.tell() > 0:
+                self.file.truncate(0)
+                self.file.seek(0)
+                os.fsync(self.file.fileno())
+
+
+    def close(self) -> None:
+        """Waits for every entry to be synced and applied, then stops both threads and closes the file"""
+        with self._lock:
+            self.closed = True
+            self._written.notify()
+        self.syncer.join()
+        self._stopped.set()
+        self.applier.join()
+        self.file.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a sale journal into the database")
+    parser.add_argument("journal", help="the journal file to replay")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to apply it to")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    db.create_tables()
+    journal = saleJournal(arguments.journal, db, on_error=lambda error: print(f"Could not apply journaled sales, they are kept in the journal: {error}"))
+    count = len(journal.pending)
+    journal.close()
+    print(f"Applied {count} journaled sales, up to entry {journal.applied}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Serves the stock and sales database to several tills over HTTP, with JSON requests and responses.
+
+Endpoints:
+    POST /sale   {"cart": [[name, quantity], ...]}  ->  {"lines": [{"name", "quantity", "price", "recorded", "id"}, ...]}
+    POST /void   {"id": 12}                          ->  {"voided": true}
+    GET  /stock?name=Hoodie                          ->  {"name", "band", "quantity", "price"}
+    GET  /totals[?day=2024-06-01]                    ->  {"totals": [{"band", "gross", "net", "units"}, ...]}
+
+Sales from every till are grouped into shared transactions, so throughput is not limited by how many commits
+the disk can sync each second. Past that, requests are handled by Python threads sharing one interpreter lock,
+so the server is bound by CPU, and benchmarks/load_test.py measures what grouping gains on a given machine.
+
+Usage:
+    python pos_server.py [--db StockSales.db] [--host 127.0.0.1] [--port 8080] [--max-batch 256] [--max-wait 0]
+"""
+import argparse
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+from urllib.parse import parse_qs, urlparse
+from database import database
+
+
+# Returned by groupCommitter.gather when the batch ended without taking another request off the queue
+_NEXT = object()
+
+
+def positive_int(value, field: str) -> int:
+    """
+    Returns value if it is a positive JSON integer
+
+        Raises:
+            ValueError: for anything else, including booleans, floats such as 1.9, and numeric strings
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"{field} must be a positive integer")
+    return value
+
+
+def parse_cart(body: Dict) -> List:
+    """
+    Returns the [name, quantity] lines of a sale request
+
+        Raises:
+            ValueError: if a line is not a product name and a positive integer quantity
+    """
+    cart = body["cart"]
+    if not isinstance(cart, list):
+        raise ValueError("cart must be a list of [name, quantity] lines")
+    lines: List = []
+    for line in cart:
+        if not isinstance(line, list) or len(line) != 2 or not isinstance(line[0], str):
+            raise ValueError("cart must be a list of [name, quantity] lines")
+        lines.append([line[0], positive_int(line[1], "quantity")])
+    return lines
+
+
+class groupCommitter:
+    """
+    This class runs every write on one thread, and records the sales waiting at the same time in one transaction.
+
+    While a batch is being committed, new sales queue up behind it, and are all written by the next commit.
+    Other writes, such as voids, run on their own between batches, in the order they were submitted.
+
+    Attributes:
+        db (database): the database written to, whose writer connection is only used by this thread
+        max_batch (int): the most carts recorded by one transaction
+        max_wait (float): seconds to wait for more carts once a batch has started, 0 commits whatever is already queued
+        batches (int): the number of sale transactions committed
+        carts (int): the number of carts recorded
+
+    Methods:
+        __init__: Initializes the groupCommitter class and starts the writer thread
+        sell: Queues a cart, and waits for the transaction that records it
+        submit: Queues any other request for the writer connection, and waits for its result
+        run: The writer threads loop, which runs each request and commits each batch of carts
+        gather: Adds the carts already queued to a batch
+        commit: Records a batch of carts in one transaction, and answers each waiting till
+        stats: Returns the batch and cart counters
+        close: Stops the writer thread once the queued writes have run
+    """
+
+    def __init__(self, db: database, max_batch: int = 256, max_wait: float = 0) -> None:
+        """Initializes the groupCommitter class"""
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches: int = 0
+        self.carts: int = 0
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="groupCommitter", daemon=True)
+        self.thread.start()
+
+
+    def sell(self, cart: List, timeout: float = None) -> List:
+        """Records a cart, returning a (name, quantity, price, recorded, sale id) tuple per line once it is committed"""
+        future = Future()
+        self.requests.put((None, cart, future))
+        return future.result(timeout)
+
+
+    def submit(self, function: Callable, *args, timeout: float = None):
+        """Runs function(db, *args) on the writer thread, between sale batches, and returns its result"""
+        future = Future()
+        self.requests.put((function, args, future))
+        return future.result(timeout)
+
+
+    def run(self) -> None:
+        """Takes the next request, gathers the carts queued behind it, and writes them together"""
+        request = self.requests.get()
+        while request is not None:
+            function, args, future = request
+            if function is None:
+                batch: List = [request]
+                request = self.gather(batch)
+                self.commit(batch)
+                if request is _NEXT:
+                    request = self.requests.get()
+                continue
+            try:
+                future.set_result(function(self.db, *args))
+            except Exception as exception:
+                future.set_exception(exception)
+            request = self.requests.get()
+
+
+    def gather(self, batch: List):
+        """Moves queued carts into batch, and returns the first other request taken off the queue, or _NEXT if there was none"""
+        while len(batch) < self.max_batch:
+            try:
+                request = self.requests.get(timeout=self.max_wait) if self.max_wait else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None or request[0] is not None:
+                return request
+            batch.append(request)
+        return _NEXT
+
+
+    def commit(self, batch: List) -> None:
+        """
+        Records every cart in the batch with a single checkout_carts transaction
+
+        If the transaction fails, every cart is tried again in a transaction of its own, so only the till whose
+        cart caused the failure receives the exception
+        """
+        try:
+            results = self.db.checkout_carts([cart for _, cart, _ in batch])
+        except Exception as exception:
+            if len(batch) > 1:
+                for request in batch:
+                    self.commit([request])
+                return
+            batch[0][2].set_exception(exception)
+            return
+        self.batches += 1
+        self.carts += len(batch)
+        for (_, _, future), lines in zip(batch, results):
+            future.set_result(lines)
+
+
+    def stats(self) -> Dict:
+        """Returns the number of transactions committed and carts recorded"""
+        return {"batches": self.batches, "carts": self.carts}
+
+
+    def close(self) -> None:
+        """Stops the writer thread after every queued write has run"""
+        self.requests.put(None)
+        self.thread.join()
+
+
+class posHandler(BaseHTTPRequestHandler):
+    """
+    This class answers a single till's HTTP requests, keeping the connection open between them.
+
+    Methods:
+        do_GET: Answers stock lookups and band totals
+        do_POST: Records sales and voids through the group committer
+        read_json: Returns the decoded JSON request body
+        send_json: Sends a JSON response
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Responses are small, so waiting to coalesce them with later writes only adds a delayed-ACK round trip
+    disable_nagle_algorithm = True
+
+
+    def do_GET(self) -> None:
+        """Answers GET /stock and GET /totals"""
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/stock":
+            # The cache checks for changes through the writer connection, so lookups take their turn on the writer thread
+            item = self.server.committer.submit(lambda db, name: db.cache.get(name), query.get("name", ""))
+            if item is None:
+                self.send_json(404, {"error": "unknown product"})
+            else:
+                self.send_json(200, {"name": query["name"], "band": item[2], "quantity": item[0], "price": item[1]})
+        elif url.path == "/totals":
+            try:
+                day = date.fromisoformat(query["day"]) if "day" in query else None
+            except ValueError:
+                self.send_json(400, {"error": "day must be YYYY-MM-DD"})
+                return
+            totals = self.server.reports().retrieve_band_totals(day)
+            self.send_json(200, {"totals": [dict(zip(("band", "gross", "net", "units"), row)) for row in totals]})
+        else:
+            self.send_json(404, {"error": "unknown endpoint"})
+
+
+    def do_POST(self) -> None:
+        """Answers POST /sale and POST /void"""
+        try:
+            body = self.read_json()
+            if self.path == "/sale":
+                cart = parse_cart(body)
+                lines = self.server.committer.sell(cart)
+                self.send_json(200, {"lines": [dict(zip(("name", "quantity", "price", "recorded", "id"), line)) for line in lines]})
+            elif self.path == "/void":
+                voided = self.server.committer.submit(lambda db, id: db.void_sale(id), positive_int(body["id"], "id"))
+                self.send_json(200 if voided else 404, {"voided": voided})
+            else:
+                self.send_json(404, {"error": "unknown endpoint"})
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json(400, {"error": f"bad request: {error}"})
+
+
+    def finish(self) -> None:
+        """Closes the till's read-only connection once it disconnects"""
+        try:
+            super().finish()
+        finally:
+            self.server.release_reports()
+
+
+    def read_json(self) -> Dict:
+        """Reads and decodes the JSON request body"""
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+    def send_json(self, status: int, body: Dict) -> None:
+        """Sends body as a JSON response with the given status"""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def log_message(self, format: str, *args) -> None:
+        """Only logs requests when the server is verbose, so a busy till does not flood the console"""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class posServer(ThreadingHTTPServer):
+    """
+    This class is the HTTP server shared by every till, with one thread per connected till.
+
+    Attributes:
+        db (database): the database instance shared by every request
+        committer (groupCommitter): the single writer, which every sale and void goes through
+        options (dict): extra keyword arguments passed to every database instance
+        verbose (bool): log every request
+
+    Methods:
+        __init__: Initializes the posServer class, opening the database and starting the writer
+        reports: Returns the calling till thread's database instance, for reads on its own connection
+        release_reports: Closes the calling till thread's read-only connection
+        server_close: Stops the writer and closes the database
+    """
+
+    daemon_threads = True
+
+
+    def __init__(self, address, path: str = "StockSales.db", max_batch: int = 256, max_wait: float = 0, verbose: bool = False, **options) -> None:
+        """
+        Initializes the posServer class
+
+            Parameters:
+                address (tuple): the (host, port) to listen on, port 0 picks a free port
+                path (str): the database file to serve
+                max_batch (int): the most carts recorded by one transaction
+                max_wait (float): seconds to wait for more carts once a batch has started
+                verbose (bool): log every request
+                options: extra keyword arguments passed to the database instance, such as commission
+        """
+        self.db = database(path, **options)
+        self.db.create_tables()
+        self.committer = groupCommitter(self.db, max_batch, max_wait)
+        self.options = options
+        self._local = threading.local()
+        self.verbose = verbose
+        super().__init__(address, posHandler)
+
+
+    def reports(self) -> database:
+        """
+        Returns a database instance for the calling till thread, sharing the server's connections
+
+        Its reader is the thread's own read-only connection, as the connection manager opens one per thread,
+        so reports from different tills run at the same time instead of queueing for one connection
+        """
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = database(manager=self.db.manager, **self.options)
+        return db
+
+
+    def release_reports(self) -> None:
+        """Closes the calling till thread's read-only connection, if it opened one"""
+        if getattr(self._local, "db", None) is not None:
+            self._local.db = None
+            self.db.manager.release()
+
+
+    def server_close(self) -> None:
+        """Stops accepting tills, waits for queued writes, then closes the database"""
+        super().server_close()
+        self.committer.close()
+        self.db.close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the stock and sales database to several tills")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to serve")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="the port to listen on")
+    parser.add_argument("--max-batch", type=int, default=256, help="the most carts recorded per transaction")
+    parser.add_argument("--max-wait", type=float, default=0, help="seconds to wait for more carts before committing")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    arguments = parser.parse_args()
+    server = posServer((arguments.host, arguments.port), arguments.db, arguments.max_batch, arguments.max_wait, arguments.verbose)
+    print(f"Serving {arguments.db} on http://{arguments.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Closes trading days into the daily rollups, and prints settlement reports from them.
+
+Usage:
+    python reports.py close [--db StockSales.db]
+    python reports.py backfill [--db StockSales.db]
+    python reports.py summary --start 2024-01-01 --end 2024-12-31 [--band BAND ...] [--products] [--db StockSales.db]
+"""
+import argparse
+from datetime import date, datetime, timezone
+from database import database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the daily rollups and report on them")
+    parser.add_argument("command", choices=("close", "backfill", "summary"), help="close new days, re-close all history, or print a summary")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day of the summary")
+    # Days are UTC days, as sales are timestamped with CURRENT_TIMESTAMP
+    parser.add_argument("--end", type=date.fromisoformat, default=datetime.now(timezone.utc).date(), help="last day of the summary, today in UTC by default")
+    parser.add_argument("--band", action="append", dest="bands", help="only report this band, may be repeated")
+    parser.add_argument("--products", action="store_true", help="break the summary down by product")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to use")
+    arguments = parser.parse_args()
+    db = database(arguments.db)
+    db.create_tables()
+    if arguments.command == "close":
+        print(f"Closed {len(db.close_days())} days")
+    elif arguments.command == "backfill":
+        print(f"Closed {len(db.backfill_rollups())} days")
+    elif arguments.products:
+        for band, product, units, gross, net in db.report_products(arguments.start or date.min, arguments.end, arguments.bands):
+            print(f"{band:30} {product:30} {units:8} {gross:12.2f} {net:12.2f}")
+    else:
+        for band, units, gross, net in db.report_totals(arguments.start or date.min, arguments.end, arguments.bands):
+            print(f"{band:30} {units:8} {gross:12.2f} {net:12.2f}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
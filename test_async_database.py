@@ -0,0 +1,131 @@
+import sys
+import os
+import asyncio
+import time
+import threading
+import pytest
+from datetime import datetime, timezone
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from async_database import AsyncDatabase
+from database import database
+from connection import connectionManager
+
+
+# A manager whose connections can run a slow SQL function, standing in for a heavy report
+class slowManager(connectionManager):
+    def connect(self):
+        connection = super().connect()
+        connection.create_function("pause", 1, lambda seconds: time.sleep(seconds) or seconds)
+        return connection
+
+
+# Define a fixture to create an asynchronous database with a few products
+@pytest.fixture
+def adb(tmp_path):
+    adb = AsyncDatabase(manager=slowManager(str(tmp_path / "async.db")), readers=4)
+    async def setup():
+        await adb.create_tables()
+        await adb.create_update_stock(["Hoodie", "One Direction", 20, 5.0])
+        await adb.create_update_stock(["Tee", "Blur", 10, 15.0])
+    asyncio.run(setup())
+    yield adb
+    asyncio.run(adb.close_db())
+    adb.manager.close()
+
+
+# Test case for the mirrored methods
+def test_async_methods(adb):
+    async def scenario():
+        results = await adb.checkout([["Hoodie", 2], ["Tee", 11]])
+        inventory = await adb.retrieve_inventory()
+        quantity = await adb.retrieve_quantity("Hoodie")
+        totals = await adb.retrieve_total_payments()
+        today = datetime.now(timezone.utc).date()
+        sales = [row async for row in adb.iter_sales(today, today, batch_size=1)]
+        return results, inventory, quantity, totals, sales
+    results, inventory, quantity, totals, sales = asyncio.run(scenario())
+    assert results == [("Hoodie", 2, 5.0, True), ("Tee", 11, 15.0, False)]
+    assert [row[:3] for row in inventory] == [("Hoodie", "One Direction", 18), ("Tee", "Blur", 10)]
+    assert quantity == (18, )
+    assert totals == (10.0, 7.5, "One Direction")
+    assert [row[1:4] for row in sales] == [("Hoodie", "One Direction", 2)]
+
+
+# Test case for running reads in parallel
+def test_concurrent_reads(adb):
+    # Each read holds its connection for 0.2 seconds, so eight of them take 1.6 seconds behind one connection
+    async def scenario():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(adb.run(lambda db: (db.reader.execute("SELECT pause(0.2)").fetchone(), db.reader), write=False) for _ in range(8)))
+        return results, time.perf_counter() - start
+    results, elapsed = asyncio.run(scenario())
+    assert [row for row, reader in results] == [(0.2, )] * 8
+    # Four reader threads with their own connections finish in two rounds
+    assert elapsed < 0.8
+    assert len({id(reader) for row, reader in results}) == 4
+
+
+# Test case for serialising writes
+def test_concurrent_writes(adb):
+    async def scenario():
+        await asyncio.gather(*(adb.checkout([["Hoodie", 1]]) for _ in range(25)))
+        return await adb.retrieve_quantity("Hoodie"), len(await adb.retrieve_sales())
+    # Every checkout saw the stock left by the one before it, so only 20 of the 25 were recorded
+    assert asyncio.run(scenario()) == ((0, ), 20)
+
+
+# Test case for timeouts and cancellation
+def test_timeout_interrupts_query(tmp_path):
+    adb = AsyncDatabase(str(tmp_path / "timeout.db"), readers=1)
+    runaway = "WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) SELECT count(*) FROM counter"
+    async def scenario():
+        await adb.create_tables()
+        with pytest.raises(asyncio.TimeoutError):
+            await adb.run(lambda db: db.reader.execute(runaway).fetchone(), write=False, timeout=0.1)
+        # The runaway query was interrupted, so the only reader thread is free again straight away
+        start = time.perf_counter()
+        inventory = await adb.retrieve_inventory(timeout=2)
+        return inventory, time.perf_counter() - start
+    inventory, elapsed = asyncio.run(scenario())
+    assert inventory == []
+    assert elapsed < 1
+    asyncio.run(adb.close_db())
+
+
+# Test case for streaming while other reads run
+def test_iterate_on_one_thread(adb, monkeypatch):
+    threads = []
+    iterate = database._iterate
+    def recording(self, cursor, batch_size):
+        for row in iterate(self, cursor, batch_size):
+            threads.append(threading.get_ident())
+            yield row
+    monkeypatch.setattr(database, "_iterate", recording)
+    async def scenario():
+        for _ in range(6):
+            await adb.checkout([["Hoodie", 1]])
+        today = datetime.now(timezone.utc).date()
+        async def stream():
+            return [row[0] async for row in adb.iter_sales(today, today, batch_size=1)]
+        # Two streams fetch their batches in turn while the reader pool is kept busy
+        reads = [adb.run(lambda db: db.reader.execute("SELECT pause(0.01)").fetchone(), write=False) for _ in range(12)]
+        results = await asyncio.gather(stream(), stream(), *reads)
+        return results[:2]
+    first, second = asyncio.run(scenario())
+    assert first == second == [1, 2, 3, 4, 5, 6]
+    # Every batch of both cursors was fetched on the thread that opened them
+    assert len(threads) == 12
+    assert len(set(threads)) == 1
+
+
+# Test case for using one instance from more than one event loop
+def test_separate_loops(tmp_path):
+    adb = AsyncDatabase(manager=slowManager(str(tmp_path / "loops.db")), readers=2, limit=1)
+    async def scenario():
+        # With a limit of one, the second read waits on the semaphore, which ties it to the running loop
+        return await asyncio.gather(*(adb.run(lambda db: db.reader.execute("SELECT pause(0.01)").fetchone(), write=False) for _ in range(2)))
+    assert asyncio.run(scenario()) == [(0.01, )] * 2
+    assert asyncio.run(scenario()) == [(0.01, )] * 2
+    asyncio.run(adb.close_db())
+    adb.manager.close()
@@ -1,22 +1,25 @@
 import sys
 import os
+import multiprocessing
+import sqlite3
+import threading
+import time
 import pytest
+from array import array
 root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, root)
-from database import database
-
-
-# Define a fixture to create a database connection and initialize tables
-@pytest.fixture
-def db():
-    # Create a new database instance
-    db = database()
-    # Create necessary tables
-    db.create_tables()
-    # Provides the database instance for testing
-    yield db
-    # Close the database connection after the test
-    db.close_db()
+from database import database, SCHEMA_VERSION, DELETED_BAND, UNKNOWN_PRODUCT
+from worker import dbWorker
+from catalog import read_catalog
+from export import export_sales, export_stock
+from datetime import date, datetime, timezone
+from instrumentation import queryStats
+from journal import saleJournal, encode_entry
+from connection import connectionManager
+from archive import archive_days, compact
+from backup import take_snapshot, restore_latest, snapshots
+import analytics
+from analytics import salesSnapshot
 
 
 # Test case for create_tables method
@@ -35,7 +38,7 @@ def test_create_update_stock(db):
     db.create_update_stock(["Hoodie", "One Direction", 20, 5.0])
     # Retrieve the inserted item
     cursor = db.connection.cursor()
-    cursor.execute("SELECT * FROM stockItems WHERE name=?", ("Hoodie", ))
+    cursor.execute("SELECT name, band, quantity, price, timestamp FROM products WHERE name=?", ("Hoodie", ))
     result = cursor.fetchone()
     assert result is not None
     assert result[:-1] == ("Hoodie", "One Direction", 20, 5.0)
@@ -65,7 +68,7 @@ def test_create_sale(db):
     db.create_sale(["Hoodie", 5])
     # Retrieve the inserted sale record
     cursor = db.connection.cursor()
-    cursor.execute("SELECT * FROM sales WHERE stockItemID=?", ("Hoodie", ))
+    cursor.execute("SELECT sales.id, products.name, sales.quantity, sales.timestamp, sales.price FROM sales JOIN products ON products.id = sales.stockItemID WHERE products.name=?", ("Hoodie", ))
     result = cursor.fetchone()
     assert result is not None
     assert (result[1], result[-1]) == ("Hoodie", 5)
@@ -84,13 +87,18 @@ def test_delete_sale(db):
 
 # Test case for delete_stock method
 def test_delete_stock(db):
-    # Delete an existing stock item
-    db.delete_stock("Hoodie")
+    # Delete a stock item that has never been sold
+    db.delete_stock("Tee")
     # Try to retrieve the deleted item
     cursor = db.connection.cursor()
-    cursor.execute("SELECT * FROM stockItems WHERE name=?", ("Hoodie", ))
+    cursor.execute("SELECT * FROM stockItems WHERE name=?", ("Tee", ))
     result = cursor.fetchone()
     assert result is None
+    # A stock item that has been sold is kept, with its sales
+    with pytest.raises(ValueError):
+        db.delete_stock("Hoodie")
+    assert db.retrieve_quantity("Hoodie") == (20, )
+    assert cursor.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 2
 
 
 # Test case for retrieve_inventory method
@@ -123,3 +131,892 @@ def test_retrieve_total_payments(db):
     assert gross == 4/3 * net
     assert net == 3/4 * gross
     assert band is not None
+
+
+# Test case for checkout method
+def test_checkout(db):
+    # Record a cart with a valid line, an oversized line and an unknown product
+    db.create_update_stock(["Cap", "One Direction", 10, 8.0])
+    cursor = db.connection.cursor()
+    last_id = cursor.execute("SELECT IFNULL(MAX(id), 0) FROM sales").fetchone()[0]
+    results = db.checkout([["Cap", 3], ["Cap", 50], ["Missing", 1]])
+    assert results == [("Cap", 3, 8.0, True), ("Cap", 50, 8.0, False), ("Missing", 1, None, False)]
+    # Only the valid line is recorded, and the stock is reduced once
+    assert db.retrieve_quantity("Cap")[0] == 7
+    cursor.execute("SELECT COUNT(*) FROM sales JOIN products ON products.id = sales.stockItemID WHERE products.name=? AND sales.id > ?", ("Cap", last_id))
+    assert cursor.fetchone()[0] == 1
+
+
+# Test case for the shared connectionManager
+def test_connection_manager(tmp_path):
+    db = database(str(tmp_path / "manager.db"))
+    # The writer is tuned, and the reader cannot write
+    assert db.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.connection.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    assert db.reader.execute("PRAGMA query_only").fetchone()[0] == 1
+    # A second instance on the same manager shares its connections
+    shared = database(manager=db.manager)
+    assert shared.connection is db.connection
+    assert shared.reader is db.reader
+    db.close_db()
+
+
+# Test case for the in-memory and checkpointed storage modes
+def test_storage_modes(db, tmp_path):
+    # Every ":memory:" database is private, so the seeded fixture is untouched by another one
+    other = database(":memory:")
+    other.create_tables()
+    other.create_update_stock(["Scarf", "Pulp", 4, 9.0])
+    assert db.retrieve_quantity("Scarf") is None
+    assert other.manager.storage == "memory"
+    other.close_db()
+    with pytest.raises(ValueError):
+        database(str(tmp_path / "shop.db"), storage="tape")
+    # A checkpointed database is only written to its file by a checkpoint, and is loaded from it when opened
+    path = str(tmp_path / "shop.db")
+    checkpointed = database(path, storage="checkpointed")
+    checkpointed.create_tables()
+    checkpointed.create_update_stock(["Scarf", "Pulp", 4, 9.0])
+    assert not os.path.exists(path)
+    assert checkpointed.manager.checkpoint() == os.path.getsize(path)
+    checkpointed.update_stock_quantity("Scarf", 1)
+    checkpointed.close_db()
+    # Closing wrote a final checkpoint, and a file opened in WAL mode since can still be loaded
+    disk = database(path)
+    assert disk.retrieve_quantity("Scarf")[0] == 3
+    disk.create_update_stock(["Badge", "Blur", 30, 2.0])
+    disk.close_db()
+    reopened = database(path, storage="checkpointed")
+    assert reopened.retrieve_quantity("Badge")[0] == 30
+    assert reopened.connection.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    reopened.close_db()
+
+
+# Test case for the indexes used by the "today" queries
+def test_today_query_plans(db):
+    # The sales query seeks the timestamp index, and joins on the product's and band's integer primary keys
+    cursor = db.connection.cursor()
+    plan = " ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN SELECT sales.id, products.name, products.band, sales.quantity, sales.timestamp, sales.price FROM sales JOIN products ON products.id = sales.stockItemID WHERE sales.timestamp >= ? AND sales.timestamp < ?", ("2024-01-01", "2024-01-02")))
+    assert "COVERING INDEX idx_sales_timestamp (timestamp>? AND timestamp<?)" in plan
+    assert "SEARCH stockItems USING INTEGER PRIMARY KEY (rowid=?)" in plan
+    assert "SEARCH bands USING INTEGER PRIMARY KEY (rowid=?)" in plan
+    # The inventory query seeks the stockItems timestamp index
+    plan = " ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN SELECT name, band, quantity, price, timestamp FROM products WHERE quantity > 0 AND timestamp >= ? AND timestamp < ? ORDER BY name", ("2024-01-01", "2024-01-02")))
+    assert "idx_stockItems_timestamp (timestamp>? AND timestamp<?)" in plan
+
+
+# Test case for verify_totals method
+def test_verify_totals(db):
+    # The running totals follow every sale and deletion
+    db.create_update_stock(["Poster", "Muse", 10, 4.0])
+    db.checkout([["Poster", 2], ["Poster", 1]])
+    assert db.verify_totals() == []
+    cursor = db.connection.cursor()
+    cursor.execute("SELECT MAX(id) FROM sales")
+    db.delete_sale(cursor.fetchone()[0])
+    assert db.verify_totals() == []
+    # Corrupted totals are reported, and repaired from the raw sales
+    cursor.execute("UPDATE bandTotals SET gross = gross + 100 WHERE bandID = (SELECT id FROM bands WHERE name=?)", ("Muse", ))
+    db.connection.commit()
+    assert len(db.verify_totals()) == 1
+    assert db.verify_totals() == []
+    # Deleting a product that has been sold is refused, and leaves its sales and their totals alone
+    with pytest.raises(ValueError):
+        db.delete_stock("Poster")
+    assert db.verify_totals(repair=False) == []
+
+
+# Test case for the inventory cache used by retrieve_quantity
+def test_inventory_cache(db):
+    db.cache.check_interval = 0
+    db.create_update_stock(["Badge", "Blur", 30, 2.0])
+    # Repeated lookups are answered from the cache
+    hits = db.cache.hits
+    misses = db.cache.misses
+    for _ in range(5):
+        assert db.retrieve_quantity("Badge")[0] == 30
+    assert db.cache.hits == hits + 5
+    assert db.cache.misses == misses
+    # Writes made through the database are applied to the cache
+    db.checkout([["Badge", 4]])
+    assert db.retrieve_quantity("Badge")[0] == 26
+    # Writes made by another connection are detected through PRAGMA data_version
+    other = db.manager.connect()
+    other.execute("UPDATE stockItems SET quantity=? WHERE name=?", (12, "Badge"))
+    other.commit()
+    other.close()
+    assert db.retrieve_quantity("Badge")[0] == 12
+    assert db.cache.misses == misses + 1
+    # Deleting a product removes it from the cache
+    db.create_update_stock(["Pin", "Blur", 5, 1.0])
+    assert db.retrieve_quantity("Pin")[0] == 5
+    db.delete_stock("Pin")
+    assert db.retrieve_quantity("Pin") is None
+    # A sale takes its price from the database, even before the cache notices another connection changed it
+    db.cache.check_interval = 60
+    assert db.cache.get("Badge")[1] == 2.0
+    other = db.manager.connect()
+    other.execute("UPDATE stockItems SET price=? WHERE name=?", (3.0, "Badge"))
+    other.commit()
+    other.close()
+    db.create_sale(["Badge", 1])
+    assert db.cache.get("Badge")[1] == 2.0
+    assert db.connection.execute("SELECT price FROM sales ORDER BY id DESC LIMIT 1").fetchone() == (3.0, )
+
+
+# Test case for the background dbWorker
+def test_db_worker(tmp_path):
+    # A stand-in for the Tk root, which only needs after() to schedule polling
+    class root:
+        def after(self, delay, callback):
+            pass
+    worker = dbWorker(root(), str(tmp_path / "worker.db"))
+    results = []
+    busy = []
+    worker.on_busy = busy.append
+    worker.submit("create_update_stock", ["Hoodie", "One Direction", 20, 5.0])
+    worker.submit("checkout", [["Hoodie", 2]], callback=results.append)
+    worker.submit(lambda db: db.retrieve_quantity("Hoodie"), callback=results.append)
+    worker.submit("retrieve_quantity", callback=results.append, error=results.append)
+    worker.close()
+    # Callbacks only run on the main loop, in the order the requests were submitted
+    assert results == []
+    worker.poll()
+    assert results[:2] == [[("Hoodie", 2, 5.0, True)], (18, )]
+    assert isinstance(results[2], TypeError)
+    assert busy == [True, False]
+    assert worker.pending == 0
+
+
+# Test case for import_stock method
+def test_import_stock(tmp_path):
+    catalog = tmp_path / "catalog.csv"
+    catalog.write_text("name,band,quantity,price\nTee,Blur,10,15.0\nMug,,5,6.0\nCap,Blur,0,9.0\nTote,Blur,3,4.5\n")
+    db = database(str(tmp_path / "import.db"))
+    db.create_tables()
+    # Valid rows are imported across several chunks, and invalid rows are reported by line
+    imported, rejected = db.import_stock(read_catalog(str(catalog)), chunk_size=1)
+    assert imported == 2
+    assert [(line, reason) for line, values, reason in rejected] == [(3, "band is blank"), (4, "quantity must be greater than zero")]
+    assert db.retrieve_quantity("Tee")[0] == 10
+    assert db.retrieve_quantity("Tote")[0] == 3
+    # JSONL catalogs update existing products, and unreadable lines are rejected
+    catalog = tmp_path / "catalog.jsonl"
+    catalog.write_text('{"name": "Tee", "band": "Blur", "quantity": 25, "price": 15.0}\nnot json\n')
+    imported, rejected = db.import_stock(read_catalog(str(catalog)))
+    assert imported == 1
+    assert rejected[0][0] == 2
+    assert db.retrieve_quantity("Tee")[0] == 25
+    db.close_db()
+
+
+# Test case for iter_sales, iter_inventory and the streaming exports
+def test_export(tmp_path):
+    db = database(str(tmp_path / "export.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 10, 15.0])
+    db.create_update_stock(["Mug", "Oasis", 10, 6.0])
+    db.checkout([["Tee", 1], ["Mug", 2], ["Tee", 3]])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=?", ("2024-01-01 12:00:00", 1))
+    db.connection.commit()
+    # Sales are filtered by date range and band, and read in small batches
+    assert [sale[0] for sale in db.iter_sales(date(2024, 1, 1), date(2024, 1, 1), batch_size=1)] == [1]
+    assert [sale[0] for sale in db.iter_sales(date(2024, 1, 1), date(2100, 1, 1), bands=["Blur"], batch_size=1)] == [1, 3]
+    # Exports are written incrementally, with progress reported along the way
+    progress = []
+    count = export_sales(db, str(tmp_path / "sales.csv"), date(2024, 1, 1), date(2100, 1, 1), progress=progress.append)
+    assert count == 3
+    assert progress[-1] == 3
+    assert (tmp_path / "sales.csv").read_text().splitlines()[0] == "id,name,band,quantity,timestamp,price"
+    assert export_stock(db, str(tmp_path / "stock.jsonl")) == 2
+    assert '"name": "Mug"' in (tmp_path / "stock.jsonl").read_text().splitlines()[0]
+    db.close_db()
+
+
+# Test case for the opt-in queryStats instrumentation
+def test_query_stats(tmp_path):
+    db = database(str(tmp_path / "stats.db"))
+    db.create_tables()
+    stats = queryStats(slow_ms=0, capacity=3)
+    stats.attach(db)
+    db.create_update_stock(["Tee", "Blur", 10, 15.0])
+    for _ in range(4):
+        db.checkout([["Tee", 1]])
+    db.retrieve_inventory()
+    snapshot = stats.snapshot()
+    # Calls, rows and commits are counted per method
+    assert snapshot["methods"]["checkout"]["calls"] == 4
+    assert snapshot["methods"]["checkout"]["commits"] == 4
+    assert snapshot["methods"]["retrieve_inventory"]["rows"] == 1
+    assert snapshot["methods"]["checkout"]["p50_ms"] <= snapshot["methods"]["checkout"]["p99_ms"]
+    # Slow calls are kept in a bounded buffer, with the plan of each statement
+    assert len(snapshot["slow"]) == 3
+    assert snapshot["slow"][-1]["method"] == "retrieve_inventory"
+    assert any("idx_stockItems_timestamp" in " ".join(plan) for statement, plan in snapshot["slow"][-1]["statements"])
+    stats.dump(str(tmp_path / "stats.json"))
+    # Detaching restores the original methods
+    stats.detach(db)
+    db.retrieve_inventory()
+    assert stats.snapshot()["methods"]["retrieve_inventory"]["calls"] == 1
+    db.close_db()
+
+
+# Test case for the daily rollups and the reports that read them
+def test_daily_rollups(tmp_path):
+    db = database(str(tmp_path / "rollups.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 100, 10.0])
+    db.create_update_stock(["Mug", "Oasis", 100, 5.0])
+    db.checkout([["Tee", 1], ["Mug", 2], ["Tee", 3], ["Mug", 1]])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id IN (1, 2)", ("2024-01-01 12:00:00", ))
+    db.rebuild_totals()
+    # Past days are closed into the rollups, and only once
+    assert db.close_days() == ["2024-01-01"]
+    assert db.close_days() == []
+    assert db.report_products(date(2024, 1, 1), date(2024, 1, 1)) == [("Blur", "Tee", 1, 10.0, 7.5), ("Oasis", "Mug", 2, 10.0, 7.5)]
+    # Reports combine closed days with the days still trading, for any set of bands
+    assert db.report_totals(date(2024, 1, 1), date(2100, 1, 1)) == [("Blur", 4, 40.0, 30.0), ("Oasis", 3, 15.0, 11.25)]
+    assert db.report_totals(date(2024, 1, 1), date(2100, 1, 1), ["Oasis"]) == [("Oasis", 3, 15.0, 11.25)]
+    assert db.report_products(date(2024, 1, 1), date(2100, 1, 1), ["Blur"]) == [("Blur", "Tee", 4, 40.0, 30.0)]
+    # Every band that sold today is reported, not only the first
+    assert [row[0] for row in db.retrieve_band_totals()] == ["Blur", "Oasis"]
+    # Deleting a sale from a closed day re-closes it
+    db.delete_sale(1)
+    assert db.report_totals(date(2024, 1, 1), date(2024, 1, 1)) == [("Oasis", 2, 10.0, 7.5)]
+    # A sale booked to a day before the last closed day, which was never closed itself, is in both reports
+    db.checkout([["Tee", 2]])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=(SELECT MAX(id) FROM sales)", ("2023-12-31 12:00:00", ))
+    db.connection.commit()
+    db.rebuild_totals()
+    assert db.report_products(date(2023, 12, 31), date(2024, 1, 1)) == [("Blur", "Tee", 2, 20.0, 15.0), ("Oasis", "Mug", 2, 10.0, 7.5)]
+    assert db.report_totals(date(2023, 12, 31), date(2024, 1, 1)) == [("Blur", 2, 20.0, 15.0), ("Oasis", 2, 10.0, 7.5)]
+    db.close_db()
+
+
+# Test case for the keyset paginated retrieve methods
+def test_pagination(tmp_path):
+    db = database(str(tmp_path / "pages.db"))
+    db.create_tables()
+    for i in range(7):
+        db.create_update_stock([f"Item {i}", "Blur" if i % 2 else "Oasis", i, 1.0 + i])
+    db.checkout([[f"Item {i}", 1] for i in range(1, 7)])
+    # Walking the pages with the last name as the cursor visits every product once
+    names = []
+    page = db.retrieve_inventory_page(limit=3)
+    while page:
+        names += [item[0] for item in page]
+        page = db.retrieve_inventory_page(after=page[-1][0], limit=3)
+    assert names == [f"Item {i}" for i in range(7)]
+    # Filters are applied by the database
+    assert [item[0] for item in db.retrieve_inventory_page(band="Blur", min_quantity=1, max_price=5.0)] == ["Item 3"]
+    assert [item[0] for item in db.retrieve_inventory_page(min_price=6.0)] == ["Item 5", "Item 6"]
+    # The stock screen shows the products updated today by default, as it always has
+    db.connection.execute("UPDATE stockItems SET timestamp=? WHERE name IN ('Item 1', 'Item 2')", ("2024-01-01 12:00:00", ))
+    db.connection.commit()
+    assert [item[0] for item in db.retrieve_inventory_page(min_quantity=1, updated_from=datetime.now(timezone.utc).date())] == ["Item 3", "Item 4", "Item 5", "Item 6"]
+    assert [item[0] for item in db.retrieve_inventory_page(min_quantity=1, updated_from=date(2024, 1, 1))] == ["Item 2", "Item 3", "Item 4", "Item 5", "Item 6"]
+    # Sales pages run newest first, using the last id as the cursor
+    first = db.retrieve_sales_page(limit=4)
+    assert [sale[0] for sale in first] == [6, 5, 4, 3]
+    assert [sale[0] for sale in db.retrieve_sales_page(before=first[-1][0], limit=4)] == [2, 1]
+    assert [sale[0] for sale in db.retrieve_sales_page(band="Oasis", start=date(2024, 1, 1), end=date(2100, 1, 1))] == [6, 4, 2]
+    db.close_db()
+
+
+# Test case for skipping the DDL once the schema is current
+def test_schema_version(tmp_path):
+    db = database(str(tmp_path / "version.db"))
+    db.create_tables()
+    assert db.connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    # A current database runs no DDL at all
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    db.create_tables()
+    db.connection.set_trace_callback(None)
+    assert statements == ["PRAGMA user_version"]
+    db.close_db()
+
+
+# Test case for migrating products keyed by name to integer ids
+def test_integer_keys(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE stockItems (name TEXT PRIMARY KEY, band TEXT, quantity INTEGER, price REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE sales (id INTEGER PRIMARY KEY, stockItemID TEXT, quantity INTEGER, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, price REAL,
+                            FOREIGN KEY (stockItemID) REFERENCES StockItems(name));
+        CREATE INDEX idx_sales_timestamp ON sales (timestamp, stockItemID, quantity, price);
+        INSERT INTO stockItems (name, band, quantity, price) VALUES ('Hoodie', 'Muse', 10, 5.0), ('Tee', 'Blur', 10, 8.0);
+        INSERT INTO sales (id, stockItemID, quantity, price) VALUES (4, 'Hoodie', 1, 5.0), (7, 'Tee', 2, 8.0), (9, 'Deleted', 1, 3.0),
+                                                                   (10, 'Deleted', 1, 3.5), (11, NULL, 1, 2.0);
+    """)
+    legacy.close()
+    db = database(path)
+    db.create_tables()
+    # Sales keep their ids and refer to their product by id, and no sale is lost
+    assert db.connection.execute("SELECT id, stockItemID FROM sales ORDER BY id").fetchall() == [(4, 1), (7, 2), (9, 3), (10, 3), (11, 4)]
+    # Sales of deleted products are kept under a restored product with no stock
+    assert sorted(sale[:3] for sale in db.retrieve_sales()) == [(4, "Hoodie", "Muse"), (7, "Tee", "Blur"), (9, "Deleted", DELETED_BAND),
+                                                                 (10, "Deleted", DELETED_BAND), (11, UNKNOWN_PRODUCT, DELETED_BAND)]
+    assert db.connection.execute("SELECT quantity, price FROM products WHERE name='Deleted'").fetchone() == (0, 3.5)
+    assert db.verify_totals(repair=False) == []
+    assert db.connection.execute("SELECT name FROM sqlite_master WHERE name IN ('legacySales', 'legacyStockItems')").fetchall() == []
+    for sale in (9, 10, 11):
+        db.void_sale(sale)
+    assert [row[0] for row in db.search_products("hood")] == ["Hoodie"]
+    # Renaming a product keeps its sales, and moving it to another band moves its totals
+    db.rename_stock("Hoodie", "Zip Hoodie")
+    assert sorted(sale[1] for sale in db.retrieve_sales()) == ["Tee", "Zip Hoodie"]
+    db.create_update_stock(["Zip Hoodie", "Blur", 10, 5.0])
+    assert db.retrieve_band_totals() == [("Blur", 21.0, 21.0 * 0.75, 3)]
+    # The foreign keys are enforced, and a product that has been sold cannot be deleted from under its sales
+    with pytest.raises(sqlite3.IntegrityError):
+        db.connection.execute("INSERT INTO sales (stockItemID, quantity, price) VALUES (99, 1, 1.0)")
+    with pytest.raises(ValueError):
+        db.delete_stock("Tee")
+    with pytest.raises(sqlite3.IntegrityError):
+        db.connection.execute("DELETE FROM stockItems WHERE name='Tee'")
+    db.connection.rollback()
+    assert sorted(sale[0] for sale in db.retrieve_sales()) == [4, 7]
+    assert db.retrieve_band_totals() == [("Blur", 21.0, 21.0 * 0.75, 3)]
+    assert db.verify_totals(repair=False) == []
+    db.close_db()
+
+
+# Test case for several connections creating the tables of an old database at the same time
+def test_concurrent_migration(tmp_path):
+    path = str(tmp_path / "startup.db")
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE stockItems (name TEXT PRIMARY KEY, band TEXT, quantity INTEGER, price REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE sales (id INTEGER PRIMARY KEY, stockItemID TEXT, quantity INTEGER, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, price REAL);
+        INSERT INTO stockItems (name, band, quantity, price) VALUES ('Hoodie', 'Muse', 10, 5.0);
+        INSERT INTO sales (id, stockItemID, quantity, price) VALUES (3, 'Hoodie', 1, 5.0);
+    """)
+    legacy.close()
+    # The worker, the journal and the archiver all open the database at startup
+    databases = [database(path) for _ in range(3)]
+    start = threading.Barrier(len(databases))
+    errors = []
+    def open_tables(db):
+        start.wait()
+        try:
+            db.create_tables()
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=open_tables, args=(db, )) for db in databases]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One of them migrated the database, and the others found it already current
+    assert errors == []
+    for db in databases:
+        assert [sale[:4] for sale in db.retrieve_sales()] == [(3, "Hoodie", "Muse", 1)]
+        db.close_db()
+
+
+# Test case for upgrading a sales table whose foreign key deleted a product's sales with it
+def test_restrict_sales(tmp_path):
+    path = str(tmp_path / "cascade.db")
+    db = database(path)
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "Muse", 10, 5.0])
+    db.checkout([["Hoodie", 2]])
+    # Rewrites the schema as the previous version created it
+    db.connection.execute("PRAGMA writable_schema=ON")
+    db.connection.execute("UPDATE sqlite_master SET sql=replace(replace(sql, 'ON DELETE RESTRICT', 'ON DELETE CASCADE'), ' AUTOINCREMENT', '') WHERE name='sales'")
+    db.connection.execute("PRAGMA writable_schema=OFF")
+    db.connection.execute("PRAGMA user_version=5")
+    db.connection.commit()
+    db.close_db()
+    db = database(path)
+    db.create_tables()
+    assert "ON DELETE RESTRICT" in db.connection.execute("SELECT sql FROM sqlite_master WHERE name='sales'").fetchone()[0]
+    assert "AUTOINCREMENT" in db.connection.execute("SELECT sql FROM sqlite_master WHERE name='sales'").fetchone()[0]
+    assert db.connection.execute("SELECT name FROM sqlite_master WHERE name='retiredSales'").fetchone() is None
+    # The sales, their triggers and indexes are all back on the rebuilt table
+    assert [sale[:4] for sale in db.retrieve_sales()] == [(1, "Hoodie", "Muse", 2)]
+    with pytest.raises(ValueError):
+        db.delete_stock("Hoodie")
+    db.checkout([["Hoodie", 1]])
+    assert db.verify_totals(repair=False) == []
+    assert db.retrieve_band_totals() == [("Muse", 15.0, 15.0 * 0.75, 3)]
+    assert db.connection.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert db.connection.execute("PRAGMA foreign_key_check").fetchall() == []
+    db.close_db()
+
+
+# Test case for checkout_carts and void_sale methods
+def test_group_checkout_and_void(tmp_path):
+    db = database(str(tmp_path / "group.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 3, 5.0])
+    # Later carts see the stock left by earlier ones, and each recorded line gets its sale id
+    first, second = db.checkout_carts([[["Hoodie", 2]], [["Hoodie", 2], ["Tee", 1]]])
+    assert first == [("Hoodie", 2, 5.0, True, 1)]
+    assert second == [("Hoodie", 2, 5.0, False, None), ("Tee", 1, None, False, None)]
+    assert db.checkout([["Hoodie", 1]]) == [("Hoodie", 1, 5.0, True)]
+    # Voiding returns the stock and removes the sale together
+    assert db.void_sale(1)
+    assert db.retrieve_quantity("Hoodie") == (2, )
+    assert [sale[0] for sale in db.retrieve_sales()] == [2]
+    assert db.verify_totals(repair=False) == []
+    assert not db.void_sale(1)
+    db.close_db()
+
+
+# Sells from a separate process, as another till would, and reports how many reservations succeeded
+def reserve_many(path, attempts, results):
+    db = database(path)
+    reserved = sum(db.reserve_stock("Hoodie", 1, retries=50) for _ in range(attempts))
+    for _ in range(attempts):
+        db.update_stock_quantity("Tee", 1)
+    db.close_db()
+    results.put(reserved)
+
+
+# Test case for reserve_stock under contention from several processes
+def test_reserve_stock_contention(tmp_path):
+    path = str(tmp_path / "contention.db")
+    db = database(path)
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 100, 5.0])
+    db.create_update_stock(["Tee", "Blur", 1000, 15.0])
+    assert not db.reserve_stock("Cap", 1)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=reserve_many, args=(path, 50, results)) for _ in range(6)]
+    for process in processes:
+        process.start()
+    reserved = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+    # 300 attempts raced for 100 hoodies: exactly 100 succeeded, and the stock never went below zero
+    assert sum(reserved) == 100
+    assert db.retrieve_quantity("Hoodie") == (0, )
+    # Every one of the 300 unconditional decrements was kept
+    assert db.retrieve_quantity("Tee") == (700, )
+    db.close_db()
+
+
+# Test case for the sale journal
+def test_sale_journal(tmp_path):
+    db = database(str(tmp_path / "journal.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 500, 5.0])
+    applied = []
+    journal = saleJournal(str(tmp_path / "sales.journal"), database(str(tmp_path / "journal.db")), on_applied=applied.extend)
+    # Several tills append at once, and each append returns once its entry is on disk
+    tills = [threading.Thread(target=lambda: [journal.append([["Hoodie", 1]]) for _ in range(25)]) for _ in range(8)]
+    for till in tills:
+        till.start()
+    for till in tills:
+        till.join()
+    journal.append([["Hoodie", 1000]])
+    journal.close()
+    journal.db.close_db()
+    # Every entry was applied exactly once, in order, and the journal was emptied
+    assert [seq for seq, lines in applied] == list(range(1, 202))
+    assert applied[-1][1] == [("Hoodie", 1000, 5.0, False, None)]
+    # The journal wrote through its own connection, which this instance's cache only notices after its check interval
+    db.cache.invalidate()
+    assert db.retrieve_quantity("Hoodie") == (300, )
+    assert db.journal_position("sales") == 201
+    assert (tmp_path / "sales.journal").read_bytes() == b""
+    db.close_db()
+
+
+# Test case for replaying a journal after a crash
+def test_sale_journal_replay(tmp_path):
+    db = database(str(tmp_path / "replay.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 10, 5.0])
+    # Entry 1 was applied before the crash, entries 2 and 3 were not, and entry 4 was torn mid-write
+    db.checkout_carts([[["Hoodie", 1]]], "sales", 1)
+    path = tmp_path / "sales.journal"
+    entries = [encode_entry(seq, [["Hoodie", seq]]) for seq in range(1, 5)]
+    path.write_bytes(b"".join(entries[:3]) + entries[3][:-4])
+    journal = saleJournal(str(path), database(str(tmp_path / "replay.db")))
+    assert [entry[0] for entry in journal.pending] == [2, 3]
+    # New sales continue after the last complete entry
+    assert journal.append([["Hoodie", 1]]) == 4
+    journal.close()
+    journal.db.close_db()
+    db.cache.invalidate()
+    assert db.retrieve_quantity("Hoodie") == (10 - 1 - 2 - 3 - 1, )
+    assert db.journal_position("sales") == 4
+    # Opening the emptied journal again applies nothing twice
+    journal = saleJournal(str(path), database(str(tmp_path / "replay.db")))
+    journal.close()
+    journal.db.close_db()
+    assert len(db.retrieve_sales()) == 4
+    db.close_db()
+
+
+# Test case for journaling sales into a checkpointed database
+def test_sale_journal_checkpointed(tmp_path):
+    path = str(tmp_path / "checkpointed.db")
+    db = database(path, storage="checkpointed")
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 10, 5.0])
+    manager = connectionManager(path, storage="checkpointed", checkpoint_interval=3600)
+    journal = saleJournal(str(tmp_path / "sales.journal"), database(manager=manager))
+    journal.append([["Hoodie", 1]])
+    while journal.applied < 1:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    # The sale is applied, but only in memory, so the journal keeps it until a checkpoint has written it
+    assert (tmp_path / "sales.journal").read_bytes() != b""
+    manager.checkpoint()
+    deadline = time.monotonic() + 5
+    while (tmp_path / "sales.journal").read_bytes() != b"" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (tmp_path / "sales.journal").read_bytes() == b""
+    journal.close()
+    journal.db.close_db()
+    manager.close()
+    db.close_db()
+    # A database only held in memory would lose every sale the journal let go of
+    memory = database(":memory:")
+    with pytest.raises(ValueError):
+        saleJournal(str(tmp_path / "memory.journal"), memory)
+    memory.close_db()
+
+
+# Test case for the sale times kept in the journal
+def test_sale_journal_timestamps(tmp_path):
+    db = database(str(tmp_path / "times.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 10, 5.0])
+    db.close_day(date(2024, 2, 14))
+    # A sale rung up just before midnight is applied after the day was closed, and is still booked to that day
+    path = tmp_path / "sales.journal"
+    path.write_bytes(encode_entry(1, [["Hoodie", 2]], "2024-02-14 23:59:30"))
+    journal = saleJournal(str(path), database(str(tmp_path / "times.db")))
+    journal.append([["Hoodie", 1]])
+    journal.close()
+    journal.db.close_db()
+    sales = db.reader.execute("SELECT quantity, timestamp FROM sales ORDER BY id").fetchall()
+    assert sales[0] == (2, "2024-02-14 23:59:30")
+    assert sales[1][1][:10] == db.reader.execute("SELECT DATE('now')").fetchone()[0]
+    assert db.reader.execute("SELECT SUM(units) FROM dailyRollups WHERE day=?", ("2024-02-14", )).fetchone()[0] == 2
+    assert db.verify_totals() == []
+    db.close_db()
+
+
+# Test case for a journaled batch that fails to apply
+def test_sale_journal_retry(tmp_path):
+    db = database(str(tmp_path / "retry.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 10, 5.0])
+    errors = []
+    journal = saleJournal(str(tmp_path / "sales.journal"), database(str(tmp_path / "retry.db")), apply_interval=0.01, on_error=errors.append)
+    checkout_carts = journal.db.checkout_carts
+    # The first attempt fails as if the database were locked, and the batch is kept and applied on the next attempt
+    def locked_once(*args):
+        journal.db.checkout_carts = checkout_carts
+        raise sqlite3.OperationalError("database is locked")
+    journal.db.checkout_carts = locked_once
+    journal.append([["Hoodie", 2]])
+    journal.append([["Hoodie", 3]])
+    for _ in range(500):
+        if journal.applied == 2:
+            break
+        time.sleep(0.01)
+    journal.close()
+    journal.db.close_db()
+    assert [str(error) for error in errors] == ["database is locked"]
+    assert journal.applied == 2
+    db.cache.invalidate()
+    assert db.retrieve_quantity("Hoodie") == (5, )
+    assert (tmp_path / "sales.journal").read_bytes() == b""
+    db.close_db()
+
+
+# Test case for a crash between applying journaled sales and emptying the journal
+def test_sale_journal_crash(tmp_path, monkeypatch):
+    db = database(str(tmp_path / "crash.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 10, 5.0])
+    db.backup(str(tmp_path / "before.db"))
+    path = tmp_path / "sales.journal"
+    # The power is cut after the applier commits, before the journal is emptied
+    monkeypatch.setattr(saleJournal, "truncate", lambda self: None)
+    journal = saleJournal(str(path), database(str(tmp_path / "crash.db")))
+    # The applier's commits are synced before returning, so the journal is never emptied ahead of them
+    assert journal.db.connection.execute("PRAGMA synchronous").fetchone()[0] == 2
+    journal.append([["Hoodie", 2]])
+    journal.append([["Hoodie", 3]])
+    journal.close()
+    journal.db.close_db()
+    monkeypatch.undo()
+    assert len(path.read_bytes().splitlines()) == 2
+    # Restarting finds both entries applied, records neither again, and empties the journal
+    journal = saleJournal(str(path), database(str(tmp_path / "crash.db")))
+    assert not journal.pending
+    journal.close()
+    journal.db.close_db()
+    db.cache.invalidate()
+    assert db.retrieve_quantity("Hoodie") == (5, )
+    assert len(db.retrieve_sales()) == 2
+    assert path.read_bytes() == b""
+    db.close_db()
+    # Had the commit itself been lost, the entries kept in the journal are applied again from the older database
+    path.write_bytes(encode_entry(1, [["Hoodie", 2]]) + encode_entry(2, [["Hoodie", 3]]))
+    journal = saleJournal(str(path), database(str(tmp_path / "before.db")))
+    assert [entry[0] for entry in journal.pending] == [1, 2]
+    journal.close()
+    journal.db.close_db()
+    db = database(str(tmp_path / "before.db"))
+    assert db.retrieve_quantity("Hoodie") == (5, )
+    db.close_db()
+
+
+# Test case for search_products method
+def test_search_products(tmp_path):
+    db = database(str(tmp_path / "search.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 20, 5.0])
+    db.create_update_stock(["Tour Tee", "Oasis", 5, 15.0])
+    db.create_update_stock(["Tote Bag", "Blur", 3, 4.5])
+    # Every word typed is matched as a prefix of a word in the name or band
+    assert [row[0] for row in db.search_products("to")] == ["Tote Bag", "Tour Tee"]
+    # The limit keeps the first products by name, not the first ones added
+    assert [row[0] for row in db.search_products("to", limit=1)] == ["Tote Bag"]
+    assert db.search_products("tou oa") == [("Tour Tee", "Oasis", 5, 15.0)]
+    assert db.search_products("one dir") == [("Hoodie", "One Direction", 20, 5.0)]
+    assert [row[0] for row in db.search_products("")] == ["Hoodie", "Tote Bag", "Tour Tee"]
+    assert db.search_products('"') == []
+    # The index follows replacements, band changes and deletions
+    db.create_update_stock(["Tour Tee", "Pulp", 0, 15.0])
+    assert db.search_products("oasis") == []
+    assert db.search_products("pulp") == [("Tour Tee", "Pulp", 0, 15.0)]
+    assert db.search_products("pulp", in_stock=True) == []
+    db.rename_stock("Tote Bag", "Tote Sack")
+    assert [row[0] for row in db.search_products("sack")] == ["Tote Sack"]
+    assert db.search_products("bag") == []
+    db.delete_stock("Hoodie")
+    assert db.search_products("hood") == []
+    assert db.connection.execute("INSERT INTO productSearch (productSearch) VALUES ('integrity-check')").fetchall() == []
+    db.close_db()
+
+
+# Test case for archiving closed days and compacting the database
+def test_archive(tmp_path):
+    db = database(str(tmp_path / "hot.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 100, 10.0])
+    db.create_update_stock(["Mug", "Oasis", 100, 5.0])
+    db.checkout([["Tee", 1], ["Mug", 2], ["Tee", 3], ["Mug", 1]])
+    db.connection.executemany("UPDATE sales SET timestamp=? WHERE id=?", [("2023-12-31 12:00:00", 1), ("2024-01-01 12:00:00", 2)])
+    db.connection.commit()
+    db.rebuild_totals()
+    db.close_days()
+    report = db.report_totals(date(2023, 1, 1), date(2100, 1, 1))
+    # Each year of closed days moves into its own archive, and today's sales stay in the working database
+    assert archive_days(db, str(tmp_path / "archives")) == {"2023": 1, "2024": 1}
+    assert [row[0] for row in db.connection.execute("SELECT id FROM sales")] == [3, 4]
+    assert sorted(os.listdir(tmp_path / "archives")) == ["sales-2023.db", "sales-2024.db"]
+    assert archive_days(db, str(tmp_path / "archives")) == {}
+    # Reports, exports and the sales history still include the archived sales
+    assert db.report_totals(date(2023, 1, 1), date(2100, 1, 1)) == report
+    assert [sale[0] for sale in db.retrieve_sales_page()] == [4, 3, 2, 1]
+    assert [sale[:4] for sale in db.iter_sales(date(2023, 12, 31), date(2024, 1, 1))] == [(1, "Tee", "Blur", 1), (2, "Mug", "Oasis", 2)]
+    assert [sale[0] for sale in db.retrieve_sales_page(band="Oasis", end=date(2024, 6, 1))] == [2]
+    archive = sqlite3.connect(str(tmp_path / "archives" / "sales-2024.db"))
+    plan = archive.execute("EXPLAIN QUERY PLAN SELECT id FROM sales WHERE band=? AND id < ? ORDER BY id DESC LIMIT 50", ("Oasis", 10)).fetchall()
+    archive.close()
+    assert "idx_sales_band" in plan[0][3]
+    assert db.verify_totals(repair=False) == []
+    # Compacting returns the freed pages, and the search index survives a full VACUUM
+    assert compact(db)["pages"] > 0
+    compact(db, vacuum=True)
+    assert db.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert [row[0] for row in db.search_products("tee")] == ["Tee"]
+    db.close_db()
+
+
+# Test case for compacting a database created before incremental vacuuming was the default
+def test_compact_without_auto_vacuum(tmp_path):
+    db = database(str(tmp_path / "old.db"))
+    db.create_tables()
+    db.connection.execute("PRAGMA auto_vacuum=NONE")
+    db.connection.execute("VACUUM")
+    db.create_update_stock(["Tee", "Blur", 10000, 10.0])
+    db.checkout([["Tee", 1]] * 5000)
+    db.connection.execute("UPDATE sales SET timestamp=?", ("2023-06-01 12:00:00", ))
+    db.connection.commit()
+    db.rebuild_totals()
+    db.close_days()
+    pages = db.connection.execute("PRAGMA page_count").fetchone()[0]
+    archive_days(db, str(tmp_path / "archives"))
+    # The first compaction rebuilds the file once, which returns the archived pages and enables incremental vacuuming
+    sizes = compact(db)
+    assert sizes["free_pages"] > 0
+    assert sizes["pages"] < pages
+    assert db.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert db.connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    db.close_db()
+
+
+# Test case for the sales history across more monthly archives than SQLite can attach
+def test_archive_months(tmp_path):
+    db = database(str(tmp_path / "months.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 100, 10.0])
+    db.checkout([["Tee", 1]] * 15)
+    db.connection.executemany("UPDATE sales SET timestamp=? WHERE id=?", [(f"{2023 + month // 12}-{month % 12 + 1:02d}-15 12:00:00", month + 1) for month in range(14)])
+    db.connection.commit()
+    db.rebuild_totals()
+    db.close_days()
+    assert len(archive_days(db, str(tmp_path / "archives"), period="month")) == 14
+    # A sale on a day that was never closed stays in the working database, between the archived months
+    db.create_sale(["Tee", 1])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=?", ("2023-03-20 12:00:00", 16))
+    db.connection.commit()
+    assert [sale[0] for sale in db.retrieve_sales_page(limit=20)] == list(range(16, 0, -1))
+    assert [sale[0] for sale in db.retrieve_sales_page(before=5, limit=3)] == [4, 3, 2]
+    assert [sale[0] for sale in db.iter_sales(date(2023, 1, 1), date(2024, 12, 31))] == [1, 2, 3, 16] + list(range(4, 15))
+    assert [sale[0] for sale in db.iter_sales(date(2023, 12, 1), date(2024, 1, 31))] == [12, 13]
+    db.close_db()
+
+
+# Test case for selling and archiving again once archiving has emptied the sales table
+def test_archive_again(tmp_path):
+    directory = str(tmp_path / "archives")
+    db = database(str(tmp_path / "again.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 100, 10.0])
+    def sell_on(day, quantity):
+        db.checkout([["Tee", quantity]])
+        db.connection.execute("UPDATE sales SET timestamp=? WHERE id=(SELECT MAX(id) FROM sales)", (f"{day} 12:00:00", ))
+        db.connection.commit()
+        db.rebuild_totals()
+        db.close_days()
+    sell_on("2023-06-01", 1)
+    sell_on("2023-06-01", 2)
+    assert archive_days(db, directory) == {"2023": 2}
+    assert db.connection.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 0
+    # Forgets the id sequence, as a sales table rebuilt from an emptied one would, and archiving restores it
+    db.connection.execute("DELETE FROM sqlite_sequence WHERE name='sales'")
+    db.connection.commit()
+    assert archive_days(db, directory) == {}
+    # New sales carry on from the archived ids, rather than starting again from 1
+    sell_on("2023-06-02", 3)
+    assert archive_days(db, directory) == {"2023": 1}
+    assert [sale[:4] for sale in db.iter_sales(date(2023, 6, 1), date(2023, 6, 2))] == [(1, "Tee", "Blur", 1), (2, "Tee", "Blur", 2), (3, "Tee", "Blur", 3)]
+    # A sale under an id the archive holds for a different sale stops the run, and stays in the working database
+    db.connection.execute("INSERT INTO sales (id, stockItemID, quantity, timestamp, price) VALUES (2, 1, 4, '2023-06-03 12:00:00', 10.0)")
+    db.connection.commit()
+    db.close_days()
+    with pytest.raises(ValueError):
+        archive_days(db, directory)
+    assert db.connection.execute("SELECT id, quantity FROM sales").fetchall() == [(2, 4)]
+    assert [sale[3] for sale in db.iter_sales(date(2023, 6, 1), date(2023, 6, 2))] == [1, 2, 3]
+    db.close_db()
+
+
+# Test case for online backups and restoring them
+def test_backup_and_restore(tmp_path):
+    db = database(str(tmp_path / "till.db"))
+    db.create_tables()
+    db.create_update_stock(["Hoodie", "One Direction", 20, 5.0])
+    directory = str(tmp_path / "backups")
+    # Another till keeps selling while the first snapshot is copied one page at a time
+    other = database(str(tmp_path / "till.db"))
+    selling = threading.Event()
+    def sell():
+        while not selling.is_set():
+            other.checkout([["Hoodie", 0]])
+            other.update_stock_quantity("Hoodie", 0)
+    till = threading.Thread(target=sell)
+    till.start()
+    first = take_snapshot(db, directory, keep=2, pages=1, sleep=0.001)
+    selling.set()
+    till.join()
+    first = take_snapshot(db, directory, keep=2)
+    assert os.path.exists(first)
+    db.checkout([["Hoodie", 5]])
+    second = take_snapshot(db, directory, keep=2)
+    db.checkout([["Hoodie", 5]])
+    third = take_snapshot(db, directory, keep=2)
+    # Only the newest snapshots are kept, and every one passed its integrity check
+    assert snapshots(directory, str(tmp_path / "till.db")) == [second, third]
+    # Restoring the latest snapshot loses the sales recorded after it, and clears the cache
+    db.checkout([["Hoodie", 5]])
+    assert db.retrieve_quantity("Hoodie") == (5, )
+    assert restore_latest(db, directory) == third
+    assert db.retrieve_quantity("Hoodie") == (10, )
+    assert len(db.retrieve_sales()) == 2
+    assert restore_latest(db, str(tmp_path / "none")) is None
+    other.close_db()
+    db.close_db()
+
+
+# Test case for the columnar sales snapshot
+def test_sales_snapshot(tmp_path):
+    db = database(str(tmp_path / "analytics.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 10, 10.0])
+    db.create_update_stock(["Mug", "Blur", 10, 5.0])
+    db.create_update_stock(["Cap", "Oasis", 4, 8.0])
+    db.checkout([["Tee", 2], ["Mug", 1], ["Cap", 2]])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=3", ("2024-06-01 21:15:00", ))
+    db.connection.executemany("UPDATE sales SET timestamp=? WHERE id=?", [("2024-06-01 19:05:00", 1), ("2024-06-01 19:45:00", 2)])
+    db.connection.commit()
+    snapshot = salesSnapshot(db, date(2024, 6, 1))
+    # Each sale is stored once per column, with its product dictionary encoded
+    assert list(snapshot.ids) == [1, 2, 3]
+    assert snapshot.names == ["Tee", "Mug", "Cap"]
+    assert [(hour.hour, units, gross) for hour, units, gross in snapshot.by_hour()] == [(19, 3, 25.0), (21, 2, 16.0)]
+    assert snapshot.by_product() == [("Tee", "Blur", 2, 20.0, 0.2), ("Cap", "Oasis", 2, 16.0, 0.5), ("Mug", "Blur", 1, 5.0, 0.1)]
+    assert snapshot.by_band() == [("Blur", 3, 25.0, 0.15), ("Oasis", 2, 16.0, 0.5)]
+    # Refreshing only appends the new sales, and picks up renames
+    db.checkout([["Cap", 1]])
+    db.connection.execute("UPDATE sales SET timestamp=? WHERE id=4", ("2024-06-01 21:30:00", ))
+    db.connection.commit()
+    db.rename_stock("Cap", "Snapback")
+    assert snapshot.refresh() == 1
+    assert snapshot.by_band()[1] == ("Oasis", 3, 24.0, 0.75)
+    assert snapshot.by_product()[0][:2] == ("Snapback", "Oasis")
+    # A voided sale is noticed, and the range is loaded again
+    db.void_sale(1)
+    assert snapshot.refresh() == 3
+    assert snapshot.by_product()[0] == ("Snapback", "Oasis", 3, 24.0, 0.75)
+    db.close_db()
+
+
+# A stand-in for the two NumPy functions the snapshot sums with, following NumPy's results, floats included
+class stubNumpy:
+    @staticmethod
+    def frombuffer(buffer, dtype):
+        return array(dtype, bytes(buffer))
+
+    @staticmethod
+    def bincount(x, weights, minlength):
+        totals = array("d", [0.0] * max(minlength, max(x) + 1))
+        for key, weight in zip(x, weights):
+            totals[key] += weight
+        return totals
+
+
+# Test case for summing the snapshot's columns with NumPy, which gives the same totals as summing them in Python
+@pytest.mark.parametrize("module", ["stub", "numpy"])
+def test_sales_snapshot_numpy(tmp_path, monkeypatch, module):
+    numpy = stubNumpy if module == "stub" else pytest.importorskip("numpy")
+    db = database(str(tmp_path / "columns.db"))
+    db.create_tables()
+    db.create_update_stock(["Tee", "Blur", 50, 10.0])
+    db.create_update_stock(["Mug", "Blur", 50, 4.5])
+    db.create_update_stock(["Cap", "Oasis", 50, 8.25])
+    db.checkout([["Tee", 2], ["Mug", 1], ["Cap", 3], ["Tee", 1], ["Cap", 1]])
+    db.connection.executemany("UPDATE sales SET timestamp=? WHERE id=?", [(f"2024-06-01 {8 + sale * 3}:15:00", sale) for sale in range(1, 6)])
+    db.connection.commit()
+    snapshot = salesSnapshot(db, date(2024, 6, 1))
+    monkeypatch.setattr(analytics, "numpy", None)
+    python = (snapshot.by_hour(), snapshot.by_product(), snapshot.by_band())
+    monkeypatch.setattr(analytics, "numpy", numpy)
+    assert (snapshot.by_hour(), snapshot.by_product(), snapshot.by_band()) == python
+    assert [units for hour, units, gross in snapshot.by_hour()] == [2, 1, 3, 1, 1]
+    db.close_db()
@@ -0,0 +1,23 @@
+import sys
+import os
+import subprocess
+import tkinter
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+# Test case for importing the user interface without starting it
+def test_import_is_headless():
+    # Importing the module defines the frames, but creates no window and opens no database
+    import user_interface
+    assert tkinter._default_root is None
+    assert callable(user_interface.main)
+
+
+# Test case for importing the business logic without tkinter
+def test_backend_imports_without_tkinter():
+    # The backend modules are imported in a fresh interpreter, so nothing else has loaded tkinter
+    code = "import sys, database, worker, catalog, export, reports, instrumentation, journal, archive, backup, analytics; assert 'tkinter' not in sys.modules"
+    result = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,131 @@
+import sys
+import os
+import http.client
+import json
+import threading
+import time
+import pytest
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+from pos_server import posServer
+from database import database
+
+
+# Define a fixture to run a server against a new database with one product
+@pytest.fixture
+def server(tmp_path):
+    server = posServer(("127.0.0.1", 0), str(tmp_path / "pos.db"))
+    server.db.create_update_stock(["Hoodie", "One Direction", 100, 5.0])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Sends a request to the server, and returns the status and decoded JSON response
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address)
+    connection.request(method, path, json.dumps(body) if body is not None else None, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+# Test case for each endpoint
+def test_endpoints(server):
+    status, body = request(server, "POST", "/sale", {"cart": [["Hoodie", 2], ["Tee", 1]]})
+    assert status == 200
+    assert body["lines"] == [{"name": "Hoodie", "quantity": 2, "price": 5.0, "recorded": True, "id": 1},
+                             {"name": "Tee", "quantity": 1, "price": None, "recorded": False, "id": None}]
+    assert request(server, "GET", "/stock?name=Hoodie") == (200, {"name": "Hoodie", "band": "One Direction", "quantity": 98, "price": 5.0})
+    assert request(server, "GET", "/stock?name=Tee")[0] == 404
+    assert request(server, "GET", "/totals") == (200, {"totals": [{"band": "One Direction", "gross": 10.0, "net": 7.5, "units": 2}]})
+    assert request(server, "POST", "/void", {"id": 1}) == (200, {"voided": True})
+    assert request(server, "POST", "/void", {"id": 1}) == (404, {"voided": False})
+    assert request(server, "GET", "/stock?name=Hoodie")[1]["quantity"] == 100
+    assert request(server, "POST", "/sale", {"cart": "Hoodie"})[0] == 400
+    # Quantities and ids must be positive integers, rather than anything int() would accept
+    for quantity in (1.9, True, "2", 0, -1, None):
+        assert request(server, "POST", "/sale", {"cart": [["Hoodie", quantity]]})[0] == 400
+    assert request(server, "POST", "/sale", {"cart": [[7, 1]]})[0] == 400
+    assert request(server, "POST", "/void", {"id": 1.5})[0] == 400
+    assert request(server, "GET", "/stock?name=Hoodie")[1]["quantity"] == 100
+    assert request(server, "GET", "/totals?day=yesterday")[0] == 400
+
+
+# Test case for grouping concurrent sales into shared transactions
+def test_group_commit(server):
+    # Hold the writer thread, so sales from every till queue up behind it
+    release = threading.Event()
+    blocker = threading.Thread(target=server.committer.submit, args=(lambda db: release.wait(), ))
+    blocker.start()
+    statuses = []
+    tills = [threading.Thread(target=lambda: statuses.append(request(server, "POST", "/sale", {"cart": [["Hoodie", 1]]})[0])) for _ in range(16)]
+    for till in tills:
+        till.start()
+    while server.committer.requests.qsize() < 16:
+        threading.Event().wait(0.01)
+    release.set()
+    for till in tills + [blocker]:
+        till.join()
+    assert statuses == [200] * 16
+    # All sixteen carts were recorded by a single commit
+    assert server.committer.stats() == {"batches": 1, "carts": 16}
+    assert server.db.retrieve_quantity("Hoodie") == (84, )
+
+
+# Test case for a cart that fails inside a shared transaction
+def test_group_commit_isolates_failures(server):
+    release = threading.Event()
+    blocker = threading.Thread(target=server.committer.submit, args=(lambda db: release.wait(), ))
+    blocker.start()
+    results = {}
+    def sell(till, cart):
+        try:
+            results[till] = server.committer.sell(cart)
+        except Exception as exception:
+            results[till] = exception
+    # The second cart's quantity cannot be compared with the stock, which fails the whole transaction
+    tills = [threading.Thread(target=sell, args=(till, cart)) for till, cart in enumerate([[["Hoodie", 1]], [["Hoodie", "two"]], [["Hoodie", 3]]])]
+    for till in tills:
+        till.start()
+    while server.committer.requests.qsize() < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for till in tills + [blocker]:
+        till.join()
+    # Only that till sees the error, and the others' carts are recorded on their own
+    assert isinstance(results[1], TypeError)
+    assert [line[:4] for line in results[0]] == [("Hoodie", 1, 5.0, True)]
+    assert [line[:4] for line in results[2]] == [("Hoodie", 3, 5.0, True)]
+    assert server.db.retrieve_quantity("Hoodie") == (96, )
+
+
+# Test case for reports from several tills at once
+def test_concurrent_totals(server, monkeypatch):
+    totals = database.retrieve_band_totals
+    readers = set()
+    # Each report holds its connection for 0.2 seconds
+    def slow(db, day=None):
+        readers.add(id(db.reader))
+        threading.Event().wait(0.2)
+        return totals(db, day)
+    monkeypatch.setattr(database, "retrieve_band_totals", slow)
+    opened = len(server.db.manager.readers)
+    statuses = []
+    tills = [threading.Thread(target=lambda: statuses.append(request(server, "GET", "/totals")[0])) for _ in range(4)]
+    start = time.perf_counter()
+    for till in tills:
+        till.start()
+    for till in tills:
+        till.join()
+    # Every till read on a connection of its own, at the same time, and closed it when it disconnected
+    assert statuses == [200] * 4
+    assert time.perf_counter() - start < 0.6
+    assert len(readers) == 4
+    deadline = time.monotonic() + 5
+    while len(server.db.manager.readers) != opened and time.monotonic() < deadline:
+        threading.Event().wait(0.01)
+    assert len(server.db.manager.readers) == opened
@@ -1,6 +1,17 @@
+import argparse
+import time
 import tkinter as tk
-from tkinter import *
-from database import database
+from datetime import date, datetime, timezone
+from tkinter import ttk, filedialog, simpledialog, messagebox
+from worker import dbWorker
+from database import database, validate_stock, day_bounds
+from catalog import read_catalog
+from export import export_sales
+from instrumentation import queryStats
+from journal import saleJournal
+from archive import archiver
+from backup import backupScheduler, restore_latest
+from analytics import salesSnapshot
 
 
 class ShopManager(tk.Tk):
@@ -8,36 +19,343 @@ class ShopManager(tk.Tk):
     This class manages the frames and navigation of the Shop Manager application.
     
     Attributes:
-            frames (dict): A dictionary to store instances of different frames.
+            worker (dbWorker): Runs every database request on a background thread, and owns its connections.
+            exporter (dbWorker): A second worker for long exports, created on first use so exports never delay the till.
+            journal (saleJournal): In journaled mode, records sales to a local log that is applied in the background, otherwise None.
+            archiver (archiver): When an archive directory is given, moves old closed days out of the database in the background, otherwise None.
+            storage (str): How the database is stored, "file", "memory" or "checkpointed" to disk every minute.
+            backups (str): The directory online snapshots are kept in, or None when backups are off.
+            scheduler (backupScheduler): Takes a snapshot every 15 minutes when backups are on, otherwise None.
+            status (tk.Label): Shows when database requests are in progress, and any errors they raise.
+            frames (dict): A dictionary to store instances of different frames, each built on first navigation.
                 Key: Class representing a frame.
                 Value: Instance of the frame.
+            subscribers (dict): The frames to notify when a table changes.
+                Key: Table name.
+                Value: Set of frame instances.
+            dirty (set): Frames whose data changed while they were hidden, refreshed when next shown.
+            current: The frame currently displayed.
 
     Methods:
         __init__: Initializes the ShopManager class.
-        show_frame: Displays a specified frame.
+        show_frame: Displays a specified frame, building it or refreshing it first if needed.
+        subscribe: Registers a frame to be notified when any of the given tables change.
+        publish: Refreshes the visible frame, and marks hidden frames dirty, when tables change.
+        show_busy: Updates the status bar and cursor while database requests are in progress.
+        show_error: Displays an error raised by a database request.
+        journal_applied: Reports journaled sales once they have been recorded in the database.
+        restore_backup: Replaces the database with the latest snapshot, after asking the user to confirm.
+        close: Stops the database worker and closes the window.
     """
 
-    def __init__(self, *args, **kwargs):
-        """Inializes the ShopManager class"""
+    def __init__(self, *args, path="StockSales.db", journal=None, archive=None, backups=None, storage=None, **kwargs):
+        """
+        Inializes the ShopManager class
+
+            Parameters:
+                path (str): The database file used by the application
+                journal (str): A sale journal file, which enables journaled mode, replaying any sales left in it
+                archive (str): A directory to archive closed days into, hourly, while the application runs
+                backups (str): A directory to keep online snapshots in, which also enables restoring the latest one
+                storage (str): How the database is stored, "file" by default
+        """
         tk.Tk.__init__(self, *args, **kwargs)
         self.title("Shop Manager")
-        container = tk.Frame(self)
-        container.pack(side="top", fill="both", expand=True)
-        container.grid_rowconfigure(0, weight=1)
-        container.grid_columnconfigure(0, weight=1)
+        self.status = tk.Label(self, text="", anchor="w")
+        self.status.pack(side="bottom", fill="x")
+        self.storage = storage
+        self.worker = dbWorker(self, path, storage=storage)
+        self.worker.on_busy = self.show_busy
+        self.worker.on_error = self.show_error
+        self.exporter = None
+        self.journal = None
+        if journal is not None:
+            db = database(path, storage=storage)
+            db.create_tables()
+            self.journal = saleJournal(journal, db, on_applied=lambda batch: self.worker.post(self.journal_applied, batch),
+                                       on_error=lambda error: self.worker.post(self.show_error, error))
+        self.worker.submit("close_days")
+        self.archiver = None
+        if archive is not None:
+            self.archiver = archiver(path, archive, on_error=lambda error: self.worker.post(self.show_error, error), storage=storage)
+        self.backups = backups
+        self.scheduler = None
+        if backups is not None:
+            self.scheduler = backupScheduler(path, backups, on_error=lambda error: self.worker.post(self.show_error, error), storage=storage)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.container = tk.Frame(self)
+        self.container.pack(side="top", fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
         self.frames = {}
-        for page in (homePage, manageStock, manageSales, calculateTotal):
-            frame = page(container, self)
-            self.frames[page]=frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.subscribers = {}
+        self.dirty = set()
+        self.current = None
         self.show_frame(homePage)
     
     def show_frame(self, page):
-        """Displays the selected frame"""
+        """
+        Displays the selected frame
+
+        Frames are only built the first time they are shown, and are refreshed on display if their data changed while hidden
+        """
+        if page not in self.frames:
+            frame = page(self.container, self)
+            self.frames[page]=frame
+            frame.grid(row=0, column=0, sticky="nsew")
         frame = self.frames[page]
+        if frame in self.dirty:
+            self.dirty.discard(frame)
+            frame.refresh()
+        self.current = frame
         frame.tkraise()
 
 
+    def subscribe(self, frame, *tables):
+        """Registers a frame to be notified when any of the named tables change"""
+        for table in tables:
+            self.subscribers.setdefault(table, set()).add(frame)
+
+
+    def publish(self, *tables):
+        """
+        Notifies subscribers that the named tables have changed
+
+        The visible frame is refreshed straight away, hidden frames are only marked dirty
+        """
+        frames = set()
+        for table in tables:
+            frames |= self.subscribers.get(table, set())
+        for frame in frames:
+            if frame is self.current:
+                frame.refresh()
+            else:
+                self.dirty.add(frame)
+
+
+    def show_busy(self, busy):
+        """Shows a busy status and cursor while the database worker has requests outstanding"""
+        if busy:
+            self.status.config(text="Busy...")
+        elif self.status.cget("text") == "Busy...":
+            self.status.config(text="")
+        self.config(cursor="watch" if busy else "")
+
+
+    def show_error(self, error):
+        """Displays an error raised by a database request in the status bar"""
+        self.status.config(text=f"Error: {error}")
+
+
+    def journal_applied(self, batch):
+        """Refreshes the frames showing sales and stock once journaled sales are recorded, and reports any line that was rejected"""
+        rejected = [line[0] for seq, lines in batch for line in lines if not line[3]]
+        if rejected:
+            self.show_error(f"insufficient stock for {', '.join(rejected)}")
+        self.publish("sales", "stockItems")
+
+
+    def restore_backup(self):
+        """
+        Restores the latest snapshot on the database worker, once the user confirms
+
+        Sales recorded since the snapshot was taken are lost, so the user is warned first.
+        Every frame is refreshed afterwards, as any table may have changed.
+        """
+        if not messagebox.askyesno("Restore Backup", "Replace the database with the latest snapshot? Sales recorded since it was taken will be lost.", parent=self):
+            return
+        def restored(path):
+            self.status.config(text=f"Restored {path}" if path else "There are no snapshots to restore")
+            self.publish(*self.subscribers)
+        self.worker.submit(restore_latest, self.backups, callback=restored)
+
+
+    def close(self):
+        """Waits for outstanding database requests, and for journaled sales to be applied, then closes the window"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal.db.close_db()
+        if self.archiver is not None:
+            self.archiver.close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.worker.close()
+        if self.exporter is not None:
+            self.exporter.close()
+        self.destroy()
+
+
+class tableView(tk.Frame):
+    """
+    This class displays query results in a scrollable ttk.Treeview, keyed by one column of each row.
+
+    Only the rows scrolled into view are drawn, and each refresh applies a row-level diff,
+    so unchanged rows are never rebuilt.
+
+    Attributes:
+        tree (ttk.Treeview): The widget displaying the rows
+        rows (dict): The rows currently displayed
+            Key: The row's key column, as a string
+            Value: The row tuple
+
+    Methods:
+        __init__: Initializes the tableView class
+        update_rows: Inserts, updates, moves and deletes rows so the view matches a new result set
+        selected: Returns the row currently selected by the user
+    """
+
+    def __init__(self, parent, columns, key=0):
+        """Initializes the tableView class"""
+        tk.Frame.__init__(self, parent)
+        self.key = key
+        self.rows = {}
+        self.tree = ttk.Treeview(self, columns=[str(i) for i in range(len(columns))], show="headings", selectmode="browse")
+        for i, heading in enumerate(columns):
+            self.tree.heading(str(i), text=heading)
+            self.tree.column(str(i), width=100, anchor="w")
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky="NSEW")
+        scrollbar.grid(row=0, column=1, sticky="NS")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+
+    def update_rows(self, rows):
+        """
+        Applies the difference between the displayed rows and a new result set
+
+            Parameters:
+                rows (list): The new result set, in display order
+        """
+        wanted = {str(row[self.key]): tuple(row) for row in rows}
+        for iid in list(self.rows):
+            if iid not in wanted:
+                self.tree.delete(iid)
+                del self.rows[iid]
+        for index, (iid, row) in enumerate(wanted.items()):
+            if iid not in self.rows:
+                self.tree.insert("", index, iid=iid, values=row)
+            else:
+                if self.rows[iid] != row:
+                    self.tree.item(iid, values=row)
+                if self.tree.index(iid) != index:
+                    self.tree.move(iid, "", index)
+            self.rows[iid] = row
+
+
+    def selected(self):
+        """Returns the selected row, or None if no row is selected"""
+        selection = self.tree.selection()
+        return self.rows[selection[0]] if selection else None
+
+
+class pagerBar(tk.Frame):
+    """
+    This class holds the filter fields and page buttons for a keyset-paginated table.
+
+    Each page is requested with the key of the last row on the page before it, so the database
+    seeks straight to the page through an index instead of skipping rows with OFFSET.
+
+    Attributes:
+        limit (int): The number of rows per page
+        key (int): The column of each row used as the cursor for the next page
+        cursors (list): The cursor each visited page started from, the first page starts from None
+        page (int): The index of the current page in cursors
+        fields (dict): The filter entries
+            Key: The filter's keyword argument name
+            Value: A (tk.StringVar, type) pair used to read and convert the entry
+        on_change: Called with no arguments whenever the page or filters change
+
+    Methods:
+        __init__: Initializes the pagerBar class
+        cursor: Returns the cursor for the current page
+        filters: Returns the converted values of every filter that has been filled in
+        apply: Returns to the first page using the current filters
+        next_page: Moves to the page after the current one
+        previous_page: Moves to the page before the current one
+        show: Records where the next page starts, and enables the buttons, once a page has loaded
+    """
+
+    def __init__(self, parent, on_change, fields, key=0, limit=50):
+        """Initializes the pagerBar class"""
+        tk.Frame.__init__(self, parent)
+        self.on_change = on_change
+        self.key = key
+        self.limit = limit
+        self.cursors = [None]
+        self.page = 0
+        self.fields = {}
+        column = 0
+        for label, name, convert in fields:
+            variable = tk.StringVar()
+            tk.Label(self, text=label).grid(row=0, column=column, sticky="E")
+            entry = tk.Entry(self, textvariable=variable, width=12)
+            entry.grid(row=0, column=column + 1, sticky="EW")
+            entry.bind("<Return>", lambda event: self.apply())
+            self.fields[name] = (variable, convert)
+            column += 2
+        tk.Button(self, text="Filter", command=lambda: self.apply()).grid(row=0, column=column, sticky="EW")
+        self.previous = tk.Button(self, text="< Prev", command=lambda: self.previous_page(), state="disabled")
+        self.pageLabel = tk.Label(self, text="Page 1")
+        self.next = tk.Button(self, text="Next >", command=lambda: self.next_page(), state="disabled")
+        self.previous.grid(row=0, column=column + 1, sticky="EW")
+        self.pageLabel.grid(row=0, column=column + 2, sticky="EW")
+        self.next.grid(row=0, column=column + 3, sticky="EW")
+
+
+    def cursor(self):
+        """Returns the key the current page starts after"""
+        return self.cursors[self.page]
+
+
+    def filters(self):
+        """Returns the filters the user has filled in, converted to their types, ignoring any that are invalid"""
+        values = {}
+        for name, (variable, convert) in self.fields.items():
+            try:
+                if variable.get().strip():
+                    values[name] = convert(variable.get().strip())
+            except ValueError:
+                pass
+        return values
+
+
+    def apply(self):
+        """Returns to the first page, and reloads it with the current filters"""
+        self.cursors = [None]
+        self.page = 0
+        self.on_change()
+
+
+    def next_page(self):
+        """Moves to the next page"""
+        self.page += 1
+        self.on_change()
+
+
+    def previous_page(self):
+        """Moves to the previous page"""
+        if self.page > 0:
+            self.page -= 1
+            self.on_change()
+
+
+    def show(self, rows):
+        """
+        Records the cursor for the next page once the current page has loaded
+
+            Parameters:
+                rows (list): The rows on the current page
+        """
+        del self.cursors[self.page + 1:]
+        if len(rows) == self.limit:
+            self.cursors.append(rows[-1][self.key])
+        self.next.config(state="normal" if len(self.cursors) > self.page + 1 else "disabled")
+        self.previous.config(state="normal" if self.page > 0 else "disabled")
+        self.pageLabel.config(text=f"Page {self.page + 1}")
+
+
 class homePage(tk.Frame):
     """
      This class manages the applications menu, and displays all available pages.
@@ -46,6 +364,8 @@ class homePage(tk.Frame):
         manageStockPage (tk.Button): Displays the ManageStock frame
         manageSalesPage (tk.Button): Displays the ManageSales frame
         calculateTotalPage (tk.Button): Displays the calculateTotal frame
+        diagnosticsPage (tk.Button): Displays the diagnostics frame
+        restorePage (tk.Button): Restores the latest backup, only shown when backups are on
 
     Methods:
         __init__: Initializes the HomePage class
@@ -59,7 +379,12 @@ class homePage(tk.Frame):
         calculateTotalPage = tk.Button(self, text="Calculate Totals", command=lambda: controller.show_frame(calculateTotal))
         manageStockPage.pack(fill="both", expand=True)  
         manageSalesPage.pack(fill="both", expand=True)
+        diagnosticsPage = tk.Button(self, text="Diagnostics", command=lambda: controller.show_frame(diagnostics))
         calculateTotalPage.pack(fill="both", expand=True)
+        diagnosticsPage.pack(fill="both", expand=True)
+        if controller.backups is not None:
+            restorePage = tk.Button(self, text="Restore Latest Backup", command=controller.restore_backup)
+            restorePage.pack(fill="both", expand=True)
 
 
 class manageStock(tk.Frame):
@@ -68,58 +393,113 @@ class manageStock(tk.Frame):
 
      Attributes:
         controller: Handles requests and manages which frame should be displayed
-        db: Creates an instance of the database class
+        listView: Holds the stock table and its buttons, built once and kept between refreshes
+        formView: Holds the add and update stock forms
+        table (tableView): Displays one page of the stockItems records
+        pager (pagerBar): Holds the filters and page buttons for the stock table
         
     Methods:
         __init__: Initializes the HomePage class
-        stockManager: Displays all records in the stockItems table, with options to update or delete row
+        openForm: Hides the stock table and returns an empty form frame
+        stockManager: Displays the products in stock updated today, or since the day entered, with options to update or delete row
+        showList: Hides any open form and shows the stock table
+        refresh: Reloads the current page of the stock table, called when the stockItems table changes or the page changes
+        showPage: Displays a page of products
+        updateSelected: Opens the update page for the selected product
+        deleteSelected: Deletes the selected product
         addStockPage: Page which allows user to add a products and its details
         updateStockPage: Page which allows user to update the quantity or price of a product
         addUpdateStock: This is used to send a request to the backend to create or update an existing products details
         deleteStock: Sends a request to the backend to delete a product from the stockItems table
+        importCatalog: Streams a CSV or JSONL catalog into the stockItems table
+        changed: Returns to the stock table and publishes the change to stockItems
     """
 
     def __init__(self, parent, controller):
         """Initializes the Homepage class"""
         tk.Frame.__init__(self, parent)
         self.controller = controller
-        self.db = database()
-        self.db.create_tables()
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.formView = tk.Frame(self)
+        self.listView = tk.Frame(self)
+        title = tk.Label(self.listView, text="Stock Items")
+        home = tk.Button(self.listView, text="Home", command=lambda: self.controller.show_frame(homePage))
+        add = tk.Button(self.listView, text="Add Item", command=lambda: self.addStockPage())
+        edit = tk.Button(self.listView, text="Update", command=lambda: self.updateSelected())
+        delete = tk.Button(self.listView, text="Delete", command=lambda: self.deleteSelected())
+        importCatalog = tk.Button(self.listView, text="Import Catalog", command=lambda: self.importCatalog())
+        self.table = tableView(self.listView, ("Name", "Band", "Quantity", "Price"))
+        self.table.tree.bind("<Double-1>", lambda event: self.updateSelected())
+        self.pager = pagerBar(self.listView, self.refresh, (("Band", "band", str), ("Min £", "min_price", float), ("Max £", "max_price", float), ("Updated from", "updated_from", date.fromisoformat)))
+        title.grid(row=0, column=0, pady=5, columnspan=5, sticky="EW")
+        home.grid(row=1, column=0, sticky="EW")
+        add.grid(row=1, column=1, sticky="EW")
+        edit.grid(row=1, column=2, sticky="EW")
+        delete.grid(row=1, column=3, sticky="EW")
+        importCatalog.grid(row=1, column=4, sticky="EW")
+        self.pager.grid(row=2, column=0, columnspan=5, pady=5, sticky="EW")
+        self.table.grid(row=3, column=0, columnspan=5, pady=5, sticky="NSEW")
+        self.listView.grid_rowconfigure(3, weight=1)
+        for i in range(5):
+            self.listView.grid_columnconfigure(i, weight=1)
+        controller.subscribe(self, "stockItems")
         self.stockManager()
 
+
+    def openForm(self):
+        """Hides the stock table and returns the emptied form frame"""
+        self.listView.grid_remove()
+        for widget in self.formView.winfo_children():
+            widget.destroy()
+        self.formView.grid(row=0, column=0, sticky="NSEW")
+        return self.formView
+
     
     def stockManager(self):
         """
         Displays all the records in the database. 
         
         Add, update and delete buttons are available to manipulate the data
+
+        Only the rows that changed since the last refresh are redrawn
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        stockitems = self.db.retrieve_inventory()
-        title = tk.Label(self,text="Stock Items")
-        home = tk.Button(self,text="Home", command=lambda: self.controller.show_frame(homePage))
-        add = tk.Button(self,text="Add Item",command=lambda: self.addStockPage())
-        title.grid(row=0, column=0, pady=5,columnspan=5,sticky="EW")
-        home.grid(row=1, column=1, sticky="EW")
-        add.grid(row=1, column=2, sticky="EW")
-        row_position = 2
-        for item in stockitems:
-            name = tk.Label(self, text=item[0])
-            band = tk.Label(self, text=item[1])
-            quantity = tk.Label(self, text=item[2])
-            price = tk.Label(self, text=item[3])
-            name.grid(row=row_position, column=0, pady=5, sticky="NSEW")
-            band.grid(row=row_position, column=1, pady=5, sticky="NSEW")
-            quantity.grid(row=row_position, column=2, pady=5, sticky="NSEW")
-            price.grid(row=row_position, column=3, pady=5, sticky="NSEW")
-            edit = tk.Button(self, text="Update", command= lambda item=item:  self.updateStockPage(item))
-            delete = tk.Button(self, text="delete", command= lambda name=item[0]:  self.deleteStock(name))
-            edit.grid(row=row_position, column=4, pady=5, sticky="NSEW")
-            delete.grid(row=row_position, column=5, pady=5, sticky="NSEW")
-            row_position += 1
-        for i in range(6):
-            self.grid_columnconfigure(i, weight=1)
+        self.showList()
+        self.refresh()
+
+
+    def showList(self):
+        """Hides any open form and shows the stock table"""
+        self.formView.grid_remove()
+        self.listView.grid(row=0, column=0, sticky="NSEW")
+
+
+    def refresh(self):
+        """Reloads the current page of the stock table, only redrawing the rows that changed"""
+        after, filters, limit = self.pager.cursor(), self.pager.filters(), self.pager.limit
+        # Like the sales table, the stock table shows the products updated today unless an earlier day is entered
+        filters.setdefault("updated_from", datetime.now(timezone.utc).date())
+        self.controller.worker.submit(lambda db: db.retrieve_inventory_page(after, limit, min_quantity=1, **filters), callback=self.showPage)
+
+
+    def showPage(self, stockitems):
+        """Displays a page of products returned by the background worker"""
+        self.table.update_rows([item[:4] for item in stockitems])
+        self.pager.show(stockitems)
+
+
+    def updateSelected(self):
+        """Opens the update page for the product selected in the stock table"""
+        item = self.table.selected()
+        if item is not None:
+            self.updateStockPage(item)
+
+
+    def deleteSelected(self):
+        """Deletes the product selected in the stock table"""
+        item = self.table.selected()
+        if item is not None:
+            self.deleteStock(item[0])
         
     
     def addStockPage(self):
@@ -127,21 +507,20 @@ class manageStock(tk.Frame):
         Page displayed when add button clicked. 
         User can input name, brand, price and quantity data when creating a product.
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        title = tk.Label(self, text="Add Stock")
-        nameLabel = tk.Label(self, text="Name")
-        bandLabel = tk.Label(self, text="Touring Band")
-        quantityLabel = tk.Label(self, text="Quantity")
-        priceLabel = tk.Label(self, text="Price")
+        form = self.openForm()
+        title = tk.Label(form, text="Add Stock")
+        nameLabel = tk.Label(form, text="Name")
+        bandLabel = tk.Label(form, text="Touring Band")
+        quantityLabel = tk.Label(form, text="Quantity")
+        priceLabel = tk.Label(form, text="Price")
         name_var = tk.StringVar()
         band_var = tk.StringVar()
         quantity_var = tk.IntVar()
         price_var = tk.DoubleVar()
-        name = tk.Entry(self, textvariable=name_var)
-        band = tk.Entry(self, textvariable=band_var)
-        quantity = tk.Entry(self, textvariable=quantity_var)
-        price = tk.Entry(self, textvariable=price_var)
+        name = tk.Entry(form, textvariable=name_var)
+        band = tk.Entry(form, textvariable=band_var)
+        quantity = tk.Entry(form, textvariable=quantity_var)
+        price = tk.Entry(form, textvariable=price_var)
         title.grid(row=0, column=0, pady=5, columnspan=5, sticky="NSEW")
         nameLabel.grid(row=2, column=2, pady=5, sticky="NSEW")
         bandLabel.grid(row=4, column=2, pady=5, sticky="NSEW")
@@ -151,8 +530,8 @@ class manageStock(tk.Frame):
         band.grid(row=5, column=2, pady=5, sticky="NSEW")
         quantity.grid(row=7, column=2, pady=5, sticky="NSEW")
         price.grid(row=9, column=2, pady=5, sticky="NSEW")
-        back = tk.Button(self,text="Back", command=lambda: self.stockManager())
-        add = tk.Button(self,text="Add",command=lambda: self.addUpdateStock(name_var.get(), band_var.get(),  quantity_var.get(), price_var.get()))
+        back = tk.Button(form,text="Back", command=lambda: self.stockManager())
+        add = tk.Button(form,text="Add",command=lambda: self.addUpdateStock(name_var.get(), band_var.get(),  quantity_var.get(), price_var.get()))
         add.config(state="disabled")
         back.grid(row=11, column=2, sticky="NSEW")
         add.grid(row=10, column=2, sticky="NSEW")
@@ -164,10 +543,8 @@ class manageStock(tk.Frame):
             Once they are valid, the add button is enabled
             """
             try:
-                if quantity_var.get() > 0 and name_var.get() is not None and band_var.get() is not None and price_var.get() > 0:
-                    add.config(state="normal")
-                else:
-                    add.config(state="disabled")
+                validate_stock([name_var.get(), band_var.get(), quantity_var.get(), price_var.get()])
+                add.config(state="normal")
             except:
                 add.config(state="disabled")     
         name_var.trace_add("write", validate_entries)
@@ -180,24 +557,23 @@ class manageStock(tk.Frame):
         """
         Displays page where user can update a specific products price or quantity
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        title = tk.Label(self, text="Update Stock")
-        nameLabel = tk.Label(self, text=item[0])
-        bandLabel = tk.Label(self, text=item[1])
+        form = self.openForm()
+        title = tk.Label(form, text="Update Stock")
+        nameLabel = tk.Label(form, text=item[0])
+        bandLabel = tk.Label(form, text=item[1])
         quantity_var = tk.IntVar()
         price_var = tk.DoubleVar()
         quantity_var.set(item[2])
         price_var.set(item[3])
-        quantity = tk.Entry(self, textvariable=quantity_var)
-        price = tk.Entry(self, textvariable=price_var)
+        quantity = tk.Entry(form, textvariable=quantity_var)
+        price = tk.Entry(form, textvariable=price_var)
         title.grid(row=0,column=0, pady=5, columnspan=5, sticky="NSEW")
         nameLabel.grid(row=3, column=0, pady=5, sticky="NSEW")
         bandLabel.grid(row=3, column=2, pady=5, sticky="NSEW")
         quantity.grid(row=3, column=4, pady=5, sticky="NSEW")
         price.grid(row=3, column=6, pady=5, sticky="NSEW")
-        back = tk.Button(self, text="Back", command=lambda: self.stockManager())
-        update = tk.Button(self, text="Update", command=lambda: self.addUpdateStock(item[0], item[1], quantity_var.get(), price_var.get()))
+        back = tk.Button(form, text="Back", command=lambda: self.stockManager())
+        update = tk.Button(form, text="Update", command=lambda: self.addUpdateStock(item[0], item[1], quantity_var.get(), price_var.get()))
         update.config(state="disabled")
 
 
@@ -207,10 +583,8 @@ class manageStock(tk.Frame):
             Once they are valid, the add button is enabled
             """
             try:
-                if quantity_var.get() > 0 and price_var.get() > 0:
-                    update.config(state="normal")
-                else:
-                    update.config(state="disabled")
+                validate_stock([item[0], item[1], quantity_var.get(), price_var.get()])
+                update.config(state="normal")
             except:
                 update.config(state="disabled")
 
@@ -222,14 +596,34 @@ class manageStock(tk.Frame):
     
     def addUpdateStock(self, name, band, quantity, price):
         """A request is sent to the backend to create or update a product details using user entries"""
-        self.db.create_update_stock([name, band, quantity, price])
-        self.stockManager()
+        self.controller.worker.submit("create_update_stock", [name, band, quantity, price], callback=lambda result: self.changed())
     
 
     def deleteStock(self, name):
-        """A request is sent to the backend to delete a products record from the database """
-        self.db.delete_stock(name)
-        self.stockManager()
+        """A request is sent to the backend to delete a products record from the database, which is refused once the product has been sold"""
+        refused = lambda error: messagebox.showinfo("Delete Stock", str(error), parent=self) if isinstance(error, ValueError) else self.controller.show_error(error)
+        self.controller.worker.submit("delete_stock", name, callback=lambda result: self.changed(), error=refused)
+
+
+    def importCatalog(self):
+        """
+        Asks the user for a CSV or JSONL catalog, and streams it into the stockItems table on the background worker
+
+        The number of imported and rejected products is shown in the status bar
+        """
+        path = filedialog.askopenfilename(title="Import Catalog", filetypes=[("Catalogs", "*.csv *.jsonl"), ("All files", "*")])
+        if not path:
+            return
+        def imported(result):
+            self.controller.status.config(text=f"Imported {result[0]} products, rejected {len(result[1])}")
+            self.changed()
+        self.controller.worker.submit(lambda db: db.import_stock(read_catalog(path)), callback=imported)
+
+
+    def changed(self):
+        """Returns to the stock table and notifies every frame that depends on stockItems"""
+        self.showList()
+        self.controller.publish("stockItems")
 
 
 class manageSales(tk.Frame):
@@ -238,14 +632,25 @@ class manageSales(tk.Frame):
 
     Attributes:
         controller: Handles requests and manages which frame should be displayed
-        db: Creates an instance of the database class
+        listView: Holds the sales table and its buttons, built once and kept between refreshes
+        formView: Holds the add sale form
+        table (tableView): Displays one page of the current days sales records
+        pager (pagerBar): Holds the filters and page buttons for the sales table
         
     Methods:
         __init__: Initializes the HomePage class
+        openForm: Hides the sales table and returns an empty form frame
         salesManager: Displays all records in the sales table, with the option to delete a sale
+        showList: Hides any open form and shows the sales table
+        refresh: Reloads the current page of the sales table, called when the sales or stockItems tables change or the page changes
+        showPage: Displays a page of sales
+        deleteSelected: Deletes the sale selected in the sales table
+        exportSales: Streams the sales for a date range to a CSV or JSONL file, off the main loop
         addSalePage: This page lets the user register a sale
+        saleForm: Adds the entry fields to the add sale page once the inventory has loaded
         createSale: This sends a request to the backend to add the sales record to the sales table
         deleteSale: This sends a request to the backend to delete a specific sales record
+        changed: Returns to the sales table and publishes the change to sales and stockItems
     """
 
 
@@ -253,42 +658,103 @@ class manageSales(tk.Frame):
         """Initializes the manageSales page"""
         tk.Frame.__init__(self, parent)
         self.controller = controller
-        self.db = database()
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.formView = tk.Frame(self)
+        self.listView = tk.Frame(self)
+        title = tk.Label(self.listView, text="Sales")
+        home = tk.Button(self.listView, text="Home", command=lambda: self.controller.show_frame(homePage))
+        add = tk.Button(self.listView, text="Add Sale", command=lambda: self.addSalePage())
+        delete = tk.Button(self.listView, text="Delete", command=lambda: self.deleteSelected())
+        export = tk.Button(self.listView, text="Export Sales", command=lambda: self.exportSales())
+        self.table = tableView(self.listView, ("ID", "Name", "Band", "Quantity", "Time", "Price"))
+        self.pager = pagerBar(self.listView, self.refresh, (("Band", "band", str), ("From", "start", date.fromisoformat), ("To", "end", date.fromisoformat)))
+        title.grid(row=0, column=0, pady=5, columnspan=4, sticky="EW")
+        home.grid(row=1, column=0, sticky="EW")
+        add.grid(row=1, column=1, sticky="EW")
+        delete.grid(row=1, column=2, sticky="EW")
+        export.grid(row=1, column=3, sticky="EW")
+        self.pager.grid(row=2, column=0, columnspan=4, pady=5, sticky="EW")
+        self.table.grid(row=3, column=0, columnspan=4, pady=5, sticky="NSEW")
+        self.listView.grid_rowconfigure(3, weight=1)
+        for i in range(4):
+            self.listView.grid_columnconfigure(i, weight=1)
+        controller.subscribe(self, "sales", "stockItems")
         self.salesManager()
 
 
+    def openForm(self):
+        """Hides the sales table and returns the emptied form frame"""
+        self.listView.grid_remove()
+        for widget in self.formView.winfo_children():
+            widget.destroy()
+        self.formView.grid(row=0, column=0, sticky="NSEW")
+        return self.formView
+
+
     def salesManager(self):
         """
         Displays all the sales records in the database
 
         An add button is available to allow user to register a sale
 
-        A delete button is also provided next to each row to allow user to remove a sales record
+        A delete button removes the selected sales record
+
+        Only the rows that changed since the last refresh are redrawn
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        sales = self.db.retrieve_sales()
-        title = tk.Label(self, text="Sales")
-        home = tk.Button(self, text="Home", command=lambda: self.controller.show_frame(homePage))
-        add = tk.Button(self, text="Add Sale", command=lambda: self.addSalePage())
-        title.grid(row=0, column=0, pady=5, columnspan=5, sticky="EW")
-        home.grid(row=1, column=1, sticky="EW")
-        add.grid(row=1, column=2, sticky="EW")
-        row_position = 2
-        for sale in sales:
-            id = tk.Label(self, text=sale[0]) 
-            name = tk.Label(self, text=sale[1])
-            quantity = tk.Label(self, text=sale[2])
-            timestamp = tk.Label(self, text=sale[3])
-            id.grid(row=row_position, column=0, pady=5, sticky="NSEW")
-            name.grid(row=row_position, column=1, pady=5, sticky="NSEW")
-            quantity.grid(row=row_position, column=2, pady=5, sticky="NSEW")
-            timestamp.grid(row=row_position, column=3, pady=5, sticky="NSEW")
-            delete = tk.Button(self, text="Delete", command= lambda sale=sale: self.deleteSale(sale))
-            delete.grid(row=row_position, column=4, pady=5, sticky="NSEW")
-            row_position += 1
-        for i in range(5):
-            self.grid_columnconfigure(i, weight=1)
+        self.showList()
+        self.refresh()
+
+
+    def showList(self):
+        """Hides any open form and shows the sales table"""
+        self.formView.grid_remove()
+        self.listView.grid(row=0, column=0, sticky="NSEW")
+
+
+    def refresh(self):
+        """Reloads the current page of the sales table, only redrawing the rows that changed"""
+        before, filters, limit = self.pager.cursor(), self.pager.filters(), self.pager.limit
+        filters.setdefault("start", datetime.now(timezone.utc).date())
+        self.controller.worker.submit(lambda db: db.retrieve_sales_page(before, limit, **filters), callback=self.showPage)
+
+
+    def showPage(self, sales):
+        """Displays a page of sales returned by the background worker"""
+        self.table.update_rows(sales)
+        self.pager.show(sales)
+
+
+    def deleteSelected(self):
+        """Deletes the sale selected in the sales table"""
+        sale = self.table.selected()
+        if sale is not None:
+            self.deleteSale(sale)
+
+
+    def exportSales(self):
+        """
+        Asks the user for a date range and a file, then streams the sales to it on the controller's export worker
+
+        Progress is shown in the status bar while the export runs
+        """
+        # Sales are bucketed into UTC days, so the default range is the current UTC day
+        today = datetime.now(timezone.utc).date().isoformat()
+        try:
+            start = date.fromisoformat(simpledialog.askstring("Export Sales", "First day (YYYY-MM-DD)", initialvalue=today, parent=self) or "")
+            end = date.fromisoformat(simpledialog.askstring("Export Sales", "Last day (YYYY-MM-DD)", initialvalue=today, parent=self) or "")
+        except ValueError:
+            return
+        path = filedialog.asksaveasfilename(title="Export Sales", defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("JSON lines", "*.jsonl")])
+        if not path:
+            return
+        if self.controller.exporter is None:
+            self.controller.exporter = dbWorker(self.controller, self.controller.worker.path, storage=self.controller.storage)
+            self.controller.exporter.on_error = self.controller.show_error
+        exporter = self.controller.exporter
+        status = self.controller.status
+        progress = lambda count: exporter.post(lambda: status.config(text=f"Exporting... {count} sales written"))
+        exporter.submit(lambda db: export_sales(db, path, start, end, progress=progress), callback=lambda count: status.config(text=f"Exported {count} sales to {path}"))
 
     
     def addSalePage(self):
@@ -301,33 +767,71 @@ class manageSales(tk.Frame):
 
         The add button is disabled until the entries are validated
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        dropdown_options = []
-        items = self.db.retrieve_inventory()
-        title = tk.Label(self, text="Add Sale")
+        form = self.openForm()
+        title = tk.Label(form, text="Add Sale")
         title.grid(row=0, column=0, pady=5, columnspan=5, sticky="NSEW")
-        back = tk.Button(self, text="Back", command=lambda: self.salesManager())
+        back = tk.Button(form, text="Back", command=lambda: self.salesManager())
         back.grid(row=9, column=2, sticky="NSEW")
-        
+        self.controller.worker.submit("search_products", "", 10, True, callback=lambda items: self.saleForm(form, items))
+
+
+    def saleForm(self, form, items):
+        """
+        Adds the sale's entry fields to the add sale page, once the first products have been retrieved
+
+        The product is chosen from a type-ahead box: each keystroke searches the product index on the background
+        worker, and the list shows the best matches. Replies to earlier keystrokes are ignored once a newer one is sent.
+
+            Parameters:
+                form (tk.Frame): The add sale page
+                items (list): The first products in stock, as (name, band, quantity, price) tuples
+        """
         if len(items) > 0:
-            for item in items:
-                dropdown_options.append(item[0])
-            nameLabel = tk.Label(self, text="Name")
-            quantityLabel = tk.Label(self, text="Select product to view quantity ")
+            nameLabel = tk.Label(form, text="Name")
+            quantityLabel = tk.Label(form, text="Select product to view quantity ")
             quantityLabel.grid(row=4, column=2, pady=5,sticky="NSEW")
+            search_var = tk.StringVar()
             name_var = tk.StringVar()
             quantity_var = tk.IntVar()
-            name_var.set(dropdown_options[0])
-            name = tk.OptionMenu(self, name_var, *dropdown_options)
-            quantity = tk.Entry(self, textvariable=quantity_var)  
-            add = tk.Button(self, text="Add", command=lambda: self.createSale(name_var.get(), quantity_var.get(), ))
+            search = tk.Entry(form, textvariable=search_var)
+            matches = tk.Listbox(form, height=6, exportselection=False)
+            quantity = tk.Entry(form, textvariable=quantity_var)  
+            add = tk.Button(form, text="Add", command=lambda: self.createSale(name_var.get(), quantity_var.get(), ))
             add.config(state="disabled")
-            
+            latest = [0]
+
+            def show_matches(products):
+                """Lists the products found, selecting the first so Return picks it"""
+                matches.delete(0, "end")
+                for product in products:
+                    matches.insert("end", f"{product[0]}  ({product[1]})")
+                matches.products = products
+                if products:
+                    matches.selection_set(0)
+
+            def search_products(*args):
+                """Searches for the text typed so far, ignoring the reply if the user has typed again before it arrives"""
+                latest[0] += 1
+                request = latest[0]
+                def show(products):
+                    if request == latest[0]:
+                        show_matches(products)
+                self.controller.worker.submit("search_products", search_var.get(), 10, True, callback=show)
+
+            def choose(*args):
+                """Selects the highlighted product for the sale"""
+                selection = matches.curselection()
+                if selection:
+                    name_var.set(matches.products[selection[0]][0])
+                    quantity.focus_set()
+
             def update_quantity_label(*args):
                 """This detects a change in product selected and updates the quantity displayed"""
-                available = self.db.retrieve_quantity(name_var.get())
-                quantityLabel.config(text=f"Quantity Available: {available[0]}")
+                def show(available):
+                    if available is not None:
+                        quantityLabel.config(text=f"{name_var.get()}, Quantity Available: {available[0]}")
+                self.controller.worker.submit("retrieve_quantity", name_var.get(), callback=show)
+                validate_quantity()
             
             def validate_quantity(*args):
                 """
@@ -337,34 +841,45 @@ class manageSales(tk.Frame):
 
                 Once the entries have been validated, the add button is reenabled
                 """
-                available_quantity = self.db.retrieve_quantity(name_var.get())
-                try:
-                    if quantity_var.get() > 0 and quantity_var.get() <= available_quantity[0]:
-                        add.config(state="normal")
-                    else:
+                def validate(available_quantity):
+                    try:
+                        if quantity_var.get() > 0 and quantity_var.get() <= available_quantity[0]:
+                            add.config(state="normal")
+                        else:
+                            add.config(state="disabled")
+                    except:
                         add.config(state="disabled")
-                except:
-                    add.config(state="disabled")  
+                self.controller.worker.submit("retrieve_quantity", name_var.get(), callback=validate)
 
 
+            show_matches(items)
+            search_var.trace_add("write", search_products)
+            matches.bind("<<ListboxSelect>>", choose)
+            search.bind("<Return>", choose)
+            search.bind("<Down>", lambda event: matches.focus_set())
             name_var.trace_add("write", update_quantity_label)
             quantity_var.trace_add("write", validate_quantity)
             nameLabel.grid(row=2, column=2, pady=5, sticky="NSEW")
-            name.grid(row=3, column=2, pady=5, sticky="NSEW")
+            search.grid(row=3, column=2, pady=5, sticky="NSEW")
+            matches.grid(row=3, column=3, pady=5, sticky="NSEW")
             quantity.grid(row=5, column=2, pady=5, sticky="NSEW")
             add.grid(row=8, column=2, sticky="NSEW")
+            search.focus_set()
         else:
-            warning_text = tk.Label(self, text="Error: Please Create Products")
-            warning_text.grid(row=2, olumn=2, pady=5, sticky="NSEW")
+            warning_text = tk.Label(form, text="Error: Please Create Products")
+            warning_text.grid(row=2, column=2, pady=5, sticky="NSEW")
 
     
     def createSale(self, name, quantity):
         """
-        A request is sent to the backend to update the sales records
+        A single checkout request is sent to the backend, which records the sale and reduces the stock in one transaction
+
+        The stock shown on the form may be out of date if another till has sold the product since, so the sale is only
+        recorded if the stock is still available when the request runs. Otherwise an error is shown in the status bar.
 
-        Another request is sent to the database to reflect the changes the sale has made to existing quantities and values.
+        In journaled mode the sale is appended to the journal on the worker thread instead, and the tables refresh once it has been applied
 
-        The manageStock frame is refreshed to show the new data
+        Frames showing stock, sales or totals are notified of the change, and hidden ones refresh when next shown
 
         User is rerouted back to the Stock Manager page
 
@@ -372,45 +887,59 @@ class manageSales(tk.Frame):
                 name (str): a string representing products name
                 quantity (int): an integer representing quantity of a product
         """
-        self.db.create_sale([name, quantity])
-        self.db.update_stock_quantity(name, quantity)
-        self.controller.frames[manageStock].stockManager()
-        self.controller.frames[calculateTotal].calculator()
-        self.salesManager()
+        def recorded(results):
+            if results[0][3]:
+                self.changed()
+            else:
+                self.controller.show_error(f"insufficient stock for {name}")
+        if self.controller.journal is not None:
+            # The append waits for the journal's fsync, so it runs on the worker thread rather than freezing the window
+            journal = self.controller.journal
+            self.controller.worker.submit(lambda db: journal.append([[name, quantity]]), callback=lambda seq: self.showList())
+            return
+        self.controller.worker.submit("checkout", [[name, quantity]], callback=recorded)
 
     
     def deleteSale(self, sale):
         """
-        A request is sent to the backend to remove sales record
+        A request is sent to the backend to void the sales record, which removes it and returns its quantity to stock in one transaction
 
-        Another request is sent to the database to reverse the changes the sale has made to existing quantities and values.
-
-        the manageStock frame is refreshed to display updated data
+        Frames showing stock, sales or totals are notified of the change, and hidden ones refresh when next shown
 
         User is rerouted back to the sales Manager page
 
             Parameters:
             sale (list): A list containing all the details of the sale
         """
-        self.db.delete_sale(sale[0])
-        self.db.update_stock_quantity(sale[1], -sale[3])
-        self.controller.frames[manageStock].stockManager()
-        self.controller.frames[calculateTotal].calculator()
-        self.salesManager() 
+        self.controller.worker.submit("void_sale", sale[0], callback=lambda result: self.changed())
+
+
+    def changed(self):
+        """Returns to the sales table and notifies every frame that depends on sales or stockItems"""
+        self.showList()
+        self.controller.publish("sales", "stockItems")
 
 
 
 class calculateTotal(tk.Frame):
     """
-    This class displays the gross and net revenue that is owed to the touring band
+    This class displays the gross and net revenue that is owed to each touring band, and breakdowns of todays sales
 
     Attributes:
         controller: Handles requests and manages which frame should be displayed
-        db: Creates an instance of the database class
+        table (tableView): Displays the gross, net and units for each band that sold today
+        snapshot (salesSnapshot): Todays sales as columns, only used on the worker thread, and refreshed with each new sale
+        hours (tableView): Displays the units and gross for each hour today
+        products (tableView): Displays the units, gross and sell-through for each product sold today
+        bands (tableView): Displays the units, gross and sell-through for each band that sold today
 
     Methods:
         __init__: Initializes the calculateTotal class
-        calculator: displays the gross and net revenues
+        calculator: requests the gross and net revenues, and the breakdowns
+        analyse: loads or refreshes the snapshot on the worker thread, and returns its breakdowns
+        showTotals: displays the gross and net revenues
+        showBreakdowns: displays the hour, product and band breakdowns
+        refresh: requests the revenues again, called when the sales or stockItems tables change
     
     """
     def __init__(self, parent, controller):
@@ -423,37 +952,181 @@ class calculateTotal(tk.Frame):
         """
         tk.Frame.__init__(self, parent)
         self.controller = controller
-        self.db = database()
+        title = tk.Label(self, text="Payments Owed Today")
+        home = tk.Button(self, text="Home", command=lambda: self.controller.show_frame(homePage))
+        self.table = tableView(self, ("Band", "Total", "Net", "Units"))
+        self.snapshot = None
+        breakdowns = ttk.Notebook(self)
+        self.hours = tableView(breakdowns, ("Hour", "Units", "Total"))
+        self.products = tableView(breakdowns, ("Product", "Band", "Units", "Total", "Sell-through"))
+        self.bands = tableView(breakdowns, ("Band", "Units", "Total", "Sell-through"))
+        breakdowns.add(self.hours, text="By Hour")
+        breakdowns.add(self.products, text="By Product")
+        breakdowns.add(self.bands, text="By Band")
+        title.grid(row=0, column=0, pady=5, sticky="EW")
+        self.table.grid(row=1, column=0, pady=5, sticky="NSEW")
+        breakdowns.grid(row=2, column=0, pady=5, sticky="NSEW")
+        home.grid(row=3, column=0, sticky="EW")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        controller.subscribe(self, "sales", "stockItems")
         self.calculator()
     
 
     def calculator(self):
         """"
-        Displays the current days touring bands gross and net revenues 
-
-        Begins by refreshing the pages data by destroying all widgets
+        Displays the gross and net revenues for every band that sold today
 
-        A request is made to the backend to calculate totals
+        A request is made to the backend to read the running totals
 
         The returned data is then formatted and displayed on this frame
 
         User has option to return to homepage by selecting home button
         """
-        for widget in self.winfo_children():
-            widget.destroy()
-        total, net, band = self.db.retrieve_total_payments()
-        title = tk.Label(self, text=f"Payment Owed To: {band}")
+        self.controller.worker.submit("retrieve_band_totals", callback=self.showTotals)
+        self.controller.worker.submit(self.analyse, callback=self.showBreakdowns)
+
+
+    def analyse(self, db):
+        """
+        Runs on the worker thread, and returns the hour, product and band breakdowns of todays sales
+
+        The snapshot is loaded once, and after that only the sales recorded since the last refresh are read.
+        It is loaded again when the UTC day changes.
+        """
+        today = date.fromisoformat(day_bounds()[0])
+        if self.snapshot is None or self.snapshot.start != today:
+            self.snapshot = salesSnapshot(db, today)
+        else:
+            self.snapshot.refresh()
+        return self.snapshot.by_hour(), self.snapshot.by_product(), self.snapshot.by_band()
+
+
+    def refresh(self):
+        """Requests the totals again after the sales or stockItems tables change"""
+        self.calculator()
+
+
+    def showTotals(self, totals):
+        """
+        Displays the totals returned by the background worker
+
+            Parameters:
+                totals (list): The band, gross total, net total and units for each band
+        """
+        self.table.update_rows([(band, f"£{gross:.2f}", f"£{net:.2f}", units) for band, gross, net, units in totals])
+
+
+    def showBreakdowns(self, breakdowns):
+        """
+        Displays the breakdowns returned by the background worker
+
+            Parameters:
+                breakdowns (tuple): The by_hour, by_product and by_band results of the snapshot
+        """
+        hours, products, bands = breakdowns
+        self.hours.update_rows([(f"{hour:%H:00}", units, f"£{gross:.2f}") for hour, units, gross in hours])
+        self.products.update_rows([(name, band, units, f"£{gross:.2f}", f"{sell_through:.0%}") for name, band, units, gross, sell_through in products])
+        self.bands.update_rows([(band, units, f"£{gross:.2f}", f"{sell_through:.0%}") for band, units, gross, sell_through in bands])
+
+
+
+class diagnostics(tk.Frame):
+    """
+    This class displays the query instrumentation for the background worker's database
+
+    Instrumentation is off until the user enables it, so it adds no overhead during normal trading
+
+    Attributes:
+        controller: Handles requests and manages which frame should be displayed
+        stats (queryStats): The instrumentation attached to the worker's database, or None while disabled
+        methods (tableView): Displays the calls, latency percentiles, rows and commits for each method
+        slow (tableView): Displays the most recent slow calls and their statements
+
+    Methods:
+        __init__: Initializes the diagnostics class
+        toggle: Attaches or detaches the instrumentation
+        refresh: Displays the latest statistics
+        dump: Writes the latest statistics to a JSON file
+    """
+
+    def __init__(self, parent, controller):
+        """Initializes the diagnostics class"""
+        tk.Frame.__init__(self, parent)
+        self.controller = controller
+        self.stats = None
+        title = tk.Label(self, text="Diagnostics")
         home = tk.Button(self, text="Home", command=lambda: self.controller.show_frame(homePage))
-        title.grid(row=0, column=0, pady=5, columnspan=5, sticky="EW")
-        home.grid(row=7, column=1, sticky="EW")
-        total = tk.Label(self, text=f"Total: £{total}")
-        total.grid(row=5, column=0, pady=5, sticky="NSEW")
-        net = tk.Label(self, text=f"Net: £{net}")
-        net.grid(row=5, column=2, pady=5, sticky="NSEW")
-        for i in range(3):
+        self.enable = tk.Button(self, text="Enable", command=lambda: self.toggle())
+        refresh = tk.Button(self, text="Refresh", command=lambda: self.refresh())
+        dump = tk.Button(self, text="Dump to File", command=lambda: self.dump())
+        self.methods = tableView(self, ("Method", "Calls", "p50 ms", "p95 ms", "p99 ms", "Rows", "Commits"))
+        self.slow = tableView(self, ("#", "Time", "Method", "ms", "Statement", "Plan"))
+        title.grid(row=0, column=0, pady=5, columnspan=4, sticky="EW")
+        home.grid(row=1, column=0, sticky="EW")
+        self.enable.grid(row=1, column=1, sticky="EW")
+        refresh.grid(row=1, column=2, sticky="EW")
+        dump.grid(row=1, column=3, sticky="EW")
+        self.methods.grid(row=2, column=0, columnspan=4, pady=5, sticky="NSEW")
+        self.slow.grid(row=3, column=0, columnspan=4, pady=5, sticky="NSEW")
+        self.grid_rowconfigure(2, weight=1)
+        self.grid_rowconfigure(3, weight=1)
+        for i in range(4):
             self.grid_columnconfigure(i, weight=1)
 
 
+    def toggle(self):
+        """Attaches the instrumentation to the worker's database, or detaches it if already enabled"""
+        if self.stats is None:
+            self.stats = queryStats()
+            self.controller.worker.submit(self.stats.attach)
+            self.enable.config(text="Disable")
+        else:
+            self.controller.worker.submit(self.stats.detach)
+            self.enable.config(text="Enable")
+            self.refresh()
+            self.stats = None
+
+
+    def refresh(self):
+        """Displays the latest statistics"""
+        if self.stats is None:
+            return
+        snapshot = self.stats.snapshot()
+        self.methods.update_rows([(name, stats["calls"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["rows"], stats["commits"]) for name, stats in sorted(snapshot["methods"].items())])
+        rows = []
+        for call in reversed(snapshot["slow"]):
+            for statement, plan in call["statements"] or [("", [])]:
+                rows.append((len(rows) + 1, time.strftime("%H:%M:%S", time.localtime(call["time"])), call["method"], call["ms"], statement, "; ".join(plan)))
+        self.slow.update_rows(rows)
+
+
+    def dump(self):
+        """Asks the user for a file, and writes the latest statistics to it as JSON"""
+        if self.stats is None:
+            return
+        path = filedialog.asksaveasfilename(title="Dump Diagnostics", defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if path:
+            self.stats.dump(path)
+            self.controller.status.config(text=f"Diagnostics written to {path}")
+
+
+
+def main(argv=None):
+    """Starts the Shop Manager application, this is the only place the GUI is launched"""
+    parser = argparse.ArgumentParser(description="Shop Manager")
+    parser.add_argument("--db", default="StockSales.db", help="the database file to use")
+    parser.add_argument("--journal", help="record sales to this journal file first, and apply them to the database in the background")
+    parser.add_argument("--archive", help="archive closed days of sales into this directory while the application runs")
+    parser.add_argument("--backups", help="take an online snapshot into this directory every 15 minutes, and allow restoring the latest")
+    parser.add_argument("--storage", choices=("file", "memory", "checkpointed"), default="file", help="keep the database in its file, only in memory, or in memory written to the file every minute")
+    arguments = parser.parse_args(argv)
+    if arguments.journal is not None and arguments.storage == "memory":
+        parser.error("--journal needs the database on disk, use --storage file or checkpointed")
+    app = ShopManager(path=arguments.db, journal=arguments.journal, archive=arguments.archive, backups=arguments.backups, storage=arguments.storage)
+    app.mainloop()
+
 
-app = ShopManager()
-app.mainloop()
+if __name__ == "__main__":
+    main()
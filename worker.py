@@ -0,0 +1,115 @@
+import queue
+import threading
+from typing import Callable
+from database import database
+
+
+class dbWorker:
+    """
+    This class runs database requests on a background thread, so slow queries never freeze the Tk main loop.
+
+    The worker thread opens and owns its own database connections. Requests are queued and run in order,
+    and their results are handed back to the main loop by polling with after().
+
+    Attributes:
+        root: Any Tk widget, used to schedule polling on the main loop
+        path: The database file opened by the worker thread
+        requests (queue.Queue): Requests waiting to be run by the worker thread
+        results (queue.Queue): Callbacks waiting to be run on the main loop
+        pending (int): The number of requests submitted but not yet answered
+        on_busy: Called on the main loop with True when work starts, and False when the queue empties
+        on_error: Called on the main loop with any exception a request raised without its own error callback
+
+    Methods:
+        __init__: Initializes the dbWorker class and starts the worker thread
+        run: The worker threads loop, which runs each request against its own database instance
+        submit: Queues a database method, or a function taking the database, to run on the worker thread
+        post: Queues a callback to run on the main loop, used to report progress from inside a request
+        poll: Schedules itself again, then runs every callback that is ready
+        close: Stops the worker thread once the queued requests have finished
+    """
+
+    def __init__(self, root, path: str = "StockSales.db", poll_interval: int = 16, **options) -> None:
+        """
+        Initializes the dbWorker class
+
+            Parameters:
+                root: Any Tk widget, used to schedule polling on the main loop
+                path (str): The database file opened by the worker thread
+                poll_interval (int): Milliseconds between polls, 16 keeps the window at 60 fps
+                options: Extra keyword arguments passed to the worker's database instance
+        """
+        self.root = root
+        self.path = path
+        self.options = options
+        self.poll_interval = poll_interval
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending: int = 0
+        self.on_busy: Callable = None
+        self.on_error: Callable = None
+        self.thread = threading.Thread(target=self.run, name="dbWorker", daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_interval, self.poll)
+
+
+    def run(self) -> None:
+        """Opens the worker threads database, then runs requests until close is called"""
+        db = database(self.path, **self.options)
+        db.create_tables()
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            method, args, callback, error = request
+            try:
+                result = method(db, *args) if callable(method) else getattr(db, method)(*args)
+                self.results.put((callback, result, True))
+            except Exception as exception:
+                self.results.put((error or self.on_error, exception, True))
+        db.close_db()
+
+
+    def submit(self, method, *args, callback: Callable = None, error: Callable = None) -> None:
+        """
+        Queues a request for the worker thread
+
+            Parameters:
+                method: The name of a database method, or a function that takes the database as its first argument
+                args: Arguments passed to the method
+                callback: Called on the main loop with the methods return value
+                error: Called on the main loop with the exception, if the method raises one
+        """
+        self.pending += 1
+        if self.pending == 1 and self.on_busy is not None:
+            self.on_busy(True)
+        self.requests.put((method, args, callback, error))
+
+
+    def post(self, callback: Callable, *args) -> None:
+        """Queues a callback to run on the main loop, without completing a request, so it is safe to call from the worker thread"""
+        self.results.put((callback, args, False))
+
+
+    def poll(self) -> None:
+        """Schedules the next poll, then runs every callback that is ready on the main loop"""
+        self.root.after(self.poll_interval, self.poll)
+        while True:
+            try:
+                callback, result, completes = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if completes:
+                self.pending -= 1
+                if callback is not None:
+                    callback(result)
+                if self.pending == 0 and self.on_busy is not None:
+                    self.on_busy(False)
+            elif callback is not None:
+                callback(*result)
+
+
+    def close(self) -> None:
+        """Stops the worker thread after every queued request has run"""
+        self.requests.put(None)
+        self.thread.join()